@@ -13,6 +13,12 @@ from .models import (
     ReservationSlot,
     StatusHistory,
     AdminAudit,
+    DirtySlotDate,
+    SlotHorizon,
+    ProfessionalDayLoad,
+    SlotHold,
+    IdempotencyKey,
+    DataVersion,
 )
 
 
@@ -71,3 +77,24 @@ admin.site.register(ReservationService)
 admin.site.register(ReservationSlot)
 admin.site.register(StatusHistory)
 admin.site.register(AdminAudit)
+admin.site.register(DirtySlotDate)
+admin.site.register(SlotHorizon)
+admin.site.register(ProfessionalDayLoad)
+
+
+@admin.register(SlotHold)
+class SlotHoldAdmin(admin.ModelAdmin):
+    list_display = ("token", "professional", "start", "end", "expires_at")
+    list_filter = ("professional",)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ("key", "scope", "client", "response_status", "created_at")
+    search_fields = ("key", "client")
+
+
+@admin.register(DataVersion)
+class DataVersionAdmin(admin.ModelAdmin):
+    list_display = ("name", "version", "updated_at")
+    search_fields = ("name",)
@@ -7,3 +7,4 @@ class AgendaConfig(AppConfig):
 
     def ready(self):
         import apps.agenda.signals
+        import apps.agenda.checks
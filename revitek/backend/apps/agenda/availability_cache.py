@@ -0,0 +1,385 @@
+"""
+Caché versionada de disponibilidad agregada.
+
+Cada resultado se guarda bajo (servicios ordenados, fecha) —o (servicios,
+mes) para el resumen mensual— junto con las versiones de las que depende:
+- global: cambia con Professional, ProfessionalService, Service o ServiceTimeRule
+- por profesional: cambia con su WorkSchedule / Break
+- por (profesional, fecha): cambia con sus slots, bloqueos, excepciones o reservas
+
+Los ETags usan además dos agregados que no dependen de qué profesionales
+califican: "cualquier horario" y "cualquier profesional en la fecha". Así
+un ETag se resuelve con una sola consulta a DataVersion, sin leer antes la
+matriz de habilidades ni la lista de profesionales.
+
+Una lectura es válida si todas esas versiones siguen iguales (un get_many).
+Usa el framework de caché de Django (AGENDA_AVAILABILITY_CACHE_ALIAS). Las
+versiones deben verlas todos los workers: solo se activa con un backend
+compartido (ver checks.check_availability_cache).
+
+Los recálculos pasan por un single-flight: pedidos idénticos simultáneos
+esperan un único cálculo. Con AGENDA_SINGLEFLIGHT_CACHE_LOCK también se
+coordinan entre workers mediante un candado en la caché.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from core.conditional import bump_data_version, data_versions
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "agenda:availability"
+GLOBAL_VERSION_KEY = f"{PREFIX}:v:global"
+ANY_SCHEDULE_VERSION_KEY = f"{PREFIX}:v:p:*"
+
+
+def _cache():
+    return caches[getattr(settings, "AGENDA_AVAILABILITY_CACHE_ALIAS", "default")]
+
+
+def _timeout() -> int:
+    return getattr(settings, "AGENDA_AVAILABILITY_CACHE_TIMEOUT", 0)
+
+
+def _stale_seconds() -> int:
+    return getattr(settings, "AGENDA_AVAILABILITY_STALE_SECONDS", 0)
+
+
+def _flight_wait_seconds() -> float:
+    return getattr(settings, "AGENDA_SINGLEFLIGHT_WAIT_SECONDS", 10)
+
+
+def _flight_cache_lock() -> bool:
+    return getattr(settings, "AGENDA_SINGLEFLIGHT_CACHE_LOCK", False)
+
+
+# Cálculos en vuelo de este proceso (y sus contadores)
+_flights = SingleFlight()
+
+
+def flight_stats() -> dict:
+    """Contadores del proceso: hits, waits, leaders y stale."""
+    return _flights.stats()
+
+
+def professional_version_key(professional_id) -> str:
+    return f"{PREFIX}:v:p:{professional_id}"
+
+
+def day_version_key(professional_id, day) -> str:
+    return f"{PREFIX}:v:d:{professional_id}:{day.isoformat()}"
+
+
+def any_day_version_key(day) -> str:
+    return f"{PREFIX}:v:d:*:{day.isoformat()}"
+
+
+def _services_key(service_ids) -> str:
+    return ",".join(str(s) for s in sorted(set(int(s) for s in service_ids)))
+
+
+def result_key(service_ids, date_str) -> str:
+    return f"{PREFIX}:r:{_services_key(service_ids)}:{date_str}"
+
+
+def month_key(service_ids, start_date) -> str:
+    return f"{PREFIX}:m:{_services_key(service_ids)}:{start_date:%Y-%m}"
+
+
+# ----------------------------------------------------------------------
+# Versiones
+# ----------------------------------------------------------------------
+def _bump_keys(keys):
+    cache = _cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Sin contador (nuevo o expulsado): arrancar desde un valor único
+            # para que nunca coincida con un sello anterior
+            cache.set(key, time.time_ns(), None)
+
+
+def _bump_on_commit(keys, etag_keys=()):
+    """
+    Sube las versiones al confirmar: en la caché (resultados cacheados) y
+    en la BD (ETags, ver core.conditional), que ven todos los workers.
+    `etag_keys` (los agregados) solo existen en la BD.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    if _timeout():
+        transaction.on_commit(lambda: _bump_keys(keys))
+    bump_data_version(*keys, *etag_keys)
+
+
+def bump_day_versions(pairs):
+    """Invalida los resultados que dependen de pares (professional_id, fecha)."""
+    pairs = set(pairs)
+    _bump_on_commit(
+        (day_version_key(prof_id, d) for prof_id, d in pairs),
+        {any_day_version_key(d) for _, d in pairs},
+    )
+
+
+def bump_professional_versions(professional_ids):
+    """Invalida todos los días de los profesionales (cambió su horario semanal)."""
+    _bump_on_commit(
+        (professional_version_key(prof_id) for prof_id in professional_ids),
+        [ANY_SCHEDULE_VERSION_KEY],
+    )
+
+
+def bump_global_version():
+    """Invalida todo (cambió qué profesional hace qué servicio, duraciones o reglas)."""
+    _bump_on_commit([GLOBAL_VERSION_KEY])
+
+
+def _current_versions(keys):
+    """
+    Versiones actuales de `keys`; las que falten se inicializan para que
+    un resultado calculado ahora pueda sellarse con ellas.
+    """
+    cache = _cache()
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, None)
+        versions.update(cache.get_many(list(missing)))
+    return versions
+
+
+# ----------------------------------------------------------------------
+# Lectura con caché
+# ----------------------------------------------------------------------
+def _version_keys(professionals, dates) -> list:
+    keys = [GLOBAL_VERSION_KEY]
+    for prof_id in sorted(professionals):
+        keys.append(professional_version_key(prof_id))
+        keys.extend(day_version_key(prof_id, d) for d in dates)
+    return keys
+
+
+def _stamp(professionals, dates):
+    """
+    Versiones de las que depende un resultado sobre `professionals` y
+    `dates`. Se leen ANTES de cargar slots: si algo cambia durante el
+    cálculo, el sello queda viejo y la próxima lectura lo descarta.
+    """
+    return _current_versions(_version_keys(professionals, dates))
+
+
+def _qualified(service_ids):
+    from . import skills
+
+    return skills.qualified_durations(service_ids).keys() if service_ids else ()
+
+
+def version_stamp(service_ids, dates):
+    """Versiones vigentes (en la caché) de la disponibilidad de service_ids en `dates`."""
+    return _stamp(_qualified(service_ids), dates)
+
+
+def etag_stamp(dates, professional_id=None):
+    """
+    Versiones de la BD (una consulta) para ETags, que deben coincidir en
+    todos los workers aunque la caché no sea compartida. Sin
+    `professional_id` usa los agregados: cubren a cualquier profesional
+    calificado sin tener que resolverlos antes.
+    """
+    if professional_id is None:
+        keys = [GLOBAL_VERSION_KEY, ANY_SCHEDULE_VERSION_KEY]
+        keys.extend(any_day_version_key(d) for d in dates)
+    else:
+        keys = _version_keys([professional_id], dates)
+    return data_versions(keys)
+
+
+def _compute_entry(calculator):
+    """Calcula y sella la disponibilidad de un día."""
+    if not calculator.service_ids or not calculator._find_qualified_professionals():
+        professionals = set()
+    else:
+        professionals = calculator.qualified_professionals
+
+    stamp = _stamp(professionals, [calculator.date])
+    result = calculator.compute_for_qualified() if professionals else []
+    return {"result": result, "stamp": stamp, "computed_at": time.time()}
+
+
+def _is_current(entry) -> bool:
+    stamp = entry["stamp"]
+    return _cache().get_many(list(stamp)) == stamp
+
+
+def _revalidate_in_background(key, compute_entry):
+    """
+    Recalcula en un thread aparte. Un candado en la caché evita que varias
+    lecturas concurrentes recalculen lo mismo.
+    """
+    lock_key = f"{key}:lock"
+    cache = _cache()
+    if not cache.add(lock_key, 1, 30):
+        return
+
+    def revalidate():
+        try:
+            cache.set(key, compute_entry(), _timeout())
+        except Exception:
+            logger.exception("Error revalidando disponibilidad %s", key)
+        finally:
+            cache.delete(lock_key)
+            connection.close()
+
+    threading.Thread(target=revalidate, daemon=True).start()
+
+
+def _compute_and_store(key, compute_entry):
+    entry = compute_entry()
+    _flights.count("leaders")
+    _cache().set(key, entry, _timeout())
+    return entry
+
+
+def _compute_across_workers(key, compute_entry):
+    """
+    Líder local con AGENDA_SINGLEFLIGHT_CACHE_LOCK: si otro worker ya está
+    calculando la misma clave, espera a que deje un resultado vigente en la
+    caché; si no llega a tiempo (o el candado se libera sin resultado),
+    calcula igual.
+    """
+    cache = _cache()
+    lock_key = f"{key}:flight"
+    wait = _flight_wait_seconds()
+    if cache.add(lock_key, 1, int(wait) + 1):
+        try:
+            return _compute_and_store(key, compute_entry)
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and _is_current(entry):
+            _flights.count("waits")
+            return entry
+        if cache.get(lock_key) is None:
+            break
+    return _compute_and_store(key, compute_entry)
+
+
+def _get_or_compute(key, compute_entry):
+    """
+    Devuelve el resultado guardado en `key` si sus versiones siguen
+    vigentes; si no, lo recalcula con compute_entry() y lo guarda. Pedidos
+    simultáneos de la misma clave comparten un único recálculo.
+
+    Con AGENDA_AVAILABILITY_STALE_SECONDS > 0, un resultado invalidado que
+    fue calculado hace menos de ese tiempo se sirve igual y se recalcula en
+    segundo plano (stale-while-revalidate).
+    """
+    entry = _cache().get(key)
+    if entry is not None:
+        if _is_current(entry):
+            _flights.count("hits")
+            return entry["result"]
+        if time.time() - entry["computed_at"] <= _stale_seconds():
+            _flights.count("stale")
+            _revalidate_in_background(key, compute_entry)
+            return entry["result"]
+
+    if _flight_cache_lock():
+        compute = lambda: _compute_across_workers(key, compute_entry)
+    else:
+        compute = lambda: _compute_and_store(key, compute_entry)
+    return _flights.do(key, compute, wait_timeout=_flight_wait_seconds())["result"]
+
+
+def get_cached_availability(service_ids, date_str, calculator_factory):
+    """
+    Disponibilidad de (service_ids, date_str) desde la caché, o calculada
+    con calculator_factory() si alguna de sus versiones cambió.
+    """
+    if not _timeout():
+        # Sin caché igual se comparten los cálculos simultáneos
+        def compute():
+            result = calculator_factory().compute()
+            _flights.count("leaders")
+            return result
+
+        return _flights.do(result_key(service_ids, date_str), compute, wait_timeout=_flight_wait_seconds())
+
+    return _get_or_compute(
+        result_key(service_ids, date_str),
+        lambda: _compute_entry(calculator_factory()),
+    )
+
+
+def get_cached_availability_batch(queries, compute_batch):
+    """
+    Disponibilidad de varias consultas [(service_ids, "YYYY-MM-DD")] en el
+    mismo orden. Resultados y versiones se leen con un get_many cada uno;
+    las consultas sin resultado vigente se calculan juntas con
+    compute_batch(pendientes) y se guardan.
+    """
+    if not _timeout():
+        return compute_batch(queries)
+
+    cache = _cache()
+    keys = [result_key(service_ids, date_str) for service_ids, date_str in queries]
+    entries = cache.get_many(set(keys))
+    versions = cache.get_many({k for entry in entries.values() for k in entry["stamp"]})
+
+    results = {}
+    for key, entry in entries.items():
+        if all(versions.get(k) == v for k, v in entry["stamp"].items()):
+            results[key] = entry["result"]
+    _flights.count("hits", sum(1 for key in keys if key in results))
+
+    # Una vez por clave aunque se repita en el lote
+    missing = {}
+    for key, query in zip(keys, queries):
+        if key not in results:
+            missing.setdefault(key, query)
+    if missing:
+        stamps = {
+            key: version_stamp(service_ids, [datetime.strptime(date_str, "%Y-%m-%d").date()])
+            for key, (service_ids, date_str) in missing.items()
+        }
+        computed = dict(zip(missing, compute_batch(list(missing.values()))))
+        _flights.count("leaders", len(computed))
+        now = time.time()
+        cache.set_many(
+            {key: {"result": computed[key], "stamp": stamps[key], "computed_at": now} for key in computed},
+            _timeout(),
+        )
+        results.update(computed)
+
+    return [results[key] for key in keys]
+
+
+def get_cached_month(service_ids, start_date, end_date, compute):
+    """
+    Resumen mensual de (service_ids, mes de start_date) desde la caché, o
+    calculado con compute() si cambió alguna versión de un profesional
+    calificado en cualquiera de los días entre start_date y end_date.
+    """
+    if not _timeout():
+        return compute()
+
+    def compute_entry():
+        dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        stamp = version_stamp(service_ids, dates)
+        return {"result": compute(), "stamp": stamp, "computed_at": time.time()}
+
+    return _get_or_compute(month_key(service_ids, start_date), compute_entry)
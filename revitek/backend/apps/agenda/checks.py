@@ -0,0 +1,61 @@
+"""
+Checks de sistema de la agenda.
+
+Las versiones que invalidan la disponibilidad cacheada y los índices en
+memoria (matriz de habilidades, reglas horarias) viven en la caché de
+Django. Con un backend local al proceso (LocMemCache) cada worker de
+gunicorn tiene su propia copia: un cambio sube la versión solo en el
+worker que lo atendió y los demás siguen sirviendo datos viejos. Por eso
+estas funciones solo se pueden activar con un backend compartido (Redis,
+Memcached, base de datos...).
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends cuyo contenido no ve ningún otro proceso
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def is_shared_cache(alias: str) -> bool:
+    """True si el alias de CACHES existe y sus datos los ven todos los procesos."""
+    config = settings.CACHES.get(alias)
+    return bool(config) and config.get("BACKEND") not in PROCESS_LOCAL_CACHE_BACKENDS
+
+
+@register(Tags.caches)
+def check_availability_cache(app_configs, **kwargs):
+    alias = getattr(settings, "AGENDA_AVAILABILITY_CACHE_ALIAS", "default")
+    if getattr(settings, "AGENDA_AVAILABILITY_CACHE_TIMEOUT", 0) <= 0 or is_shared_cache(alias):
+        return []
+    return [
+        Error(
+            f"AGENDA_AVAILABILITY_CACHE_TIMEOUT is enabled but the cache alias '{alias}' "
+            "is not shared between processes.",
+            hint=(
+                "Point AGENDA_AVAILABILITY_CACHE_ALIAS at a shared backend (Redis, Memcached, "
+                "database) or set AGENDA_AVAILABILITY_CACHE_TIMEOUT=0."
+            ),
+            id="agenda.E001",
+        )
+    ]
+
+
+@register(Tags.caches)
+def check_process_indexes(app_configs, **kwargs):
+    alias = getattr(settings, "AGENDA_PROCESS_INDEX_CACHE_ALIAS", "default")
+    if getattr(settings, "AGENDA_PROCESS_INDEX_TTL_SECONDS", 0) <= 0 or is_shared_cache(alias):
+        return []
+    return [
+        Error(
+            f"AGENDA_PROCESS_INDEX_TTL_SECONDS is enabled but the cache alias '{alias}' "
+            "is not shared between processes.",
+            hint=(
+                "Point AGENDA_PROCESS_INDEX_CACHE_ALIAS at a shared backend (Redis, Memcached, "
+                "database) or set AGENDA_PROCESS_INDEX_TTL_SECONDS=0."
+            ),
+            id="agenda.E002",
+        )
+    ]
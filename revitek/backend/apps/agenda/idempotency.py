@@ -0,0 +1,174 @@
+"""
+POST idempotentes con la cabecera Idempotency-Key.
+
+El primer pedido con una clave la registra (IdempotencyKey, única por
+método + ruta + cliente) y se ejecuta; su respuesta 2xx se guarda en la misma
+transacción que la operación. Las validaciones previas (`prepare`: reCAPTCHA,
+que llama a Google, reglas y serializer) corren antes y fuera de esa
+transacción, para no tener filas bloqueadas durante una llamada HTTP. Un reintento con la misma clave y el mismo
+cuerpo recibe esa respuesta sin repetir reCAPTCHA, reglas, slots ni
+notificaciones. Si el primero sigue en curso, el duplicado espera (hasta
+AGENDA_IDEMPOTENCY_WAIT_SECONDS) en vez de competir con él.
+
+Las respuestas de error no se guardan: la clave se libera y el cliente
+puede reintentar (ej. con un reCAPTCHA nuevo).
+
+El cliente es el usuario autenticado o, en pedidos anónimos, el email (o
+teléfono) del cuerpo: la misma clave enviada por otro cliente no recibe la
+respuesta guardada de nadie más.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from apps.clients.utils import phone_key
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# Campos que cambian entre reintentos sin cambiar el pedido
+IGNORED_FIELDS = ("recaptcha_token",)
+
+# Un registro en curso más antiguo que esto quedó huérfano (worker caído)
+ABANDONED_AFTER = timedelta(minutes=5)
+
+
+def idempotency_ttl() -> timedelta:
+    return timedelta(hours=getattr(settings, "AGENDA_IDEMPOTENCY_TTL_HOURS", 24))
+
+
+def _wait_seconds() -> float:
+    return getattr(settings, "AGENDA_IDEMPOTENCY_WAIT_SECONDS", 10)
+
+
+def request_fingerprint(request) -> str:
+    """sha256 del método, la ruta y el cuerpo (sin IGNORED_FIELDS)."""
+    data = request.data
+    data = data.dict() if hasattr(data, "dict") else dict(data)
+    payload = {field: value for field, value in data.items() if field not in IGNORED_FIELDS}
+    raw = json.dumps([request.method, request.path, payload], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def request_client(request) -> str:
+    """
+    Identidad de quien envía el pedido: "user:<id>" si está autenticado;
+    si no, el email o el teléfono (phone_key) de `client` en el cuerpo.
+    Vacía si el pedido no trae ninguno.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    client = request.data.get("client") if hasattr(request.data, "get") else None
+    if not isinstance(client, dict):
+        return ""
+    email = str(client.get("email") or "").strip().lower()
+    if email:
+        return f"email:{email}"[:255]
+    phone = phone_key(client.get("phone"))
+    return f"phone:{phone}" if phone else ""
+
+
+def _claim(ident, fingerprint) -> bool:
+    """True si este pedido registró la clave (es el primero)."""
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(fingerprint=fingerprint, **ident)
+        return True
+    except IntegrityError:
+        return False
+
+
+def _run_and_store(ident, handler, prepare=None):
+    try:
+        error = prepare() if prepare else None
+        if error is not None:
+            IdempotencyKey.objects.filter(**ident).delete()
+            return error
+        with transaction.atomic():
+            response = handler()
+            if status.is_success(response.status_code):
+                IdempotencyKey.objects.filter(**ident).update(
+                    response_status=response.status_code,
+                    response_body=response.data,
+                )
+                return response
+    except Exception:
+        IdempotencyKey.objects.filter(**ident).delete()
+        raise
+
+    IdempotencyKey.objects.filter(**ident).delete()
+    return response
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response[REPLAY_HEADER] = "true"
+    return response
+
+
+def idempotent_response(request, handler, prepare=None):
+    """
+    Ejecuta handler() (que devuelve un Response) una sola vez por
+    Idempotency-Key. Sin cabecera se ejecuta siempre.
+
+    `prepare()` corre antes, fuera de la transacción del handler: devuelve
+    un Response de error (se responde tal cual y la clave se libera) o None
+    para seguir. Los reintentos que reciben la respuesta guardada no lo
+    vuelven a ejecutar.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        error = prepare() if prepare else None
+        return error if error is not None else handler()
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {"detail": f"{IDEMPOTENCY_HEADER} cannot exceed {MAX_KEY_LENGTH} characters."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    ident = {"key": key, "scope": f"{request.method} {request.path}", "client": request_client(request)}
+    fingerprint = request_fingerprint(request)
+    deadline = time.monotonic() + _wait_seconds()
+    while True:
+        if _claim(ident, fingerprint):
+            return _run_and_store(ident, handler, prepare)
+
+        record = IdempotencyKey.objects.filter(**ident).first()
+        if record is None:
+            continue  # El primero falló y liberó la clave: reintentar el registro
+
+        age = timezone.now() - record.created_at
+        if age > idempotency_ttl() or (record.response_status is None and age > ABANDONED_AFTER):
+            IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+            continue
+
+        if record.fingerprint != fingerprint:
+            return Response(
+                {"detail": f"{IDEMPOTENCY_HEADER} was already used with a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if record.response_status is not None:
+            return _replay(record)
+        if time.monotonic() >= deadline:
+            return Response(
+                {"detail": f"A request with this {IDEMPOTENCY_HEADER} is still in progress."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        time.sleep(0.05)
+
+
+def purge_expired_keys() -> int:
+    """Borra las claves más antiguas que AGENDA_IDEMPOTENCY_TTL_HOURS."""
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - idempotency_ttl()).delete()
+    return deleted
@@ -0,0 +1,79 @@
+"""
+Índices en memoria del proceso con invalidación compartida.
+
+Cada índice se arma con `builder()` y se guarda en el proceso a lo sumo
+AGENDA_PROCESS_INDEX_TTL_SECONDS. Invalidarlo sube una versión en la caché
+AGENDA_PROCESS_INDEX_CACHE_ALIAS, así los demás procesos lo reconstruyen en
+su próxima lectura (un cache.get por lectura). Eso solo funciona si la caché
+es compartida entre workers: el check agenda.E002 impide activar los índices
+sobre una caché local al proceso.
+
+Con TTL 0 (default) los índices están apagados: cada lectura llama a
+`builder(**filtros)` con los filtros recibidos, para que la consulta lea
+solo lo pedido (ej. los servicios de la consulta) y no la tabla entera.
+Con el índice activo se guarda la versión completa y los filtros se ignoran.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def index_ttl() -> int:
+    return getattr(settings, "AGENDA_PROCESS_INDEX_TTL_SECONDS", 0)
+
+
+def _cache():
+    return caches[getattr(settings, "AGENDA_PROCESS_INDEX_CACHE_ALIAS", "default")]
+
+
+class ProcessIndex:
+    def __init__(self, version_key, builder):
+        self.version_key = version_key
+        self.builder = builder
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._built_at = 0.0
+
+    def _shared_version(self):
+        cache = _cache()
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def _is_fresh(self, version, ttl) -> bool:
+        return (
+            self._data is not None
+            and self._version == version
+            and time.monotonic() - self._built_at < ttl
+        )
+
+    def get(self, **filters):
+        ttl = index_ttl()
+        if ttl <= 0:
+            return self.builder(**filters)
+
+        version = self._shared_version()
+        if self._is_fresh(version, ttl):
+            return self._data
+        with self._lock:
+            if not self._is_fresh(version, ttl):
+                self._data = self.builder()
+                self._version = version
+                self._built_at = time.monotonic()
+        return self._data
+
+    def invalidate(self):
+        """Descarta el índice local y avisa a los demás procesos."""
+        self._data = None
+        if index_ttl() <= 0:
+            return
+        cache = _cache()
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), None)
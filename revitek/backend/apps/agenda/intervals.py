@@ -0,0 +1,89 @@
+"""
+Utilidades de intervalos de tiempo para la agenda.
+
+Todos los intervalos son tuplas (inicio, fin) semiabiertas [inicio, fin).
+Funcionan con cualquier tipo comparable (datetime aware, minutos enteros, etc.).
+"""
+from datetime import timedelta
+
+
+def merge_intervals(intervals):
+    """
+    Ordena y fusiona intervalos superpuestos o contiguos.
+    Descarta intervalos invertidos (fin < inicio).
+    """
+    merged = []
+    for start, end in sorted(i for i in intervals if i[0] <= i[1]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def subtract_intervals(window_start, window_end, busy):
+    """
+    Resta los intervalos ocupados de la ventana [window_start, window_end)
+    en un solo barrido lineal. Devuelve los tramos libres ordenados.
+    """
+    free = []
+    cursor = window_start
+    for b_start, b_end in merge_intervals(busy):
+        if b_end <= cursor:
+            continue
+        if b_start >= window_end:
+            break
+        if b_start > cursor:
+            free.append((cursor, b_start))
+        cursor = max(cursor, b_end)
+    if cursor < window_end:
+        free.append((cursor, window_end))
+    return free
+
+
+def free_grid_slots(window_start, window_end, busy, slot_min: int = 60):
+    """
+    Genera los slots de `slot_min` minutos alineados al inicio de la ventana
+    que no se superponen con ningún intervalo ocupado.
+
+    Equivale a generar todos los slots crudos y descartar los que chocan con
+    algún ocupado, pero en O(slots + ocupados): los ocupados se fusionan una
+    vez y se recorren con un puntero a medida que avanza la grilla.
+    """
+    step = timedelta(minutes=slot_min)
+    busy = merge_intervals(busy)
+    slots = []
+    i = 0
+    current = window_start
+
+    while current + step <= window_end:
+        end = current + step
+        # Avanzar el puntero hasta el primer ocupado que termina después del slot
+        while i < len(busy) and busy[i][1] <= current:
+            i += 1
+        if i < len(busy) and busy[i][0] < end:
+            current = end
+            continue
+        slots.append((current, end))
+        current = end
+
+    return slots
+
+
+def run_ends(intervals):
+    """
+    Tabla de rachas en una sola pasada (de atrás hacia adelante) sobre
+    intervalos ordenados por inicio: ends[i] es el instante más lejano que
+    se alcanza desde intervals[i] encadenando intervalos sin huecos (el
+    siguiente empieza en o antes del fin del actual). El tiempo continuo
+    desde ese inicio es ends[i] - intervals[i][0], para cualquier duración.
+    Usa los bordes reales de los intervalos, no una grilla fija.
+    """
+    ends = [None] * len(intervals)
+    for i in range(len(intervals) - 1, -1, -1):
+        end = intervals[i][1]
+        if i + 1 < len(intervals) and intervals[i + 1][0] <= end:
+            end = max(end, ends[i + 1])
+        ends[i] = end
+    return ends
@@ -0,0 +1,104 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.agenda.intervals import free_grid_slots, run_ends
+from apps.agenda.models import Slot
+
+
+def _check_continuity_naive(slots, start_index, required_duration):
+    """
+    Chequeo original de AvailabilityCalculator: recorre hacia adelante desde
+    cada inicio candidato. Se mantiene como referencia para comparar resultados.
+    """
+    start_slot = slots[start_index]
+    required_end_time = start_slot.start + timedelta(minutes=required_duration)
+    current_check_start = start_slot.start
+
+    for subsequent_slot in slots[start_index:]:
+        if subsequent_slot.start > current_check_start:
+            return False
+        current_check_start = subsequent_slot.end
+        if current_check_start >= required_end_time:
+            return True
+
+    return False
+
+
+def _check_continuity_run_table(slots, durations):
+    """Inicios válidos (inicio, duración) según la tabla de rachas del calculador."""
+    ends = run_ends([(slot.start, slot.end) for slot in slots])
+    return [
+        (slot.start, required)
+        for required in durations
+        for slot, end in zip(slots, ends)
+        if end >= slot.start + timedelta(minutes=required)
+    ]
+
+
+def _random_day(rng, day_start, granularity, busy_count):
+    """Slots libres de una jornada de 9 horas desde `day_start` con ocupados aleatorios."""
+    day_end = day_start + timedelta(hours=9)
+    busy = []
+    for _ in range(busy_count):
+        offset = rng.randrange(0, 9 * 60) // granularity * granularity
+        length = rng.randrange(1, 12) * granularity
+        b_start = day_start + timedelta(minutes=offset)
+        busy.append((b_start, b_start + timedelta(minutes=length)))
+    return [
+        Slot(start=start, end=end, status="AVAILABLE")
+        for start, end in free_grid_slots(day_start, day_end, busy, granularity)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Mide el chequeo de continuidad por tabla de rachas contra el recorrido original'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--granularity', type=int, default=5, help='Minutos por slot (default: 5)')
+        parser.add_argument('--professionals', type=int, default=50, help='Profesionales simulados (default: 50)')
+        parser.add_argument('--busy', type=int, default=15, help='Ocupados por profesional (default: 15)')
+        parser.add_argument('--rounds', type=int, default=5, help='Repeticiones para medir (default: 5)')
+        parser.add_argument('--seed', type=int, default=0, help='Semilla aleatoria (default: 0)')
+
+    def handle(self, *args, **options):
+        granularity = options['granularity']
+        rng = random.Random(options['seed'])
+        day_start = timezone.make_aware(datetime(2025, 1, 6, 9, 0))
+        durations = [30, 60, 90, 120, 180, 240]
+
+        days = [
+            _random_day(rng, day_start, granularity, rng.randrange(0, options['busy'] + 1))
+            for _ in range(options['professionals'])
+        ]
+
+        def naive():
+            return [
+                (slot.start, required)
+                for slots in days
+                for required in durations
+                for i, slot in enumerate(slots)
+                if _check_continuity_naive(slots, i, required)
+            ]
+
+        def run_table():
+            return [item for slots in days for item in _check_continuity_run_table(slots, durations)]
+
+        rounds = options['rounds']
+        started = time.perf_counter()
+        for _ in range(rounds):
+            naive()
+        naive_elapsed = (time.perf_counter() - started) / rounds
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            run_table()
+        table_elapsed = (time.perf_counter() - started) / rounds
+
+        self.stdout.write(
+            f'Slots de {granularity} min, {options["professionals"]} profesionales:\n'
+            f'  original:          {naive_elapsed * 1000:.1f} ms\n'
+            f'  tabla de rachas:   {table_elapsed * 1000:.1f} ms ({naive_elapsed / table_elapsed:.1f}x)'
+        )
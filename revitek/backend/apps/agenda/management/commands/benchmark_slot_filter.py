@@ -0,0 +1,79 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.agenda.intervals import free_grid_slots
+from apps.agenda.services import generate_raw_slots
+
+
+def _filter_slots_naive(start_dt, end_dt, busy_intervals, slot_min):
+    """
+    Filtro original de generate_daily_slots: cada slot contra cada ocupado.
+    Se mantiene como referencia (ver IntervalsTests en apps/agenda/tests.py).
+    """
+    filtered = []
+    for start, end in generate_raw_slots(start_dt, end_dt, slot_min):
+        is_blocked = False
+        for b_start, b_end in busy_intervals:
+            if start < b_end and end > b_start:
+                is_blocked = True
+                break
+        if not is_blocked:
+            filtered.append((start, end))
+    return filtered
+
+
+def _random_busy(rng, start_dt, total_min, count, granularity):
+    busy = []
+    for _ in range(count):
+        offset = rng.randrange(-60, total_min + 60)
+        length = rng.randrange(0, 180)
+        if rng.random() < 0.5:
+            # Alinear a la grilla para ejercitar bordes que solo se tocan
+            offset -= offset % granularity
+            length -= length % granularity
+        b_start = start_dt + timedelta(minutes=offset)
+        busy.append((b_start, b_start + timedelta(minutes=length)))
+    return busy
+
+
+class Command(BaseCommand):
+    help = 'Mide el filtro de slots por barrido (intervals) contra el filtro original'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--granularity', type=int, default=5, help='Minutos por slot (default: 5)')
+        parser.add_argument('--busy', type=int, default=40, help='Intervalos ocupados por día (default: 40)')
+        parser.add_argument('--days', type=int, default=500, help='Días simulados (default: 500)')
+        parser.add_argument('--seed', type=int, default=0, help='Semilla aleatoria (default: 0)')
+
+    def handle(self, *args, **options):
+        granularity = options['granularity']
+        rng = random.Random(options['seed'])
+
+        base = timezone.make_aware(datetime(2025, 1, 6, 8, 0))
+        total_min = 12 * 60
+        cases = []
+        for day in range(options['days']):
+            start_dt = base + timedelta(days=day)
+            end_dt = start_dt + timedelta(minutes=total_min)
+            busy = _random_busy(rng, start_dt, total_min, rng.randrange(0, options['busy'] + 1), granularity)
+            cases.append((start_dt, end_dt, busy))
+
+        started = time.perf_counter()
+        for start_dt, end_dt, busy in cases:
+            _filter_slots_naive(start_dt, end_dt, busy, granularity)
+        naive = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for start_dt, end_dt, busy in cases:
+            free_grid_slots(start_dt, end_dt, busy, granularity)
+        sweep = time.perf_counter() - started
+
+        per_day = 1000 / len(cases)
+        self.stdout.write(
+            f'Slots de {granularity} min, hasta {options["busy"]} ocupados/día:\n'
+            f'  original: {naive * per_day:.3f} ms/día\n'
+            f'  barrido:  {sweep * per_day:.3f} ms/día ({naive / sweep:.1f}x)'
+        )
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
-from apps.agenda.models import Slot
+from apps.agenda.models import Slot, DataVersion
 
 class Command(BaseCommand):
     help = 'Cleans up old slots from the database (older than 90 days)'
@@ -23,5 +23,7 @@ class Command(BaseCommand):
         # Delete old slots
         # We filter by date < cutoff_date
         count, _ = Slot.objects.filter(date__lt=cutoff_date).delete()
+        # Versiones de ETag sin cambios en el período (borrarlas solo provoca un 200)
+        DataVersion.objects.filter(updated_at__date__lt=cutoff_date).delete()
         
         self.stdout.write(self.style.SUCCESS(f"Successfully deleted {count} old slots."))
@@ -1,7 +1,75 @@
-from django.core.management.base import BaseCommand
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import date, timedelta
-from apps.agenda.models import Professional
-from apps.agenda.services import generate_slots_range
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# Sin imports de modelos a nivel de módulo: con "spawn" el worker importa este
+# módulo para resolver _init_worker antes de que django.setup() haya corrido.
+
+
+def _init_worker(settings_module):
+    """
+    Inicializa un proceso del pool: cada worker abre su propia conexión a la BD.
+    Con "spawn" el worker arranca desde cero, por eso recibe el módulo de
+    settings explícitamente (también respeta --settings).
+    """
+    os.environ["DJANGO_SETTINGS_MODULE"] = settings_module
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _pool_context():
+    """
+    "fork" donde existe (Linux): los workers heredan el proceso ya configurado.
+    En macOS/Windows solo hay "spawn" y _init_worker configura Django.
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+def _generate_for_professional(professional_id, start_date, days, chunk_days):
+    """
+    Genera los slots de un profesional en bloques de `chunk_days` días.
+    Se ejecuta dentro de un worker (o en el proceso principal con --workers 1).
+    """
+    from apps.agenda.services import materialize_slots_range
+
+    started = time.monotonic()
+    result = {
+        "professional_id": professional_id,
+        "pid": os.getpid(),
+        "total": 0,
+        "created": 0,
+        "removed": 0,
+        "chunks": 0,
+        "errors": [],
+    }
+
+    for offset in range(0, days, chunk_days):
+        chunk_start = start_date + timedelta(days=offset)
+        chunk_len = min(chunk_days, days - offset)
+        try:
+            report = materialize_slots_range(professional_id, chunk_start, chunk_len)
+        except Exception as e:
+            result["errors"].append(f"{chunk_start.isoformat()} (+{chunk_len}d): {e}")
+            continue
+
+        result["chunks"] += 1
+        for counts in report.values():
+            result["total"] += counts["total"]
+            result["created"] += counts["created"]
+            result["removed"] += counts["removed"] + counts["blocked"]
+
+    result["elapsed"] = time.monotonic() - started
+    return result
 
 
 class Command(BaseCommand):
@@ -24,11 +92,30 @@ class Command(BaseCommand):
             action='store_true',
             help='Generar para todos los profesionales activos'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Número de procesos en paralelo (default: 1, sin pool)'
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=None,
+            help='Días por transacción dentro de cada profesional (default: todos los días de una vez)'
+        )
 
     def handle(self, *args, **options):
+        from apps.agenda.models import Professional
+
         days = options['days']
         professional_id = options.get('professional')
         generate_all = options.get('all')
+        workers = max(1, options['workers'])
+        chunk_days = options['chunk_days'] or days
+
+        if days <= 0 or chunk_days <= 0:
+            raise CommandError('--days y --chunk-days deben ser mayores a 0')
 
         today = date.today()
 
@@ -44,45 +131,115 @@ class Command(BaseCommand):
                 )
                 return
         elif generate_all:
-            professionals = Professional.objects.filter(active=True, accepts_reservations=True)
+            professionals = list(Professional.objects.filter(active=True, accepts_reservations=True))
             if not professionals:
                 self.stdout.write(self.style.WARNING('⚠️  No hay profesionales activos'))
                 return
-            self.stdout.write(f'Generando slots para {professionals.count()} profesionales...\n')
+            self.stdout.write(
+                f'Generando slots para {len(professionals)} profesionales '
+                f'({workers} worker(s), bloques de {chunk_days} días)...\n'
+            )
         else:
             self.stdout.write(
                 self.style.ERROR('❌ Debes especificar --professional ID o --all')
             )
             return
 
-        total_slots = 0
+        names = {prof.id: f'{prof.first_name} {prof.last_name}'.strip() for prof in professionals}
+        started = time.monotonic()
+        results = []
 
-        for prof in professionals:
-            self.stdout.write(f'  📅 {prof.first_name} {prof.last_name}:')
+        self.parallel = workers > 1 and len(professionals) > 1
+        if not self.parallel:
+            for prof in professionals:
+                result = _generate_for_professional(prof.id, today, days, chunk_days)
+                self._report_professional(names[prof.id], result)
+                results.append(result)
+        else:
+            # Los procesos hijos no deben heredar conexiones abiertas del padre
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=_pool_context(),
+                initializer=_init_worker,
+                initargs=(settings.SETTINGS_MODULE,),
+            ) as pool:
+                futures = {
+                    pool.submit(_generate_for_professional, prof.id, today, days, chunk_days): prof.id
+                    for prof in professionals
+                }
+                for future in as_completed(futures):
+                    prof_id = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # El worker murió (ej. error de conexión al iniciar)
+                        result = {
+                            "professional_id": prof_id,
+                            "pid": None,
+                            "total": 0,
+                            "created": 0,
+                            "removed": 0,
+                            "chunks": 0,
+                            "errors": [str(e)],
+                            "elapsed": 0.0,
+                        }
+                    self._report_professional(names[prof_id], result)
+                    results.append(result)
 
-            try:
-                slots = generate_slots_range(
-                    professional_id=prof.id,
-                    start_date=today,
-                    days=days
+        elapsed = time.monotonic() - started
+        self._report_summary(results, days, elapsed)
+
+        failed = [r for r in results if r["errors"]]
+        if failed:
+            raise CommandError(f'{len(failed)} profesional(es) con errores al generar slots')
+
+    def _report_professional(self, name, result):
+        worker = f'[pid {result["pid"]}] ' if self.parallel and result["pid"] else ''
+        self.stdout.write(f'  📅 {worker}{name}:')
+
+        if result["total"] > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'     ✓ {result["total"]} slots '
+                    f'({result["created"]} nuevos, {result["removed"]} retirados) '
+                    f'en {result["elapsed"]:.2f}s'
                 )
+            )
+        elif not result["errors"]:
+            self.stdout.write(
+                self.style.WARNING(f'     ⚠️  0 slots (verificar WorkSchedule)')
+            )
+
+        for error in result["errors"]:
+            self.stdout.write(self.style.ERROR(f'     ❌ Error: {error}'))
 
-                count = len(slots)
-                total_slots += count
-
-                if count > 0:
-                    self.stdout.write(
-                        self.style.SUCCESS(f'     ✓ {count} slots generados')
-                    )
-                else:
-                    self.stdout.write(
-                        self.style.WARNING(f'     ⚠️  0 slots (verificar WorkSchedule)')
-                    )
-            except Exception as e:
+    def _report_summary(self, results, days, elapsed):
+        total_slots = sum(r["total"] for r in results)
+        total_created = sum(r["created"] for r in results)
+
+        if self.parallel:
+            by_worker = defaultdict(lambda: {"professionals": 0, "slots": 0, "elapsed": 0.0})
+            for r in results:
+                if r["pid"] is None:
+                    continue
+                stats = by_worker[r["pid"]]
+                stats["professionals"] += 1
+                stats["slots"] += r["total"]
+                stats["elapsed"] += r["elapsed"]
+
+            self.stdout.write('\nResumen por worker:')
+            for pid, stats in sorted(by_worker.items()):
                 self.stdout.write(
-                    self.style.ERROR(f'     ❌ Error: {str(e)}')
+                    f'  [pid {pid}] {stats["professionals"]} profesionales, '
+                    f'{stats["slots"]} slots, {stats["elapsed"]:.2f}s'
                 )
 
+        rate = total_slots / elapsed if elapsed > 0 else 0.0
         self.stdout.write(
-            self.style.SUCCESS(f'\n✅ Total: {total_slots} slots generados para los próximos {days} días')
-        )
\ No newline at end of file
+            self.style.SUCCESS(
+                f'\n✅ Total: {total_slots} slots generados para los próximos {days} días '
+                f'({total_created} nuevos)'
+            )
+        )
+        self.stdout.write(f'⏱  Tiempo total: {elapsed:.2f}s ({rate:.0f} slots/s)')
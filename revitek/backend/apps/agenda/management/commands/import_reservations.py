@@ -0,0 +1,91 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.agenda.services import import_reservations
+
+# Columnas del CSV -> campos anidados de la fila
+CLIENT_COLUMNS = ('email', 'first_name', 'last_name', 'phone')
+VEHICLE_COLUMNS = ('license_plate', 'brand', 'model', 'year')
+
+
+def _csv_rows(path):
+    """
+    Una fila por línea con columnas: email, first_name, last_name, phone,
+    license_plate, brand, model, year, services (ids separados por ';'),
+    date (YYYY-MM-DD), start (HH:MM, opcional), professional_id (opcional), note.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for line in csv.DictReader(f):
+            line = {key.strip(): (value or '').strip() for key, value in line.items() if key}
+            row = {
+                'services': [s for s in line.get('services', '').split(';') if s.strip()],
+                'date': line.get('date'),
+                'start': line.get('start') or None,
+                'professional_id': line.get('professional_id') or None,
+                'note': line.get('note', ''),
+            }
+            client = {key: line[key] for key in CLIENT_COLUMNS if line.get(key)}
+            if client:
+                row['client'] = client
+            vehicle = {key: line[key] for key in VEHICLE_COLUMNS if line.get(key)}
+            if vehicle:
+                vehicle['year'] = int(vehicle['year']) if vehicle.get('year', '').isdigit() else None
+                row['vehicle'] = vehicle
+            yield row
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa reservas en bloque desde un CSV o un JSON ({"client": {...}, "rows": [...]}) '
+        'y muestra el resultado por fila'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Archivo .csv o .json')
+        parser.add_argument('--client-email', type=str, help='Cliente por defecto para filas sin email (flota)')
+        parser.add_argument('--dry-run', action='store_true', help='Solo planificar, sin crear reservas')
+        parser.add_argument('--no-notify', action='store_true', help='No enviar emails ni WhatsApp')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        defaults = {}
+        try:
+            if path.lower().endswith('.json'):
+                with open(path, encoding='utf-8') as f:
+                    payload = json.load(f)
+                rows = payload.get('rows') or []
+                defaults['client'] = payload.get('client') or {}
+            else:
+                rows = list(_csv_rows(path))
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo leer {path}: {e}')
+
+        if not rows:
+            raise CommandError(f'{path} no tiene filas')
+        if options.get('client_email'):
+            defaults['client'] = {'email': options['client_email']}
+
+        results = import_reservations(
+            rows,
+            defaults=defaults,
+            dry_run=options['dry_run'],
+            notify=not options['no_notify'],
+        )
+
+        for result in results:
+            line = f"  fila {result['row'] + 1}: {result['status']}"
+            if result.get('reservation_id'):
+                line += f" #{result['reservation_id']}"
+            if result.get('start'):
+                line += f" profesional {result['professional_id']} {timezone.localtime(result['start']):%Y-%m-%d %H:%M}"
+            if result.get('error'):
+                line += f" - {result['error']}"
+            self.stdout.write(line)
+
+        errors = sum(1 for result in results if result['status'] == 'error')
+        done = len(results) - errors
+        verb = 'planificada(s)' if options['dry_run'] else 'creada(s)'
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style(f'{"⚠️ " if errors else "✅"} {done} reserva(s) {verb}, {errors} fila(s) con error'))
@@ -0,0 +1,86 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.agenda.models import Professional, SlotHorizon
+from apps.agenda.services import (
+    extend_slot_horizon,
+    get_horizon_target,
+    virtual_availability_enabled,
+)
+
+
+class Command(BaseCommand):
+    help = 'Extiende el horizonte de slots de cada profesional solo por los días faltantes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--professional',
+            type=int,
+            help='ID de profesional específico (opcional)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo reportar profesionales con horizonte atrasado, sin generar'
+        )
+
+    def handle(self, *args, **options):
+        if virtual_availability_enabled():
+            self.stdout.write(self.style.WARNING('⚠️  Modo virtual activo: no hay slots que materializar'))
+            return
+
+        today = timezone.localdate()
+        target = get_horizon_target(today)
+
+        professionals = Professional.objects.filter(active=True, accepts_reservations=True)
+        if options.get('professional'):
+            professionals = professionals.filter(id=options['professional'])
+        professionals = list(professionals)
+        if not professionals:
+            self.stdout.write(self.style.WARNING('⚠️  No hay profesionales activos'))
+            return
+
+        watermarks = dict(
+            SlotHorizon.objects.filter(professional__in=professionals)
+            .values_list('professional_id', 'materialized_until')
+        )
+
+        # Atrasados: les falta más de un día (lo normal en una corrida diaria)
+        lagging = []
+        for prof in professionals:
+            current = watermarks.get(prof.id)
+            missing = (target - max(current, today - timedelta(days=1))).days if current else None
+            if missing is None or missing > 1:
+                lagging.append((prof, current, missing))
+
+        if lagging:
+            self.stdout.write(self.style.WARNING(f'⚠️  {len(lagging)} profesional(es) con horizonte atrasado:'))
+            for prof, current, missing in lagging:
+                detail = f'hasta {current} ({missing} días faltantes)' if current else 'sin marca de agua'
+                self.stdout.write(f'     {prof}: {detail}')
+
+        if options['dry_run']:
+            return
+
+        started = time.monotonic()
+        total_days = 0
+        errors = 0
+        for prof in professionals:
+            try:
+                total_days += extend_slot_horizon(prof.id, target)
+            except Exception as e:
+                errors += 1
+                self.stdout.write(self.style.ERROR(f'  ❌ {prof}: {e}'))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Horizonte al {target}: {total_days} día(s) materializados '
+                f'para {len(professionals)} profesionales en {elapsed:.2f}s'
+            )
+        )
+
+        if errors:
+            raise CommandError(f'{errors} profesional(es) con errores al extender el horizonte')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from apps.agenda.models import DirtySlotDate
+from apps.agenda.services import process_dirty_slot_dates
+
+
+class Command(BaseCommand):
+    help = 'Regenera los slots de los días marcados como pendientes (DirtySlotDate)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Máximo de días a procesar en esta ejecución (opcional)'
+        )
+
+    def handle(self, *args, **options):
+        pending = DirtySlotDate.objects.count()
+        if not pending:
+            self.stdout.write(self.style.SUCCESS('No hay días pendientes de regenerar.'))
+            return
+
+        self.stdout.write(f'{pending} días pendientes. Regenerando...')
+        regenerated = process_dirty_slot_dates(limit=options['limit'])
+
+        remaining = DirtySlotDate.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'✅ {regenerated} días regenerados ({remaining} pendientes).'))
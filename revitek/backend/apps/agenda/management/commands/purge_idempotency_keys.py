@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from apps.agenda.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Borra las respuestas guardadas por Idempotency-Key más antiguas que AGENDA_IDEMPOTENCY_TTL_HOURS'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f'✅ {deleted} clave(s) de idempotencia borradas.'))
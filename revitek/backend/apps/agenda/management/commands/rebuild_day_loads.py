@@ -0,0 +1,81 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.agenda.models import ProfessionalDayLoad, ReservationSlot
+from apps.agenda.services import count_day_loads, refresh_day_loads
+
+# Días por lote: acota el tamaño de cada consulta de conteo
+CHUNK_DAYS = 31
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'--{name} debe tener formato YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores ProfessionalDayLoad desde las reservas y corrige diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=str, help='Fecha inicial YYYY-MM-DD (opcional)')
+        parser.add_argument('--to', dest='date_to', type=str, help='Fecha final YYYY-MM-DD (opcional)')
+        parser.add_argument(
+            '--professional',
+            type=int,
+            help='ID de profesional específico (opcional)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo reportar diferencias, sin corregir'
+        )
+
+    def handle(self, *args, **options):
+        links = ReservationSlot.objects.all()
+        loads = ProfessionalDayLoad.objects.all()
+        if options.get('date_from'):
+            date_from = _parse_date(options['date_from'], 'from')
+            links = links.filter(slot__date__gte=date_from)
+            loads = loads.filter(date__gte=date_from)
+        if options.get('date_to'):
+            date_to = _parse_date(options['date_to'], 'to')
+            links = links.filter(slot__date__lte=date_to)
+            loads = loads.filter(date__lte=date_to)
+        if options.get('professional'):
+            links = links.filter(professional_id=options['professional'])
+            loads = loads.filter(professional_id=options['professional'])
+
+        # Pares con reservas (de cualquier estado) o con un contador que quizá sobra
+        pairs = set(links.values_list('professional_id', 'slot__date').distinct())
+        current = {
+            (prof_id, d): (count, booked_min)
+            for prof_id, d, count, booked_min in loads.values_list(
+                'professional_id', 'date', 'reservations', 'booked_min'
+            )
+        }
+        pairs |= current.keys()
+
+        dates = sorted({d for _, d in pairs})
+        drift = []
+        for i in range(0, len(dates), CHUNK_DAYS):
+            chunk_dates = set(dates[i:i + CHUNK_DAYS])
+            chunk = {pair for pair in pairs if pair[1] in chunk_dates}
+            for pair, expected in sorted(count_day_loads(chunk).items(), key=lambda item: (item[0][1], item[0][0])):
+                if current.get(pair, (0, 0)) != expected:
+                    drift.append((pair, current.get(pair), expected))
+            if not options['dry_run']:
+                refresh_day_loads(chunk)
+
+        for (prof_id, d), found, expected in drift:
+            found_text = f'{found[0]} reservas / {found[1]} min' if found else 'sin fila'
+            self.stdout.write(
+                f'  profesional {prof_id} {d}: {found_text} -> {expected[0]} reservas / {expected[1]} min'
+            )
+
+        verb = 'encontrada(s)' if options['dry_run'] else 'corregida(s)'
+        style = self.style.WARNING if drift else self.style.SUCCESS
+        self.stdout.write(style(
+            f'{"⚠️ " if drift else "✅"} {len(pairs)} día(s) revisados, {len(drift)} diferencia(s) {verb}'
+        ))
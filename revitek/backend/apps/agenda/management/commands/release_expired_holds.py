@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from apps.agenda.models import SlotHold
+from apps.agenda.services import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Libera los holds de checkout vencidos y devuelve sus slots a AVAILABLE (ejecutar cada minuto)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--professional',
+            type=int,
+            action='append',
+            help='ID de profesional específico (opcional, repetible)'
+        )
+
+    def handle(self, *args, **options):
+        released = release_expired_holds(options['professional'])
+
+        active = SlotHold.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'✅ {released} hold(s) liberados ({active} activos).'))
@@ -0,0 +1,235 @@
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from apps.agenda import skills
+from apps.agenda.models import Reservation, ReservationSlot, Slot
+from apps.agenda.services import (
+    BOOKING_STRATEGIES,
+    create_reservation_transaction,
+    notify_slots_changed,
+    refresh_day_loads,
+)
+
+STRESS_EMAIL = 'stress-booking@example.invalid'
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Dispara reservas concurrentes sobre la misma cadena de slots (o, con --same-day, sobre '
+        'cadenas distintas del mismo profesional y día) con cada estrategia (pessimistic / '
+        'optimistic) y reporta throughput, tasa de conflictos, p99 y doble reserva. '
+        'Crea y borra reservas reales: usar solo en una base de pruebas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--service', type=int, required=True, help='ID del servicio a reservar')
+        parser.add_argument('--threads', type=int, default=8, help='Reservas simultáneas por cadena (default: 8)')
+        parser.add_argument('--rounds', type=int, default=5, help='Cadenas distintas por estrategia (default: 5)')
+        parser.add_argument(
+            '--same-day',
+            action='store_true',
+            help=(
+                'Cada hilo reserva una cadena distinta del mismo profesional y día: sin conflictos '
+                'de slots, mide la contención en la fila de carga diaria'
+            )
+        )
+        parser.add_argument(
+            '--strategy',
+            choices=BOOKING_STRATEGIES,
+            action='append',
+            help='Estrategia a medir (repetible; default: ambas)'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                '⚠️  SQLite serializa las escrituras y no soporta FOR UPDATE: los números no son representativos'
+            ))
+
+        service_id = options['service']
+        candidates = {
+            prof_id: durations[service_id]
+            for prof_id, durations in skills.qualified_durations([service_id]).items()
+        }
+        if not candidates:
+            raise CommandError(f'Ningún profesional activo hace el servicio {service_id}')
+
+        client, _ = get_user_model().objects.get_or_create(email=STRESS_EMAIL)
+        strategies = options['strategy'] or list(BOOKING_STRATEGIES)
+
+        # Sin correos ni WhatsApp para las reservas de prueba
+        from apps.agenda.signals import trigger_email_notifications
+        from apps.whatsapp.signals import send_confirmation_whatsapp
+        post_save.disconnect(trigger_email_notifications, sender=Reservation)
+        post_save.disconnect(send_confirmation_whatsapp, sender=Reservation)
+        try:
+            per_round = options['threads'] if options['same_day'] else 1
+            rounds = self._free_rounds(candidates, options['rounds'] * len(strategies), per_round)
+            if len(rounds) < options['rounds'] * len(strategies):
+                raise CommandError('No hay suficientes cadenas libres para todas las rondas')
+
+            double_booked = 0
+            for index, strategy in enumerate(strategies):
+                chains = rounds[index * options['rounds']:(index + 1) * options['rounds']]
+                stats, created = self._run(strategy, chains, options['threads'], client, service_id)
+                double_booked += self._report(strategy, stats, chains)
+                self._cleanup(created)
+        finally:
+            post_save.connect(trigger_email_notifications, sender=Reservation)
+            post_save.connect(send_confirmation_whatsapp, sender=Reservation)
+
+        if double_booked:
+            raise CommandError(f'{double_booked} slot(s) con más de una reserva activa')
+        self.stdout.write(self.style.SUCCESS('✅ Sin doble reserva'))
+
+    def _free_rounds(self, candidates, needed, per_round):
+        """
+        Rondas de `per_round` cadenas AVAILABLE futuras sin solaparse
+        [(profesional, inicio, minutos, slot inicial), ...], todas del mismo
+        profesional y día dentro de cada ronda.
+        """
+        rounds = []
+        now = timezone.now()
+        for prof_id, minutes in candidates.items():
+            slots = list(
+                Slot.objects.filter(professional_id=prof_id, status='AVAILABLE', start__gt=now)
+                .order_by('start')[:500]
+            )
+            by_start = {slot.start: slot for slot in slots}
+            used_until = None
+            current = []
+            for slot in slots:
+                if used_until and slot.start < used_until:
+                    continue
+                if current and slot.date != current[0][4]:
+                    current = []  # Cada ronda en un solo día
+                cursor = slot.start
+                end = slot.start + timedelta(minutes=minutes)
+                while cursor < end and cursor in by_start:
+                    cursor = by_start[cursor].end
+                if cursor >= end:
+                    current.append((prof_id, slot.start, minutes, slot.id, slot.date))
+                    used_until = end
+                if len(current) == per_round:
+                    rounds.append([chain[:4] for chain in current])
+                    current = []
+                if len(rounds) >= needed:
+                    return rounds
+        return rounds
+
+    def _run(self, strategy, chains, threads, client, service_id):
+        stats = {'latencies': [], 'results': Counter(), 'errors': Counter(), 'elapsed': 0.0}
+        created = []
+        lock = threading.Lock()
+
+        def book(prof_id, slot_id, barrier):
+            data = {
+                'client': {'email': client.email},
+                'professional_id': prof_id,
+                'services': [{'service_id': service_id, 'professional_id': prof_id}],
+                'slot_id': slot_id,
+            }
+            barrier.wait()
+            started = time.perf_counter()
+            try:
+                reservation = create_reservation_transaction(data, strategy=strategy)
+                outcome = 'ok'
+            except ValidationError:
+                reservation, outcome = None, 'conflict'
+            except Exception as e:
+                reservation, outcome = None, 'error'
+                with lock:
+                    stats['errors'][f'{type(e).__name__}: {e}'] += 1
+            finally:
+                connections.close_all()
+            elapsed = time.perf_counter() - started
+            with lock:
+                stats['latencies'].append(elapsed)
+                stats['results'][outcome] += 1
+                if reservation:
+                    created.append(reservation.id)
+
+        started = time.perf_counter()
+        for round_chains in chains:
+            barrier = threading.Barrier(threads)
+            # Una cadena por ronda: todos compiten por ella; con --same-day, una por hilo
+            targets = [round_chains[i % len(round_chains)] for i in range(threads)]
+            workers = [
+                threading.Thread(target=book, args=(prof_id, slot_id, barrier))
+                for prof_id, _, _, slot_id in targets
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        stats['elapsed'] = time.perf_counter() - started
+        return stats, created
+
+    def _report(self, strategy, stats, chains):
+        results = stats['results']
+        attempts = sum(results.values())
+        p50 = _percentile(stats['latencies'], 50) * 1000
+        p99 = _percentile(stats['latencies'], 99) * 1000
+
+        # Doble reserva: algún slot de estas cadenas con más de una reserva activa
+        expected = sum(len(round_chains) for round_chains in chains)
+        chain_filter = Q()
+        for prof_id, start, minutes, _ in (chain for round_chains in chains for chain in round_chains):
+            chain_filter |= Q(
+                slot__professional_id=prof_id,
+                slot__start__gte=start,
+                slot__start__lt=start + timedelta(minutes=minutes),
+            )
+        double_booked = (
+            ReservationSlot.objects.filter(chain_filter)
+            .exclude(reservation__status='CANCELLED')
+            .values('slot_id')
+            .annotate(n=Count('reservation_id', distinct=True))
+            .filter(n__gt=1)
+            .count()
+        )
+
+        errors = ''.join(f'    {count} × {error}\n' for error, count in stats['errors'].most_common(3))
+        self.stdout.write(
+            f'{strategy}:\n'
+            f'  intentos:        {attempts} ({len(chains)} rondas × {attempts // max(len(chains), 1)} hilos)\n'
+            f'  reservas:        {results["ok"]} (esperadas {expected})\n'
+            f'  conflictos:      {results["conflict"]} ({results["conflict"] / max(attempts, 1):.0%})\n'
+            f'  errores:         {results["error"]}\n'
+            f'{errors}'
+            f'  throughput:      {attempts / stats["elapsed"]:.1f} intentos/s\n'
+            f'  latencia:        p50 {p50:.1f} ms, p99 {p99:.1f} ms\n'
+            f'  doble reserva:   {double_booked}'
+        )
+        if results['ok'] != expected:
+            self.stdout.write(self.style.WARNING(f'  ⚠️  {results["ok"]} reservas para {expected} cadenas'))
+        return double_booked
+
+    def _cleanup(self, reservation_ids):
+        """Borra las reservas de prueba y devuelve sus slots a AVAILABLE."""
+        links = list(
+            ReservationSlot.objects.filter(reservation_id__in=reservation_ids)
+            .values_list('slot_id', 'professional_id', 'slot__date')
+        )
+        Reservation.objects.filter(id__in=reservation_ids).delete()
+        Slot.objects.filter(id__in=[slot_id for slot_id, _, _ in links]).update(status='AVAILABLE')
+        pairs = {(prof_id, d) for _, prof_id, d in links}
+        notify_slots_changed(pairs)
+        refresh_day_loads(pairs)
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2025-12-05 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0007_reservation_completed_at_reservation_completion_note'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtySlotDate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('professional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dirty_slot_dates', to='agenda.professional')),
+            ],
+            options={
+                'ordering': ['professional_id', 'date'],
+                'unique_together': {('professional', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2025-12-05 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0008_dirtyslotdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHorizon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('materialized_until', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('professional', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='slot_horizon', to='agenda.professional')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2025-12-05 13:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0009_slothorizon'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfessionalDayLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('reservations', models.PositiveIntegerField(default=0)),
+                ('booked_min', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('professional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_loads', to='agenda.professional')),
+            ],
+            options={
+                'unique_together': {('professional', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2025-12-05 16:20
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0011_professionaldayload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='slot',
+            name='status',
+            field=models.CharField(choices=[('AVAILABLE', 'Available'), ('BLOCKED', 'Blocked'), ('RESERVED', 'Reserved'), ('HELD', 'Held')], default='AVAILABLE', max_length=12),
+        ),
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('date', models.DateField()),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('professional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='agenda.professional')),
+            ],
+            options={
+                'ordering': ['expires_at'],
+            },
+        ),
+    ]
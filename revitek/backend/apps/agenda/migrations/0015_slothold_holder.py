@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2025-12-05 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0014_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slothold',
+            name='holder',
+            field=models.CharField(blank=True, default='', max_length=254),
+        ),
+        migrations.AddConstraint(
+            model_name='slothold',
+            constraint=models.UniqueConstraint(condition=models.Q(('holder', ''), _negated=True), fields=('holder',), name='unique_slot_hold_per_holder'),
+        ),
+    ]
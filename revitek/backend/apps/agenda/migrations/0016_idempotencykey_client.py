@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2025-12-05 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0015_slothold_holder'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='idempotencykey',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='client',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterUniqueTogether(
+            name='idempotencykey',
+            unique_together={('key', 'scope', 'client')},
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth import get_user_model
@@ -180,6 +181,7 @@ class Slot(models.Model):
         ("AVAILABLE", "Available"),
         ("BLOCKED", "Blocked"),
         ("RESERVED", "Reserved"),
+        ("HELD", "Held"),
     ]
 
     professional = models.ForeignKey(
@@ -234,6 +236,104 @@ class SlotBlock(models.Model):
         return f"Block {self.professional} {self.start:%Y-%m-%d %H:%M}"
 
 
+class DirtySlotDate(models.Model):
+    """
+    Cola de días (profesional, fecha) cuyos slots deben regenerarse
+    porque cambió un horario, descanso, excepción o bloqueo.
+    """
+    professional = models.ForeignKey(
+        Professional,
+        on_delete=models.CASCADE,
+        related_name="dirty_slot_dates",
+    )
+    date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [("professional", "date")]
+        ordering = ["professional_id", "date"]
+
+    def __str__(self):
+        return f"Dirty {self.professional_id} {self.date}"
+
+
+class SlotHorizon(models.Model):
+    """
+    Marca de agua de materialización: último día hasta el cual existen
+    slots generados de forma continua para el profesional.
+    """
+    professional = models.OneToOneField(
+        Professional,
+        on_delete=models.CASCADE,
+        related_name="slot_horizon",
+    )
+    materialized_until = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Horizon {self.professional_id} {self.materialized_until}"
+
+
+class ProfessionalDayLoad(models.Model):
+    """
+    Carga de un profesional en un día: reservas activas con slots en esa
+    fecha y minutos reservados. Se mantiene en la misma transacción que
+    crea o cambia de estado las reservas (con la estrategia optimista, al
+    confirmar la reserva; ver services.attach_slot_chain y
+    services.refresh_day_loads) y se puede reconstruir con
+    `manage.py rebuild_day_loads`.
+    """
+    professional = models.ForeignKey(
+        Professional,
+        on_delete=models.CASCADE,
+        related_name="day_loads",
+    )
+    date = models.DateField()
+    reservations = models.PositiveIntegerField(default=0)
+    booked_min = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [("professional", "date")]
+
+    def __str__(self):
+        return f"Carga {self.professional_id} {self.date}: {self.reservations}"
+
+
+class SlotHold(models.Model):
+    """
+    Retención temporal de una cadena de slots mientras el cliente termina
+    el checkout: los slots quedan HELD hasta que la reserva canjea el token
+    o vence `expires_at` (ver services.release_expired_holds).
+    """
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    professional = models.ForeignKey(
+        Professional,
+        on_delete=models.CASCADE,
+        related_name="slot_holds",
+    )
+    date = models.DateField()
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    # Email del cliente en checkout: a lo sumo un hold por cliente
+    holder = models.CharField(max_length=254, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["expires_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["holder"],
+                condition=~models.Q(holder=""),
+                name="unique_slot_hold_per_holder",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Hold {self.professional_id} {self.start:%Y-%m-%d %H:%M} hasta {self.expires_at:%H:%M:%S}"
+
+
 class Reservation(models.Model):
     """
     Reserva principal de un cliente.
@@ -410,4 +510,44 @@ class AdminAudit(models.Model):
     notes = models.TextField(blank=True, default="")
 
     def __str__(self):
-        return f"{self.action} {self.model_name}({self.object_id})"
\ No newline at end of file
+        return f"{self.action} {self.model_name}({self.object_id})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Respuesta de un POST enviado con cabecera Idempotency-Key (reservar,
+    cancelar). Los reintentos con la misma clave reciben la respuesta
+    guardada sin volver a ejecutar la operación (ver agenda.idempotency).
+    """
+    key = models.CharField(max_length=255)
+    # Método y ruta del pedido (ej: "POST /api/agenda/reservations/")
+    scope = models.CharField(max_length=255)
+    # Quién lo envía (ver idempotency.request_client): "user:3", "email:a@x.cl"
+    client = models.CharField(max_length=255, blank=True, default="")
+    fingerprint = models.CharField(max_length=64)
+    # Nulos mientras el primer pedido sigue en curso
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = [("key", "scope", "client")]
+
+    def __str__(self):
+        return f"{self.scope} [{self.key}] -> {self.response_status or 'en curso'}"
+
+
+class DataVersion(models.Model):
+    """
+    Versión de un conjunto de datos servido con ETag (ver core.conditional).
+    Vive en la BD para que todos los workers vean el mismo valor: cada
+    cambio la reemplaza por un valor nuevo al confirmar la transacción.
+    Una fila ausente equivale a la versión "" (borrarlas solo provoca un 200).
+    """
+    # Ej: "catalog", "agenda:availability:v:d:3:2026-10-19"
+    name = models.CharField(max_length=255, unique=True)
+    version = models.CharField(max_length=32)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.name} = {self.version}"
@@ -15,12 +15,13 @@ from .models import (
     ScheduleException,
     Slot,
     SlotBlock,
+    SlotHold,
     Reservation,
     ReservationService,
     ReservationSlot,
     StatusHistory,
 )
-from .services import compute_total_duration, create_reservation_transaction
+from .services import compute_total_duration, create_reservation_transaction, hold_slot_chain
 
 User = get_user_model()
 
@@ -231,13 +232,61 @@ class ReservationCreateSerializer(serializers.Serializer):
     # Datos de la reserva
     professional_id = serializers.IntegerField()
     services = ReservationServiceInputSerializer(many=True)
-    slot_id = serializers.IntegerField()
+    slot_id = serializers.IntegerField(required=False)
+    # Modo de disponibilidad virtual: se reserva por hora de inicio en vez de slot_id
+    start = serializers.DateTimeField(required=False)
+    # Token de POST /agenda/holds/: reserva la cadena ya retenida
+    hold_token = serializers.UUIDField(required=False)
     note = serializers.CharField(allow_blank=True, required=False)
 
+    def validate(self, attrs):
+        if not attrs.get("slot_id") and not attrs.get("start") and not attrs.get("hold_token"):
+            raise serializers.ValidationError({"slot_id": "slot_id, start or hold_token is required."})
+        return attrs
+
     def create(self, validated_data):
         return create_reservation_transaction(validated_data)
 
 
+class SlotHoldCreateSerializer(serializers.Serializer):
+    """
+    Retiene la cadena de slots de los servicios mientras dura el checkout.
+    Mismos campos de agenda que ReservationCreateSerializer; client.email
+    identifica al cliente (un hold activo por cliente).
+    """
+    client = serializers.DictField(required=True)
+    professional_id = serializers.IntegerField()
+    services = ReservationServiceInputSerializer(many=True)
+    slot_id = serializers.IntegerField(required=False)
+    start = serializers.DateTimeField(required=False)
+
+    def validate_client(self, value):
+        email = (value.get("email") or "").strip().lower()
+        if not email:
+            raise serializers.ValidationError("email is required.")
+        return {**value, "email": email}
+
+    def validate(self, attrs):
+        if not attrs.get("slot_id") and not attrs.get("start"):
+            raise serializers.ValidationError({"slot_id": "slot_id or start is required."})
+        return attrs
+
+    def create(self, validated_data):
+        return hold_slot_chain(
+            validated_data["professional_id"],
+            validated_data["services"],
+            slot_id=validated_data.get("slot_id"),
+            start=validated_data.get("start"),
+            holder=validated_data["client"]["email"],
+        )
+
+
+class SlotHoldSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SlotHold
+        fields = ["token", "professional_id", "start", "end", "expires_at"]
+
+
 # ----------------------------------------------------------------------
 # RESERVAS - OUTPUT / DETALLE
 # ----------------------------------------------------------------------
@@ -1,12 +1,16 @@
+from collections import defaultdict
 from datetime import datetime, timedelta, time, date
 from typing import List, Optional
 
 from django.db import transaction
 from django.utils import timezone
 from django.conf import settings
+import logging
 import pytz
 
 from apps.catalog.models import Service
+from . import skills, time_rules
+from .intervals import free_grid_slots, run_ends, subtract_intervals
 from .models import (
     Professional,
     ProfessionalService,
@@ -17,14 +21,20 @@ from .models import (
     SlotBlock,
     Reservation,
     ReservationSlot,
+    DirtySlotDate,
+    SlotHorizon,
+    ProfessionalDayLoad,
+    SlotHold,
 )
 # from apps.email_service.services import send_reserva_confirmada, send_reserva_cancelada
 
+logger = logging.getLogger(__name__)
+
 
 # ----------------------------------------------------------------------
 # 1) Calcular duración total de una reserva
 # ----------------------------------------------------------------------
-def compute_total_duration(services: List[dict]) -> int:
+def compute_total_duration(services: List[dict], matrix=None) -> int:
     """
     Dada una lista de:
     {
@@ -34,36 +44,22 @@ def compute_total_duration(services: List[dict]) -> int:
 
     Devuelve el total de minutos efectivos
     considerando anulaciones en ProfessionalService.
-    Optimizado para usar una sola consulta a la BD.
+    Sin `matrix` lee la BD (skills.load_matrix), no el índice en memoria:
+    de esto depende la validación de reservas.
     """
-    if not services:
-        return 0
-
-    from django.db.models import Q
-    
-    # Construir consulta para todos los pares
-    query = Q()
-    for s in services:
-        query |= Q(service_id=s["service_id"], professional_id=s["professional_id"])
-    
-    if not query:
-        return 0
-
-    # Obtener todos los objetos necesarios de una vez
-    ps_objects = ProfessionalService.objects.select_related("service").filter(query, active=True)
-    
-    # Mapa para búsqueda O(1): (service_id, professional_id) -> ProfessionalService
-    ps_map = {(ps.service_id, ps.professional_id): ps for ps in ps_objects}
-    
+    if matrix is None:
+        matrix = skills.load_matrix(
+            service_ids=[s["service_id"] for s in services],
+            professional_ids=[s["professional_id"] for s in services],
+        )
     total = 0
     for s in services:
-        key = (s["service_id"], s["professional_id"])
-        if key not in ps_map:
+        duration = skills.effective_duration(s["professional_id"], s["service_id"], matrix)
+        if duration is None:
             # Mantener comportamiento original: lanzar error si no se encuentra
+            key = (s["service_id"], s["professional_id"])
             raise ProfessionalService.DoesNotExist(f"ProfessionalService not found for {key}")
-        
-        ps = ps_map[key]
-        total += (ps.duration_override_min or ps.service.duration_min)
+        total += duration
 
     return total
 
@@ -125,117 +121,425 @@ def generate_raw_slots(start_dt: datetime, end_dt: datetime, slot_min: int = 60)
 
 
 # ----------------------------------------------------------------------
-# 9) Generar slots finales y persistirlos en DB
+# 6) Cargar contexto de horarios para un rango de fechas
 # ----------------------------------------------------------------------
-def generate_daily_slots(professional_id: int, target_date: date, slot_min: int = 60):
+def _make_aware(dt: datetime) -> datetime:
+    if timezone.is_naive(dt):
+        return timezone.make_aware(dt)
+    return dt
+
+
+def load_schedule_contexts(professional_ids, start_date: date, end_date: date) -> dict:
     """
-    Este es el generador de slots REAL con lógica completa:
-    - Aplica WorkSchedule para el día
-    - Elimina breaks, excepciones y bloqueos en una sola pasada
-    - Guarda slots finales en BD
-    - Limpia slots AVAILABLE obsoletos que ya no son válidos
+    Carga de una vez (4 consultas, sin importar cuántos profesionales o días)
+    todo lo necesario para calcular slots entre start_date y end_date (inclusive):
+    - WorkSchedule activos por día de la semana (con sus breaks)
+    - ScheduleException por fecha
+    - SlotBlock por fecha
+
+    Devuelve {professional_id: contexto}.
     """
+    contexts = {
+        prof_id: {
+            "schedules": {},
+            "exceptions": defaultdict(list),
+            "blocks": defaultdict(list),
+        }
+        for prof_id in professional_ids
+    }
 
-    ws = get_work_schedule_for_date(professional_id, target_date)
-    
-    # Si no hay horario, probablemente deberíamos limpiar TODOS los slots disponibles para este día
+    for ws in WorkSchedule.objects.filter(
+        professional_id__in=contexts.keys(),
+        active=True,
+    ).prefetch_related("breaks"):
+        contexts[ws.professional_id]["schedules"][ws.weekday] = ws
+
+    for ex in ScheduleException.objects.filter(
+        professional_id__in=contexts.keys(),
+        date__range=(start_date, end_date),
+    ):
+        contexts[ex.professional_id]["exceptions"][ex.date].append(
+            (_make_aware(ex.start), _make_aware(ex.end))
+        )
+
+    for bl in SlotBlock.objects.filter(
+        professional_id__in=contexts.keys(),
+        date__range=(start_date, end_date),
+    ):
+        contexts[bl.professional_id]["blocks"][bl.date].append(
+            (_make_aware(bl.start), _make_aware(bl.end))
+        )
+
+    return contexts
+
+
+def load_schedule_context(professional_id: int, start_date: date, end_date: date) -> dict:
+    """
+    Contexto de un solo profesional (ver load_schedule_contexts).
+    """
+    return load_schedule_contexts([professional_id], start_date, end_date)[professional_id]
+
+
+# ----------------------------------------------------------------------
+# 7) Calcular slots deseados para un día (sin tocar la BD)
+# ----------------------------------------------------------------------
+def compute_day_slots(context: dict, target_date: date, slot_min: int = 60, extra_busy=()):
+    """
+    Devuelve la lista de (inicio, fin) que deberían existir para el día,
+    usando el contexto precargado por load_schedule_context.
+    `extra_busy` permite restar intervalos adicionales (ej. tiempo ya reservado).
+    """
+    ws = context["schedules"].get(target_date.weekday())
     if not ws:
-        Slot.objects.filter(
-            professional_id=professional_id,
-            date=target_date,
-            status="AVAILABLE"
-        ).delete()
         return []
 
     # Rango laboral base
-    start_dt = datetime.combine(target_date, ws.start_time)
-    end_dt = datetime.combine(target_date, ws.end_time)
+    start_dt = _make_aware(datetime.combine(target_date, ws.start_time))
+    end_dt = _make_aware(datetime.combine(target_date, ws.end_time))
 
-    if timezone.is_naive(start_dt):
-        start_dt = timezone.make_aware(start_dt)
-        end_dt = timezone.make_aware(end_dt)
+    # 1) Recolectar todos los intervalos ocupados (breaks, excepciones, bloqueos)
+    busy_intervals = []
+    for br in ws.breaks.all():
+        busy_intervals.append((
+            _make_aware(datetime.combine(target_date, br.start_time)),
+            _make_aware(datetime.combine(target_date, br.end_time)),
+        ))
+    busy_intervals.extend(context["exceptions"].get(target_date, []))
+    busy_intervals.extend(context["blocks"].get(target_date, []))
+    busy_intervals.extend(extra_busy)
 
-    # 1) Generar slots crudos
-    raw_slots = generate_raw_slots(start_dt, end_dt, slot_min)
+    # 2) Barrer la grilla del día contra los ocupados fusionados
+    return free_grid_slots(start_dt, end_dt, busy_intervals, slot_min)
 
-    # 2) Recolectar todos los intervalos ocupados (breaks, excepciones, bloqueos)
-    busy_intervals = []
 
-    # Breaks
-    for br in get_breaks_for_work_schedule(ws):
-        b_start = datetime.combine(target_date, br.start_time)
-        b_end = datetime.combine(target_date, br.end_time)
-        if timezone.is_naive(b_start):
-            b_start = timezone.make_aware(b_start)
-            b_end = timezone.make_aware(b_end)
-        busy_intervals.append((b_start, b_end))
-
-    # Exceptions
-    for ex in get_exceptions_for_day(professional_id, target_date):
-        e_start = ex.start
-        e_end = ex.end
-        if timezone.is_naive(e_start):
-             e_start = timezone.make_aware(e_start)
-             e_end = timezone.make_aware(e_end)
-        busy_intervals.append((e_start, e_end))
-
-    # Blocks
-    blocks = SlotBlock.objects.filter(professional_id=professional_id, date=target_date)
-    for bl in blocks:
-        bl_start = bl.start
-        bl_end = bl.end
-        if timezone.is_naive(bl_start):
-             bl_start = timezone.make_aware(bl_start)
-             bl_end = timezone.make_aware(bl_end)
-        busy_intervals.append((bl_start, bl_end))
-
-    # 3) Filtrar slots en una sola pasada
-    filtered = []
-    for start, end in raw_slots:
-        is_blocked = False
-        for b_start, b_end in busy_intervals:
-            # Verificar superposición: (StartA < EndB) y (EndA > StartB)
-            if start < b_end and end > b_start:
-                is_blocked = True
-                break
-        if not is_blocked:
-            filtered.append((start, end))
+# ----------------------------------------------------------------------
+# 8) Materializar slots para un rango de fechas (operaciones en bloque)
+# ----------------------------------------------------------------------
+def _materialize_slots(professional_id: int, start_date: date, days: int, slot_min: int = 60):
+    """
+    Implementación de materialize_slots_range.
+    Devuelve (reporte por día, conjunto de inicios válidos).
+    """
+    from django.db.models import ProtectedError
 
-    # 4) Crear slots si no existen y recolectar inicios válidos
-    slots_created = []
-    valid_start_times = set()
+    end_date = start_date + timedelta(days=days - 1)
+    context = load_schedule_context(professional_id, start_date, end_date)
 
-    for start, end in filtered:
-        valid_start_times.add(start)
-        slot, created = Slot.objects.get_or_create(
+    report = {}
+    desired = {}  # inicio -> (fecha, fin)
+    for i in range(days):
+        d = start_date + timedelta(days=i)
+        report[d] = {"total": 0, "created": 0, "removed": 0, "blocked": 0}
+        for start, end in compute_day_slots(context, d, slot_min):
+            desired[start] = (d, end)
+            report[d]["total"] += 1
+
+    existing = Slot.objects.filter(
+        professional_id=professional_id,
+        date__range=(start_date, end_date),
+    ).values_list("id", "start", "date", "status")
+
+    existing_starts = set()
+    stale = {}  # id -> fecha
+    for slot_id, start, d, slot_status in existing:
+        existing_starts.add(start)
+        if slot_status == "AVAILABLE" and start not in desired:
+            stale[slot_id] = d
+
+    # 1) Crear los slots faltantes en una sola consulta
+    to_create = []
+    for start, (d, end) in desired.items():
+        if start in existing_starts:
+            continue
+        to_create.append(Slot(
             professional_id=professional_id,
+            date=d,
             start=start,
-            defaults={
-                "date": target_date,
-                "end": end,
-                "status": "AVAILABLE",
-            },
+            end=end,
+            status="AVAILABLE",
+        ))
+        report[d]["created"] += 1
+    Slot.objects.bulk_create(to_create, ignore_conflicts=True)
+
+    # 2) Limpiar slots AVAILABLE obsoletos.
+    # Los que están referenciados por una reserva no se pueden borrar (PROTECT),
+    # así que se marcan como BLOCKED igual que antes.
+    if stale:
+        protected = set(
+            ReservationSlot.objects.filter(slot_id__in=stale.keys())
+            .values_list("slot_id", flat=True)
         )
-        slots_created.append(slot)
+        deletable = [slot_id for slot_id in stale if slot_id not in protected]
+
+        try:
+            Slot.objects.filter(id__in=deletable).delete()
+        except ProtectedError:
+            # Una reserva tomó alguno de estos slots entre la lectura y el borrado
+            protected |= set(
+                ReservationSlot.objects.filter(slot_id__in=deletable)
+                .values_list("slot_id", flat=True)
+            )
+            deletable = [slot_id for slot_id in deletable if slot_id not in protected]
+            Slot.objects.filter(id__in=deletable).delete()
+
+        if protected:
+            Slot.objects.filter(id__in=protected).update(status="BLOCKED")
+
+        for slot_id, d in stale.items():
+            key = "blocked" if slot_id in protected else "removed"
+            report[d][key] += 1
+
+    _advance_slot_horizon(professional_id, start_date, end_date)
+    notify_slots_changed((professional_id, d) for d in report)
+
+    return report, set(desired)
+
+
+@transaction.atomic
+def materialize_slots_range(professional_id: int, start_date: date, days: int = 30, slot_min: int = 60):
+    """
+    Materializa los slots de un profesional para `days` días desde start_date
+    usando un número fijo de consultas (independiente de la cantidad de días):
+    - Carga WorkSchedule, Break, ScheduleException y SlotBlock del rango
+    - Calcula en memoria el conjunto de slots deseado
+    - Lo compara con los slots existentes
+    - Crea los faltantes con bulk_create y limpia los obsoletos en bloque
+
+    Devuelve un dict {fecha: {"total", "created", "removed", "blocked"}}.
+    """
+    report, _ = _materialize_slots(professional_id, start_date, days, slot_min)
+    return report
+
+
+# ----------------------------------------------------------------------
+# 8b) Disponibilidad virtual (sin slots materializados)
+# ----------------------------------------------------------------------
+def virtual_availability_enabled() -> bool:
+    """
+    True si AGENDA_AVAILABILITY_MODE = "virtual": la disponibilidad se calcula
+    al vuelo y solo existen filas Slot para el tiempo reservado o bloqueado.
+    """
+    return getattr(settings, "AGENDA_AVAILABILITY_MODE", "materialized") == "virtual"
+
+
+def compute_virtual_slots(professional_ids, target_date: date, slot_min: int = 60) -> dict:
+    """
+    Calcula los slots libres de un día sin leer slots AVAILABLE:
+    WorkSchedule - Break - ScheduleException - SlotBlock - slots RESERVED/BLOCKED/HELD
+    (el tiempo tomado por ReservationSlot, bloqueado manualmente o retenido).
+
+    Devuelve {professional_id: [Slot sin guardar (id=None), ...]} ordenados por inicio.
+    """
+    return compute_virtual_slots_for_dates(professional_ids, [target_date], slot_min).get(target_date, {})
+
+
+def compute_virtual_slots_for_dates(professional_ids, dates, slot_min: int = 60) -> dict:
+    """
+    compute_virtual_slots para varios días con las mismas 5 consultas:
+    {fecha: {professional_id: [Slot sin guardar, ...]}}.
+    """
+    professional_ids = list(professional_ids)
+    dates = sorted(set(dates))
+    if not dates:
+        return {}
+    contexts = load_schedule_contexts(professional_ids, dates[0], dates[-1])
+
+    taken = defaultdict(lambda: defaultdict(list))
+    for prof_id, slot_date, start, end in Slot.objects.filter(
+        professional_id__in=professional_ids,
+        date__in=dates,
+        status__in=["RESERVED", "BLOCKED", "HELD"],
+    ).values_list("professional_id", "date", "start", "end"):
+        taken[slot_date][prof_id].append((start, end))
+
+    result = {}
+    for target_date in dates:
+        day = {}
+        for prof_id in professional_ids:
+            day_slots = compute_day_slots(
+                contexts[prof_id], target_date, slot_min, extra_busy=taken[target_date][prof_id]
+            )
+            if day_slots:
+                day[prof_id] = [
+                    Slot(
+                        professional_id=prof_id,
+                        date=target_date,
+                        start=start,
+                        end=end,
+                        status="AVAILABLE",
+                    )
+                    for start, end in day_slots
+                ]
+        result[target_date] = day
+    return result
+
+
+def materialize_virtual_chain(professional_id: int, start: datetime, required_min: int, slot_min: int = 60):
+    """
+    Crea (si no existen) las filas Slot de la cadena consecutiva que cubre
+    `required_min` minutos desde `start`, solo si ese tiempo está libre.
+    Devuelve la cantidad de slots de la cadena (0 si no está disponible).
+    """
+    target_date = timezone.localtime(start).date()
+    free = compute_virtual_slots([professional_id], target_date, slot_min).get(professional_id, [])
+
+    chain = []
+    cursor = start
+    for slot in free:
+        if slot.start < cursor:
+            continue
+        if slot.start > cursor:
+            break
+        chain.append(slot)
+        cursor = slot.end
+        if cursor >= start + timedelta(minutes=required_min):
+            Slot.objects.bulk_create(chain, ignore_conflicts=True)
+            return len(chain)
+    return 0
+
+
+# ----------------------------------------------------------------------
+# 8c) Cambios de estado de slots por (profesional, día)
+# ----------------------------------------------------------------------
+def notify_slots_changed(pairs):
+    """
+    Punto único a llamar cuando cambia el estado de los slots de
+    pares (professional_id, fecha): invalida la disponibilidad cacheada
+    de esos días.
+    """
+    from .availability_cache import bump_day_versions
+
+    bump_day_versions(set(pairs))
+
+
+def apply_slot_blocks(professional_id: int, target_date: date, released=()):
+    """
+    Sincroniza los slots del día con sus SlotBlock usando la misma regla de
+    superposición que el materializador (inicio < fin del bloqueo y
+    fin > inicio del bloqueo): los AVAILABLE que tocan algún bloqueo pasan a
+    BLOCKED, y los BLOCKED que tocan algún tramo de `released` (bloqueos
+    movidos o eliminados) vuelven a AVAILABLE si ya no tocan ninguno.
+    """
+    blocks = list(
+        SlotBlock.objects.filter(professional_id=professional_id, date=target_date)
+        .values_list("start", "end")
+    )
+    released = list(released)
 
-    # 5) Limpiar slots AVAILABLE que ya no son válidos (obsoletos)
-    existing_slots = Slot.objects.filter(
+    def overlaps(start, end, intervals):
+        return subtract_intervals(start, end, intervals) != [(start, end)]
+
+    to_block, to_release = [], []
+    slots = Slot.objects.filter(
         professional_id=professional_id,
         date=target_date,
-        status="AVAILABLE"
+        status__in=("AVAILABLE", "BLOCKED"),
+    ).values_list("id", "start", "end", "status")
+    for slot_id, start, end, slot_status in slots:
+        blocked = overlaps(start, end, blocks)
+        if slot_status == "AVAILABLE" and blocked:
+            to_block.append(slot_id)
+        elif slot_status == "BLOCKED" and not blocked and overlaps(start, end, released):
+            to_release.append(slot_id)
+
+    if to_block:
+        Slot.objects.filter(id__in=to_block, status="AVAILABLE").update(status="BLOCKED")
+    if to_release:
+        Slot.objects.filter(id__in=to_release, status="BLOCKED").update(status="AVAILABLE")
+    notify_slots_changed({(professional_id, target_date)})
+
+
+# ----------------------------------------------------------------------
+# 8d) Cargas diarias por profesional (ProfessionalDayLoad)
+# ----------------------------------------------------------------------
+# Reservas que cuentan como carga del profesional
+ACTIVE_RESERVATION_STATUSES = ['CONFIRMED', 'PENDING', 'IN_PROGRESS', 'RECONFIRMED', 'WAITING_CLIENT']
+
+
+def count_day_loads(pairs) -> dict:
+    """
+    Cuenta desde las reservas la carga de cada par (professional_id, fecha):
+    {(professional_id, fecha): (reservas activas, minutos reservados)}.
+    Una reserva cuenta una vez por día aunque ocupe varios slots.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+
+    reservations = defaultdict(set)
+    minutes = defaultdict(int)
+    for reservation_id, prof_id, slot_date, start, end in ReservationSlot.objects.filter(
+        professional_id__in={prof_id for prof_id, _ in pairs},
+        slot__date__in={d for _, d in pairs},
+        reservation__status__in=ACTIVE_RESERVATION_STATUSES,
+    ).values_list("reservation_id", "professional_id", "slot__date", "slot__start", "slot__end"):
+        key = (prof_id, slot_date)
+        if key in pairs:
+            reservations[key].add(reservation_id)
+            minutes[key] += int((end - start).total_seconds() // 60)
+
+    return {key: (len(reservations[key]), minutes[key]) for key in pairs}
+
+
+@transaction.atomic
+def refresh_day_loads(pairs):
+    """
+    Recalcula las cargas de los pares (professional_id, fecha) dentro de la
+    transacción de quien cambia las reservas. Las filas se bloquean ANTES
+    de contar, así dos reservas simultáneas del mismo día se serializan y
+    la segunda cuenta con la primera ya confirmada.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+
+    ProfessionalDayLoad.objects.bulk_create(
+        [ProfessionalDayLoad(professional_id=prof_id, date=d) for prof_id, d in pairs],
+        ignore_conflicts=True,
     )
+    rows = {
+        (row.professional_id, row.date): row
+        for row in ProfessionalDayLoad.objects.select_for_update().filter(
+            professional_id__in={prof_id for prof_id, _ in pairs},
+            date__in={d for _, d in pairs},
+        ).order_by("id")
+    }
+
+    now = timezone.now()
+    changed = []
+    for key, (count, booked_min) in count_day_loads(pairs).items():
+        row = rows[key]
+        if (row.reservations, row.booked_min) != (count, booked_min):
+            row.reservations, row.booked_min, row.updated_at = count, booked_min, now
+            changed.append(row)
+    if changed:
+        ProfessionalDayLoad.objects.bulk_update(changed, ["reservations", "booked_min", "updated_at"])
 
-    from django.db.models import ProtectedError
-    
-    for slot in existing_slots:
-        if slot.start not in valid_start_times:
-            try:
-                slot.delete()
-            except ProtectedError:
-                slot.status = "BLOCKED"
-                slot.save(update_fields=["status"])
 
-    return slots_created
+def get_day_loads(professional_ids, start_date: date, end_date: Optional[date] = None) -> dict:
+    """
+    Reservas activas por profesional y día desde los contadores:
+    {fecha: {professional_id: reservas}}. Los días sin fila no tienen carga.
+    """
+    loads = defaultdict(dict)
+    for prof_id, d, count in ProfessionalDayLoad.objects.filter(
+        professional_id__in=professional_ids,
+        date__range=(start_date, end_date or start_date),
+        reservations__gt=0,
+    ).values_list("professional_id", "date", "reservations"):
+        loads[d][prof_id] = count
+    return loads
+
+
+# ----------------------------------------------------------------------
+# 9) Generar slots finales y persistirlos en DB
+# ----------------------------------------------------------------------
+def generate_daily_slots(professional_id: int, target_date: date, slot_min: int = 60):
+    """
+    Genera los slots de un solo día (ver materialize_slots_range).
+    Devuelve los slots válidos del día.
+    """
+    return generate_slots_range(professional_id, target_date, days=1, slot_min=slot_min)
 
 
 # ----------------------------------------------------------------------
@@ -278,13 +582,11 @@ def cancel_reservation(reservation_id: int, cancelled_by: str = "admin"):
         # Guardar para regenerar
         refresh_targets.add((rs.professional_id, slot.date))
 
-    # Regenerar slots para asegurar que los slots liberados son válidos
-    # (por ejemplo, si el horario del profesional cambió mientras estaba reservado)
-    for prof_id, d in refresh_targets:
-        generate_daily_slots(prof_id, d)
+    notify_slots_changed(refresh_targets)
 
-    for prof_id, d in refresh_targets:
-        generate_daily_slots(prof_id, d)
+    # Regenerar (después del commit) para asegurar que los slots liberados son válidos
+    # (por ejemplo, si el horario del profesional cambió mientras estaba reservado)
+    enqueue_slot_regeneration(refresh_targets)
 
     # Enviar correo de cancelación (DESACTIVADO POR AHORA)
     # try:
@@ -299,52 +601,189 @@ def cancel_reservation(reservation_id: int, cancelled_by: str = "admin"):
 # ----------------------------------------------------------------------
 # 12) Generar slots a futuro (ej para un mes)
 # ----------------------------------------------------------------------
-def generate_slots_range(professional_id: int, start_date: date, days: int = 30):
-    out = []
-    for i in range(days):
-        d = start_date + timedelta(days=i)
-        try:
-            created = generate_daily_slots(professional_id, d)
-            out.extend(created)
-        except Exception:
-            pass
-    return out
+def generate_slots_range(professional_id: int, start_date: date, days: int = 30, slot_min: int = 60):
+    """
+    Materializa el rango completo y devuelve los slots válidos resultantes.
+    """
+    with transaction.atomic():
+        _, valid_starts = _materialize_slots(professional_id, start_date, days, slot_min)
+
+    slots = Slot.objects.filter(
+        professional_id=professional_id,
+        date__range=(start_date, start_date + timedelta(days=days - 1)),
+    ).order_by("start")
+    return [slot for slot in slots if slot.start in valid_starts]
 
 
-def filter_slots_by_service(slots, services, target_date):
+# ----------------------------------------------------------------------
+# 12a) Horizonte de materialización (marca de agua por profesional)
+# ----------------------------------------------------------------------
+def get_horizon_target(today: Optional[date] = None) -> date:
     """
-    Filtra slots que NO coincidan con los horarios permitidos
-    por TODOS los servicios solicitados.
+    Último día que debe estar materializado: SLOT_HORIZON_DAYS desde hoy.
+    """
+    today = today or timezone.localdate()
+    return today + timedelta(days=getattr(settings, "SLOT_HORIZON_DAYS", 30) - 1)
+
+
+def _advance_slot_horizon(professional_id: int, start_date: date, end_date: date):
+    """
+    Avanza la marca de agua tras materializar [start_date, end_date].
+    Solo avanza si el rango es contiguo con lo ya materializado, para que
+    la marca nunca salte por encima de días sin generar.
+    """
+    today = timezone.localdate()
+    current = (
+        SlotHorizon.objects.filter(professional_id=professional_id)
+        .values_list("materialized_until", flat=True)
+        .first()
+    )
+    if current is None:
+        if start_date > today:
+            return
+        SlotHorizon.objects.bulk_create(
+            [SlotHorizon(professional_id=professional_id, materialized_until=end_date)],
+            ignore_conflicts=True,
+        )
+        return
+
+    # Los días pasados no cuentan como hueco
+    if start_date > max(current, today - timedelta(days=1)) + timedelta(days=1) or end_date <= current:
+        return
+    SlotHorizon.objects.filter(
+        professional_id=professional_id,
+        materialized_until__lt=end_date,
+    ).update(materialized_until=end_date, updated_at=timezone.now())
 
-    USA: ServiceTimeRule (no ServiceAllowedTime)
+
+def extend_slot_horizon(professional_id: int, target: Optional[date] = None) -> int:
+    """
+    Materializa solo los días que faltan entre la marca de agua y `target`
+    (por defecto SLOT_HORIZON_DAYS desde hoy). Idempotente: si el horizonte
+    ya está al día no toca la BD más allá de leer la marca.
+    Devuelve la cantidad de días materializados.
     """
-    from apps.catalog.models import ServiceTimeRule
+    today = timezone.localdate()
+    target = target or get_horizon_target(today)
+
+    current = (
+        SlotHorizon.objects.filter(professional_id=professional_id)
+        .values_list("materialized_until", flat=True)
+        .first()
+    )
+    start = max(today, current + timedelta(days=1)) if current else today
+    if start > target:
+        return 0
+
+    days = (target - start).days + 1
+    materialize_slots_range(professional_id, start, days)
+    return days
+
+
+# ----------------------------------------------------------------------
+# 12b) Cola de regeneración incremental (días "sucios")
+# ----------------------------------------------------------------------
+def get_regeneration_horizon(professional_id: int) -> date:
+    """
+    Último día hasta el cual se regeneran slots cuando cambia un horario semanal:
+    la marca de agua del profesional, o SLOT_HORIZON_DAYS desde hoy.
+    """
+    default = get_horizon_target()
+    last = (
+        SlotHorizon.objects.filter(professional_id=professional_id)
+        .values_list("materialized_until", flat=True)
+        .first()
+    )
+    return max(last, default) if last else default
+
+
+def enqueue_slot_regeneration(targets):
+    """
+    Encola pares (professional_id, fecha) para regenerar sus slots.
+    Los días pasados se ignoran. El procesamiento ocurre después del commit
+    de la transacción actual (o de inmediato si no hay transacción).
+    """
+    if virtual_availability_enabled():
+        # Sin slots AVAILABLE materializados no hay nada que regenerar,
+        # pero la disponibilidad calculada de esos días cambió
+        notify_slots_changed(targets)
+        return
+
+    today = timezone.localdate()
+    targets = {(prof_id, d) for prof_id, d in targets if d >= today}
+    if not targets:
+        return
+
+    DirtySlotDate.objects.bulk_create(
+        [DirtySlotDate(professional_id=prof_id, date=d) for prof_id, d in targets],
+        ignore_conflicts=True,
+    )
+
+    professional_ids = {prof_id for prof_id, _ in targets}
+    transaction.on_commit(lambda: process_dirty_slot_dates(professional_ids))
 
-    weekday = target_date.weekday()
 
-    valid_slots = []
+def process_dirty_slot_dates(professional_ids=None, limit: Optional[int] = None) -> int:
+    """
+    Regenera los días encolados en DirtySlotDate.
+    Agrupa días consecutivos del mismo profesional en un solo
+    materialize_slots_range. Devuelve la cantidad de días regenerados.
+    """
+    today = timezone.localdate()
 
-    for start, end in slots:
-        start_str = start.strftime("%H:%M")
+    with transaction.atomic():
+        qs = DirtySlotDate.objects.select_for_update(skip_locked=True).order_by("professional_id", "date")
+        if professional_ids is not None:
+            qs = qs.filter(professional_id__in=professional_ids)
+        if limit:
+            qs = qs[:limit]
+        rows = list(qs.values_list("id", "professional_id", "date"))
+        if not rows:
+            return 0
+
+        # Coalescer en rangos consecutivos por profesional
+        runs = []  # [professional_id, fecha inicio, días, ids]
+        for row_id, prof_id, d in rows:
+            if d < today:
+                runs.append([prof_id, None, 0, [row_id]])
+                continue
+            last = runs[-1] if runs else None
+            if last and last[0] == prof_id and last[1] and last[1] + timedelta(days=last[2]) == d:
+                last[2] += 1
+                last[3].append(row_id)
+            else:
+                runs.append([prof_id, d, 1, [row_id]])
 
-        ok = True
-        for service_id in services:
+        done_ids = []
+        regenerated = 0
+        for prof_id, start, days, ids in runs:
+            if start is None:
+                done_ids.extend(ids)
+                continue
             try:
-                time_rule = ServiceTimeRule.objects.get(
-                    service_id=service_id,
-                    weekday=weekday
-                )
-                if start_str not in time_rule.allowed_times:
-                    ok = False
-                    break
-            except ServiceTimeRule.DoesNotExist:
-                # Si el servicio no define horarios → se permite cualquier hora
-                pass
+                with transaction.atomic():
+                    _materialize_slots(prof_id, start, days)
+            except Exception:
+                logger.exception("Error regenerando slots de %s desde %s (%s días)", prof_id, start, days)
+                continue
+            done_ids.extend(ids)
+            regenerated += days
 
-        if ok:
-            valid_slots.append((start, end))
+        DirtySlotDate.objects.filter(id__in=done_ids).delete()
 
-    return valid_slots
+    return regenerated
+
+
+def filter_slots_by_service(slots, services, target_date):
+    """
+    Filtra slots que NO coincidan con los horarios permitidos
+    por TODOS los servicios solicitados.
+
+    USA: índice compilado de ServiceTimeRule (ver time_rules); un servicio
+    sin regla para el día permite cualquier hora.
+    """
+    mask = time_rules.allowed_start_mask(services, target_date.weekday())
+    return [(start, end) for start, end in slots if time_rules.is_allowed(mask, start)]
 
 
 # Reemplazar la función compute_aggregated_availability en agenda/services.py
@@ -356,17 +795,21 @@ class AvailabilityCalculator:
     Calcula disponibilidad consolidada para múltiples servicios.
     Refactorizado de función monolítica para mejorar legibilidad y mantenibilidad.
     """
-    def __init__(self, service_ids, date_str):
+    def __init__(self, service_ids, date_str, mode=None):
         self.service_ids = service_ids
         self.date_str = date_str
+        # "materialized" (slots AVAILABLE en BD) o "virtual" (calculado desde horarios)
+        self.virtual = virtual_availability_enabled() if mode is None else mode == "virtual"
         self.date = datetime.strptime(date_str, "%Y-%m-%d").date()
         self.weekday = self.date.weekday()
         self.local_tz = pytz.timezone(getattr(settings, 'TIME_ZONE', 'America/Santiago'))
         
         # State
         self.qualified_professionals = set()
-        self.valid_start_times = None # None significa "cualquier hora"
+        self.durations = {}  # professional_id -> {service_id: minutos}
+        self.valid_start_times = None # Máscara de minutos permitidos; None significa "cualquier hora"
         self.slots_by_prof = {}
+        self.run_ends = {}
         self.filtered_slots = []
         self.daily_loads = {} # Para almacenar cargas diarias de profesionales
 
@@ -378,6 +821,13 @@ class AvailabilityCalculator:
         if not self._find_qualified_professionals():
             return []
 
+        return self.compute_for_qualified()
+
+    def compute_for_qualified(self):
+        """
+        Resto del cálculo una vez resueltos los profesionales calificados
+        (permite a la caché sellar versiones entre ambos pasos).
+        """
         # 2. Determinar horas de inicio permitidas comunes (intersección de reglas)
         if not self._determine_common_time_rules():
             return []
@@ -394,73 +844,33 @@ class AvailabilityCalculator:
         # 6. Agrupar y formatear resultados
         return self._format_results()
 
-    def _find_qualified_professionals(self):
+    def _find_qualified_professionals(self, matrix=None):
         """
-        Identifica profesionales asignados a TODOS los servicios solicitados.
+        Identifica profesionales activos asignados a TODOS los servicios solicitados,
+        con la duración efectiva de cada servicio (matriz de habilidades).
         """
-        # Comenzar con profesionales para el primer servicio
-        first_service_id = self.service_ids[0]
-        candidates = set(
-            ProfessionalService.objects.filter(
-                service_id=first_service_id,
-                active=True
-            ).values_list('professional_id', flat=True)
-        )
-
-        # Intersectar con profesionales para los servicios restantes
-        for service_id in self.service_ids[1:]:
-            next_candidates = set(
-                ProfessionalService.objects.filter(
-                    service_id=service_id,
-                    active=True
-                ).values_list('professional_id', flat=True)
-            )
-            candidates &= next_candidates
-            
-            if not candidates:
-                return False
+        self.durations = skills.qualified_durations(self.service_ids, matrix)
+        self.qualified_professionals = set(self.durations)
+        return bool(self.qualified_professionals)
 
-        self.qualified_professionals = candidates
-        return True
-
-    def _determine_common_time_rules(self):
+    def _determine_common_time_rules(self, rules_index=None):
         """
         Calcula la intersección de horas de inicio permitidas para todos los servicios.
         Devuelve False si la intersección está vacía (imposible reservar).
         """
-        from apps.catalog.models import ServiceTimeRule
-
-        allowed_times_sets = []
-        for service_id in self.service_ids:
-            try:
-                time_rule = ServiceTimeRule.objects.get(
-                    service_id=service_id,
-                    weekday=self.weekday
-                )
-                allowed_times_sets.append(set(time_rule.allowed_times))
-            except ServiceTimeRule.DoesNotExist:
-                # Sin restricción para este servicio
-                pass
-
-        if allowed_times_sets:
-            # Intersectar todos los conjuntos
-            common_times = allowed_times_sets[0]
-            for time_set in allowed_times_sets[1:]:
-                common_times &= time_set
-            
-            if not common_times:
-                return False # Sin horas comunes
-            
-            self.valid_start_times = common_times
-        else:
-            self.valid_start_times = None # Cualquier hora permitida
-            
-        return True
+        # AND de las máscaras del índice compilado
+        self.valid_start_times = time_rules.allowed_start_mask(self.service_ids, self.weekday, rules_index)
+        return self.valid_start_times is None or bool(self.valid_start_times)
 
     def _fetch_candidate_slots(self):
         """
         Obtiene slots DISPONIBLES para profesionales calificados en la fecha objetivo.
+        En modo virtual se calculan desde horarios y reservas, sin filas AVAILABLE.
         """
+        if self.virtual:
+            self.slots_by_prof = compute_virtual_slots(self.qualified_professionals, self.date)
+            return
+
         slots = (
             Slot.objects.filter(
                 date=self.date,
@@ -468,7 +878,6 @@ class AvailabilityCalculator:
                 professional_id__in=self.qualified_professionals
             )
             .order_by("start")
-            .select_related("professional")
         )
 
         # Agrupar por profesional
@@ -481,44 +890,40 @@ class AvailabilityCalculator:
         """
         Verifica si existen slots consecutivos para cubrir la duración total requerida.
         """
-        for prof_id, prof_slots in self.slots_by_prof.items():
-            total_duration = self._calculate_total_duration_for_prof(prof_id)
-            
+        for prof_slots in self.slots_by_prof.values():
             # Ordenar slots por tiempo (debería estar ordenado por BD, pero seguridad primero)
             prof_slots.sort(key=lambda s: s.start)
+        self._load_run_ends()
+
+        for prof_id, prof_slots in self.slots_by_prof.items():
+            total_duration = self._calculate_total_duration_for_prof(prof_id)
 
-            for i, start_slot in enumerate(prof_slots):
+            for index, start_slot in enumerate(prof_slots):
                 # 1. Verificar Regla de Tiempo
                 if not self._check_time_rule(start_slot):
                     continue
 
                 # 2. Verificar Duración y Continuidad
-                if self._check_continuity(prof_slots, i, total_duration):
+                if self._check_continuity(prof_id, index, total_duration):
                     self.filtered_slots.append(start_slot)
 
+    def _load_run_ends(self):
+        """
+        Tabla de rachas de cada profesional (ver intervals.run_ends), desde
+        los bordes de los slots ya cargados, sin consultas adicionales.
+        """
+        self.run_ends = {
+            prof_id: run_ends([(slot.start, slot.end) for slot in prof_slots])
+            for prof_id, prof_slots in self.slots_by_prof.items()
+        }
+
     def _calculate_total_duration_for_prof(self, prof_id):
         """
-        Calcula la duración total para los servicios solicitados para un profesional específico.
+        Calcula la duración total para los servicios solicitados para un profesional específico,
+        desde la matriz cargada en _find_qualified_professionals (sin consultas).
         """
-        total = 0
-        # Podríamos optimizar esto pre-obteniendo ProfessionalServices en __init__ 
-        # pero por ahora confiamos en que ya filtramos profesionales.
-        # Para evitar N+1 dentro de este bucle, podríamos obtener todos los ProfessionalServices relevantes una vez.
-        # Pero mantengámoslo simple para este paso de refactorización o usemos la lógica optimizada de compute_total_duration?
-        # Mejor: obtener todos los PS relevantes para estos pros calificados y servicios.
-        # Por ahora, dejemos la consulta pero tomemos nota.
-        
-        for s_id in self.service_ids:
-            try:
-                ps = ProfessionalService.objects.get(
-                    service_id=s_id,
-                    professional_id=prof_id,
-                    active=True
-                )
-                total += (ps.duration_override_min or ps.service.duration_min)
-            except ProfessionalService.DoesNotExist:
-                continue
-        return total
+        durations = self.durations.get(prof_id, {})
+        return sum(durations.get(s_id, 0) for s_id in self.service_ids)
 
     def _check_time_rule(self, slot):
         if self.valid_start_times is None:
@@ -528,67 +933,29 @@ class AvailabilityCalculator:
         if slot_local.tzinfo is not None:
             slot_local = slot_local.astimezone(self.local_tz)
         
-        start_str = slot_local.strftime("%H:%M")
-        return start_str in self.valid_start_times
+        return time_rules.is_allowed(self.valid_start_times, slot_local)
 
-    def _check_continuity(self, slots, start_index, required_duration):
-        start_slot = slots[start_index]
-        required_end_time = start_slot.start + timedelta(minutes=required_duration)
-        current_check_start = start_slot.start
-        
-        for subsequent_slot in slots[start_index:]:
-            if subsequent_slot.start > current_check_start:
-                return False # Brecha encontrada
-            
-            current_check_start = subsequent_slot.end
-            if current_check_start >= required_end_time:
-                return True
-                
-        return False
+    def _check_continuity(self, prof_id, index, required_duration):
+        """
+        La racha que empieza en el slot `index` del profesional debe cubrir
+        la duración: una consulta O(1) a su tabla de rachas.
+        """
+        start_slot = self.slots_by_prof[prof_id][index]
+        end = self.run_ends[prof_id][index]
+        return end >= start_slot.start + timedelta(minutes=required_duration)
 
     def _calculate_daily_loads(self):
         """
-        Calcula el número de reservas activas para cada profesional calificado en la fecha objetivo.
+        Número de reservas activas de cada profesional calificado en la fecha
+        objetivo, leído de los contadores de ProfessionalDayLoad.
         Almacena el resultado en self.daily_loads.
         """
-        from django.db.models import Count, Q
-        
         self.daily_loads = {}
-        
+
         if not self.qualified_professionals:
             return
 
-        # Contar reservas que tienen al menos un slot en esta fecha
-        # Filtramos por reservation_slots__slot__date=self.date
-        # Y status en [CONFIRMED, PENDING, IN_PROGRESS, RECONFIRMED, WAITING_CLIENT]
-        
-        active_statuses = ['CONFIRMED', 'PENDING', 'IN_PROGRESS', 'RECONFIRMED', 'WAITING_CLIENT']
-        
-        # Consultamos objetos Reservation, filtramos por fecha y estado, y agregamos por profesional
-        # Nota: Una reserva tiene múltiples slots. Queremos contar RESERVAS, no slots.
-        # Pero necesitamos agrupar por profesional.
-        # Dado que una reserva está vinculada a un profesional vía ReservationSlot, y todos los slots de una reserva
-        # suelen ser con el mismo profesional (impuesto por nuestra lógica), podemos agrupar por reservation_slots__professional.
-        
-        # Sin embargo, ¿una reserva podría abarcar múltiples días? 
-        # El requisito dice "reservas asignadas en la fecha solicitada".
-        # Si una reserva comienza ayer y termina mañana, ¿cuenta?
-        # Usualmente nos importa la fecha de inicio.
-        # Mantengámonos en "reservas que tienen slots en esta fecha".
-        
-        counts = (
-            Reservation.objects
-            .filter(
-                reservation_slots__slot__date=self.date,
-                reservation_slots__professional_id__in=self.qualified_professionals,
-                status__in=active_statuses
-            )
-            .values('reservation_slots__professional_id')
-            .annotate(count=Count('id', distinct=True))
-        )
-        
-        for entry in counts:
-            self.daily_loads[entry['reservation_slots__professional_id']] = entry['count']
+        self.daily_loads = get_day_loads(self.qualified_professionals, self.date).get(self.date, {})
 
     def _format_results(self):
         slots_by_time = {}
@@ -633,36 +1000,201 @@ def compute_aggregated_availability(service_ids, date_str):
     import pytz
     from django.conf import settings
     
-    calculator = AvailabilityCalculator(service_ids, date_str)
-    return calculator.compute()
+    from .availability_cache import get_cached_availability
 
+    return get_cached_availability(
+        service_ids,
+        date_str,
+        lambda: AvailabilityCalculator(service_ids, date_str),
+    )
 
-# ----------------------------------------------------------------------
-# 15) Confirmar reserva por token (Lógica de Negocio)
-# ----------------------------------------------------------------------
-@transaction.atomic
-def confirm_reservation_by_token(token: str):
+
+def compute_availability_batch(queries):
     """
-    Valida token y confirma reserva.
-    Devuelve (éxito, mensaje, reservation_id)
+    Disponibilidad agregada de varias consultas [(service_ids, "YYYY-MM-DD")]
+    en el mismo orden (mismo formato que AvailabilityCalculator.compute).
+    Matriz de habilidades, reglas horarias, slots y cargas de todos los
+    días y profesionales involucrados se cargan una sola vez y se reparten
+    entre las consultas.
     """
-    from .models import Reservation, StatusHistory
-    from django.utils import timezone
-    
-    try:
-        # Usar select_for_update para bloquear la fila y prevenir condiciones de carrera
-        reservation = Reservation.objects.select_for_update().get(confirmation_token=token)
-    except Reservation.DoesNotExist:
-        return False, "Link de confirmación inválido o expirado.", None
-    
-    # Verificar si el token ha expirado
-    if reservation.token_expires_at and reservation.token_expires_at < timezone.now():
-        return False, "Este link de confirmación ha expirado. Por favor contacta al administrador.", None
-    
-    # Verificar si ya está confirmada/reconfirmada
-    if reservation.status in ["CONFIRMED", "RECONFIRMED"]:
-        return True, "Esta reserva ya fue confirmada anteriormente.", reservation.id
-        
+    calculators = [AvailabilityCalculator(service_ids, date_str) for service_ids, date_str in queries]
+
+    # Matriz y reglas se leen una vez para todo el lote
+    requested = {service_id for calc in calculators for service_id in calc.service_ids}
+    matrix = skills.get_matrix(requested)
+    rules_index = time_rules.get_index(requested)
+    pending = []
+    for calc in calculators:
+        if (
+            calc.service_ids
+            and calc._find_qualified_professionals(matrix)
+            and calc._determine_common_time_rules(rules_index)
+        ):
+            pending.append(calc)
+    if not pending:
+        return [[] for _ in calculators]
+
+    professionals = set().union(*(calc.qualified_professionals for calc in pending))
+    dates = {calc.date for calc in pending}
+
+    if pending[0].virtual:
+        slots_by_date = compute_virtual_slots_for_dates(professionals, dates)
+    else:
+        slots_by_date = defaultdict(lambda: defaultdict(list))
+        for slot in Slot.objects.filter(
+            date__in=dates,
+            status="AVAILABLE",
+            professional_id__in=professionals,
+        ).order_by("start"):
+            slots_by_date[slot.date][slot.professional_id].append(slot)
+
+    loads_by_date = get_day_loads(professionals, min(dates), max(dates))
+
+    for calc in pending:
+        day_slots = slots_by_date.get(calc.date, {})
+        calc.slots_by_prof = {
+            prof_id: list(day_slots[prof_id]) for prof_id in calc.qualified_professionals if prof_id in day_slots
+        }
+        calc._filter_slots_by_duration_and_continuity()
+        calc.daily_loads = {
+            prof_id: count
+            for prof_id, count in loads_by_date.get(calc.date, {}).items()
+            if prof_id in calc.qualified_professionals
+        }
+
+    return [calc._format_results() if calc in pending else [] for calc in calculators]
+
+
+def compute_aggregated_availability_batch(queries):
+    """
+    Envoltorio con caché para compute_availability_batch: las consultas
+    vigentes salen de la caché y solo el resto se calcula (en un lote).
+    """
+    from .availability_cache import get_cached_availability_batch
+
+    return get_cached_availability_batch(queries, compute_availability_batch)
+
+
+def compute_availability_range(service_ids, start_date: date, end_date: date,
+                               limit: Optional[int] = None, chunk_days: int = 7,
+                               loads: bool = True):
+    """
+    Disponibilidad agregada (mismo formato que AvailabilityCalculator.compute)
+    para cada día entre start_date y end_date, en lotes de `chunk_days` días:
+    - Profesionales y duraciones salen de la matriz de habilidades y las
+      reglas horarias del índice compilado (una lectura para todo el rango)
+    - Slots y cargas diarias (ProfessionalDayLoad) se cargan con una consulta por lote
+    - Con `limit`, se detiene apenas junta `limit` horarios (openings)
+    - Con loads=False no se consultan cargas (los profesionales de cada
+      horario quedan ordenados solo por ID)
+
+    Devuelve (lista de {"date", "slots"}, completo) donde completo indica si
+    se recorrió toda la ventana.
+    """
+    base = AvailabilityCalculator(service_ids, start_date.isoformat())
+    if not service_ids or not base._find_qualified_professionals():
+        return [], True
+
+    rules_index = time_rules.get_index(service_ids)
+    rules = {weekday: time_rules.allowed_start_mask(service_ids, weekday, rules_index) for weekday in range(7)}
+
+    days = []
+    openings = 0
+    chunk_start = start_date
+
+    while chunk_start <= end_date:
+        chunk_end = min(end_date, chunk_start + timedelta(days=chunk_days - 1))
+        chunk_dates = [chunk_start + timedelta(days=i) for i in range((chunk_end - chunk_start).days + 1)]
+
+        if base.virtual:
+            slots_by_date = compute_virtual_slots_for_dates(base.qualified_professionals, chunk_dates)
+        else:
+            slots_by_date = defaultdict(lambda: defaultdict(list))
+            for slot in Slot.objects.filter(
+                date__range=(chunk_start, chunk_end),
+                status="AVAILABLE",
+                professional_id__in=base.qualified_professionals,
+            ).order_by("start"):
+                slots_by_date[slot.date][slot.professional_id].append(slot)
+
+        loads_by_date = get_day_loads(base.qualified_professionals, chunk_start, chunk_end) if loads else {}
+
+        for d in chunk_dates:
+            day = AvailabilityCalculator(service_ids, d.isoformat(), mode="virtual" if base.virtual else "materialized")
+            day.qualified_professionals = base.qualified_professionals
+            day.durations = base.durations
+            day.valid_start_times = rules[d.weekday()]
+            day.daily_loads = loads_by_date.get(d, {})
+
+            slots = []
+            if day.valid_start_times is None or day.valid_start_times:
+                day.slots_by_prof = dict(slots_by_date.get(d, {}))
+                day._filter_slots_by_duration_and_continuity()
+                slots = day._format_results()
+
+            if limit is not None:
+                slots = slots[:limit - openings]
+            days.append({"date": d, "slots": slots})
+            openings += len(slots)
+            if limit is not None and openings >= limit:
+                return days, d == end_date
+
+        chunk_start = chunk_end + timedelta(days=1)
+
+    return days, True
+
+
+def compute_month_heatmap(service_ids, month_start: date):
+    """
+    Horarios disponibles (openings) por día del mes de `month_start` para
+    el conjunto de servicios: [{"date", "openings"}] con todos los días.
+    Cada conteo coincide con lo que devuelve la disponibilidad de ese día;
+    el mes se calcula como un solo lote (una consulta de slots) y se cachea
+    hasta que cambie la versión de algún (profesional, fecha) involucrado.
+    """
+    import calendar
+    from .availability_cache import get_cached_month
+
+    first = month_start.replace(day=1)
+    last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+
+    def compute():
+        days, _ = compute_availability_range(service_ids, first, last, chunk_days=last.day, loads=False)
+        openings = {day["date"]: len(day["slots"]) for day in days}
+        return [
+            {"date": d, "openings": openings.get(d, 0)}
+            for d in (first + timedelta(days=i) for i in range(last.day))
+        ]
+
+    return get_cached_month(service_ids, first, last, compute)
+
+
+# ----------------------------------------------------------------------
+# 15) Confirmar reserva por token (Lógica de Negocio)
+# ----------------------------------------------------------------------
+@transaction.atomic
+def confirm_reservation_by_token(token: str):
+    """
+    Valida token y confirma reserva.
+    Devuelve (éxito, mensaje, reservation_id)
+    """
+    from .models import Reservation, StatusHistory
+    from django.utils import timezone
+    
+    try:
+        # Usar select_for_update para bloquear la fila y prevenir condiciones de carrera
+        reservation = Reservation.objects.select_for_update().get(confirmation_token=token)
+    except Reservation.DoesNotExist:
+        return False, "Link de confirmación inválido o expirado.", None
+    
+    # Verificar si el token ha expirado
+    if reservation.token_expires_at and reservation.token_expires_at < timezone.now():
+        return False, "Este link de confirmación ha expirado. Por favor contacta al administrador.", None
+    
+    # Verificar si ya está confirmada/reconfirmada
+    if reservation.status in ["CONFIRMED", "RECONFIRMED"]:
+        return True, "Esta reserva ya fue confirmada anteriormente.", reservation.id
+        
     # Verificar si está cancelada (ej. expirada)
     if reservation.status == "CANCELLED":
         return False, "Esta reserva ha sido cancelada o expiró. Por favor contacta al administrador.", None
@@ -686,182 +1218,579 @@ def confirm_reservation_by_token(token: str):
     return True, "¡Reserva confirmada exitosamente!", reservation.id
 
 
+# ----------------------------------------------------------------------
+# 16a) Núcleo de reserva: reclamar y reservar una cadena de slots
+# ----------------------------------------------------------------------
+BOOKING_STRATEGIES = ("pessimistic", "optimistic")
+
+
+class SlotChainConflict(Exception):
+    """Otra transacción tomó parte de la cadena entre la lectura y el UPDATE."""
+
+
+def booking_strategy() -> str:
+    return getattr(settings, "AGENDA_BOOKING_STRATEGY", "pessimistic")
+
+
+def _read_slot_chain(professional_id: int, start: datetime, required_min: int, lock: bool,
+                     from_status: str = "AVAILABLE"):
+    """
+    Lee con una sola consulta (ordenada por inicio; con FOR UPDATE si
+    `lock`) los slots del profesional que empiezan entre `start` y el fin
+    requerido, y verifica en memoria que formen una cadena contigua en
+    estado `from_status` que cubra `required_min` minutos.
+    """
+    from rest_framework.exceptions import ValidationError
+
+    end = start + timedelta(minutes=required_min)
+    slots = Slot.objects.filter(professional_id=professional_id, start__gte=start, start__lt=end).order_by("start")
+    slots = list(slots.select_for_update() if lock else slots)
+
+    if not slots or slots[0].start != start:
+        raise ValidationError({"slot_id": "Slot not found."})
+
+    first = slots[0]
+    if first.status != from_status:
+        raise ValidationError({"slot_id": "Slot is not available."})
+
+    slot_duration_min = int((first.end - first.start).total_seconds() // 60)
+    if slot_duration_min <= 0:
+        raise ValidationError({"slot_id": "Slot base has zero duration."})
+
+    chain = [first]
+    cursor = first.end
+    for slot in slots[1:]:
+        if cursor >= end or slot.start != cursor or slot.status != from_status:
+            break
+        chain.append(slot)
+        cursor = slot.end
+
+    if cursor < end:
+        slots_needed = max(1, (required_min + slot_duration_min - 1) // slot_duration_min)
+        raise ValidationError(
+            {
+                "services": (
+                    f"Not enough consecutive slots. Required {slots_needed}, "
+                    f"found {len(chain)}. Total minutes required: {required_min}."
+                )
+            }
+        )
+    return chain
+
+
+def _flip_slot_chain(chain, from_status: str = "AVAILABLE", to_status: str = "RESERVED"):
+    """UPDATE ... SET status=`to_status` WHERE id IN (...) AND status=`from_status`."""
+    slot_ids = [s.id for s in chain]
+    updated = Slot.objects.filter(id__in=slot_ids, status=from_status).update(status=to_status)
+    if updated != len(slot_ids):
+        raise SlotChainConflict()
+    for s in chain:
+        s.status = to_status
+    return chain
+
+
+def claim_slot_chain(professional_id: int, start: datetime, required_min: int, strategy: Optional[str] = None,
+                     from_status: str = "AVAILABLE", to_status: str = "RESERVED"):
+    """
+    Reclama (pasa de `from_status` a `to_status`, por defecto de AVAILABLE
+    a RESERVED) la cadena de slots que cubre `required_min` minutos desde
+    `start`. Debe llamarse dentro de una transacción.
+    - pessimistic: SELECT ... FOR UPDATE del rango y luego el UPDATE.
+    - optimistic: lectura sin candados y UPDATE condicionado a que sigan
+      en `from_status`; si otro ganó parte de la cadena se deshace
+      (savepoint) y se reintenta hasta AGENDA_BOOKING_OPTIMISTIC_RETRIES veces. Un
+      reintento que ya ve la cadena tomada falla como no disponible.
+    Devuelve los slots o levanta ValidationError.
+    """
+    from rest_framework.exceptions import ValidationError
+
+    strategy = strategy or booking_strategy()
+    if strategy not in BOOKING_STRATEGIES:
+        raise ValueError(f"Estrategia de reserva desconocida: {strategy}")
+
+    if strategy == "pessimistic":
+        try:
+            chain = _read_slot_chain(professional_id, start, required_min, lock=True, from_status=from_status)
+            return _flip_slot_chain(chain, from_status, to_status)
+        except SlotChainConflict:
+            # No debería pasar con las filas bloqueadas
+            raise ValidationError({"slot_id": "Slot is not available."})
+
+    retries = getattr(settings, "AGENDA_BOOKING_OPTIMISTIC_RETRIES", 3)
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                chain = _read_slot_chain(professional_id, start, required_min, lock=False, from_status=from_status)
+                return _flip_slot_chain(chain, from_status, to_status)
+        except SlotChainConflict:
+            logger.info(
+                "Conflicto reclamando slots de %s desde %s (intento %s)", professional_id, start, attempt + 1
+            )
+    raise ValidationError({"slot_id": "Slot is not available."})
+
+
+def attach_slot_chain(reservation, professional_id: int, slots, strategy: Optional[str] = None):
+    """
+    Vincula la cadena ya reclamada a la reserva con un bulk_create e
+    invalida la caché de los días tocados. Las cargas diarias se recalculan
+    en la transacción (pessimistic) o al confirmarla (optimistic): así la
+    estrategia optimista no toma el candado de ProfessionalDayLoad y dos
+    reservas del mismo profesional y día no se serializan en esa fila.
+    """
+    ReservationSlot.objects.bulk_create([
+        ReservationSlot(reservation=reservation, slot=s, professional_id=professional_id)
+        for s in slots
+    ])
+
+    pairs = {(professional_id, s.date) for s in slots}
+    notify_slots_changed(pairs)
+    if (strategy or booking_strategy()) == "optimistic":
+        # Recuento en su propia transacción corta, después del commit: hasta
+        # entonces la carga muestra el valor anterior (solo afecta el orden)
+        transaction.on_commit(lambda: refresh_day_loads(pairs), robust=True)
+    else:
+        refresh_day_loads(pairs)
+
+
+def required_minutes(professional_id: int, services_in, matrix=None) -> int:
+    """
+    Valida que todos los servicios apunten a `professional_id` y devuelve
+    la duración total de la cadena a reservar (desde la BD, o desde
+    `matrix` si ya se cargó con skills.load_matrix).
+    """
+    from rest_framework.exceptions import ValidationError
+
+    for s in services_in:
+        if s["professional_id"] != professional_id:
+            raise ValidationError(
+                {"services": "All services must be assigned to the selected professional."}
+            )
+
+    try:
+        return compute_total_duration(services_in, matrix)
+    except ProfessionalService.DoesNotExist:
+        raise ValidationError(
+            {"services": "One or more services are not assigned to the professional or are inactive."}
+        )
+
+
+def resolve_chain_start(professional_id: int, required_min: int, slot_id=None, start=None) -> datetime:
+    """
+    Inicio de la cadena pedida: el del slot `slot_id` o `start`. En modo
+    virtual se crean las filas Slot de la cadena si ese tiempo está libre;
+    en modo materializado `start` debe ser un slot AVAILABLE que ya exista
+    (nunca se crean slots que el materializador no generó).
+    """
+    from rest_framework.exceptions import ValidationError
+
+    if not slot_id:
+        if virtual_availability_enabled():
+            available = start and materialize_virtual_chain(professional_id, start, required_min)
+        else:
+            available = start and Slot.objects.filter(
+                professional_id=professional_id, start=start, status="AVAILABLE"
+            ).exists()
+        if not available:
+            raise ValidationError({"start": "Selected time is not available."})
+        return start
+
+    start = (
+        Slot.objects.filter(pk=slot_id, professional_id=professional_id)
+        .values_list("start", flat=True)
+        .first()
+    )
+    if start is None:
+        raise ValidationError({"slot_id": "Slot not found."})
+    return start
+
+
+# ----------------------------------------------------------------------
+# 16b) Retención temporal de slots durante el checkout (SlotHold)
+# ----------------------------------------------------------------------
+def slot_hold_ttl() -> int:
+    return getattr(settings, "AGENDA_SLOT_HOLD_TTL_SECONDS", 300)
+
+
+@transaction.atomic
+def hold_slot_chain(professional_id: int, services_in, slot_id=None, start=None,
+                    strategy: Optional[str] = None, holder: str = "") -> SlotHold:
+    """
+    Retiene (AVAILABLE -> HELD) la cadena que cubre los servicios pedidos
+    por AGENDA_SLOT_HOLD_TTL_SECONDS. La disponibilidad deja de ofrecerla
+    de inmediato y la reserva la canjea con el token sin volver a buscar.
+    Con `holder` (email del cliente) el hold nuevo reemplaza al anterior
+    del mismo cliente: nunca tiene más de una cadena retenida.
+    """
+    from django.db import IntegrityError
+    from rest_framework.exceptions import ValidationError
+
+    required_min = required_minutes(professional_id, services_in)
+
+    # Holds vencidos de este profesional: liberar antes de leer la cadena
+    release_expired_holds([professional_id])
+
+    if holder:
+        previous = list(
+            SlotHold.objects.select_for_update()
+            .filter(holder=holder)
+            .values_list("id", "professional_id", "date", "start", "end")
+        )
+        if previous:
+            _release_holds(previous)
+
+    start = resolve_chain_start(professional_id, required_min, slot_id, start)
+    chain = claim_slot_chain(professional_id, start, required_min, strategy, to_status="HELD")
+
+    try:
+        with transaction.atomic():
+            hold = SlotHold.objects.create(
+                professional_id=professional_id,
+                date=chain[0].date,
+                start=chain[0].start,
+                end=chain[-1].end,
+                expires_at=timezone.now() + timedelta(seconds=slot_hold_ttl()),
+                holder=holder,
+            )
+    except IntegrityError:
+        # Otra solicitud del mismo cliente creó su hold en paralelo
+        raise ValidationError({"client": "This client already has an active hold."})
+    notify_slots_changed({(professional_id, s.date) for s in chain})
+    return hold
+
+
+def redeem_slot_hold(token, professional_id: int, required_min: int, strategy: Optional[str] = None):
+    """
+    Canjea un hold dentro de la transacción de la reserva: pasa a RESERVED
+    la parte de la cadena retenida que cubre `required_min` y devuelve el
+    resto a AVAILABLE. Un hold vencido que el reaper aún no liberó sigue
+    siendo válido (nadie más pudo tomar sus slots).
+    """
+    from rest_framework.exceptions import ValidationError
+
+    hold = (
+        SlotHold.objects.select_for_update()
+        .filter(token=token, professional_id=professional_id)
+        .first()
+    )
+    if hold is None:
+        raise ValidationError({"hold_token": "Hold not found or expired."})
+    if hold.start + timedelta(minutes=required_min) > hold.end:
+        raise ValidationError({"hold_token": "Hold does not cover the selected services."})
+
+    chain = claim_slot_chain(professional_id, hold.start, required_min, strategy, from_status="HELD")
+    Slot.objects.filter(
+        professional_id=professional_id,
+        start__gte=chain[-1].end,
+        start__lt=hold.end,
+        status="HELD",
+    ).update(status="AVAILABLE")
+    hold.delete()
+    return chain
+
+
+def _release_holds(holds):
+    """Devuelve a AVAILABLE los slots de `holds` (id, profesional, fecha, inicio, fin) y los borra."""
+    from django.db.models import Q
+
+    slot_filter = Q()
+    for _, prof_id, _, start, end in holds:
+        slot_filter |= Q(professional_id=prof_id, start__gte=start, start__lt=end)
+    Slot.objects.filter(slot_filter, status="HELD").update(status="AVAILABLE")
+    SlotHold.objects.filter(id__in=[hold[0] for hold in holds]).delete()
+    notify_slots_changed({(prof_id, d) for _, prof_id, d, _, _ in holds})
+
+
+def release_slot_hold(token) -> bool:
+    """Libera un hold antes de su vencimiento (el cliente abandonó el checkout)."""
+    with transaction.atomic():
+        holds = list(
+            SlotHold.objects.select_for_update()
+            .filter(token=token)
+            .values_list("id", "professional_id", "date", "start", "end")
+        )
+        if holds:
+            _release_holds(holds)
+    return bool(holds)
+
+
+def release_expired_holds(professional_ids=None, batch_size: int = 500) -> int:
+    """
+    Reaper: libera en bloque los holds vencidos (un UPDATE y un DELETE por
+    lote). Salta los que una reserva está canjeando en ese momento
+    (SKIP LOCKED). Devuelve la cantidad de holds liberados.
+    """
+    released = 0
+    while True:
+        with transaction.atomic():
+            holds = SlotHold.objects.filter(expires_at__lte=timezone.now())
+            if professional_ids is not None:
+                holds = holds.filter(professional_id__in=professional_ids)
+            expired = list(
+                holds.select_for_update(skip_locked=True)
+                .order_by("expires_at")
+                .values_list("id", "professional_id", "date", "start", "end")[:batch_size]
+            )
+            if expired:
+                _release_holds(expired)
+        released += len(expired)
+        if len(expired) < batch_size:
+            return released
+
+
+# ----------------------------------------------------------------------
+# 16c) Cliente, vehículo y dirección de una reserva
+# ----------------------------------------------------------------------
+def resolve_booking_client(client_data: dict):
+    """Cliente por email (se crea si no existe). None si no viene email."""
+    from django.contrib.auth import get_user_model
+
+    email = (client_data.get("email") or "").strip().lower()
+    if not email:
+        return None
+
+    client, created = get_user_model().objects.get_or_create(
+        email=email,
+        defaults={
+            "first_name": (client_data.get("first_name") or "").strip(),
+            "last_name": (client_data.get("last_name") or "").strip(),
+            "phone": (client_data.get("phone") or "").strip(),
+        },
+    )
+    # IMPORTANTE: NO actualizar datos de clientes existentes para prevenir 
+    # sobrescribir información en reservas anteriores. 
+    # Si un cliente necesita actualizar sus datos, debe hacerlo a través 
+    # de su perfil de usuario, no a través de nuevas reservas.
+    return client
+
+
+def _vehicle_plate(vehicle_data) -> str:
+    """Patente normalizada, o "" si no viene o está enmascarada."""
+    if not vehicle_data:
+        return ""
+    plate = (vehicle_data.get("license_plate") or vehicle_data.get("plate") or "").strip().upper()
+    # Salvaguarda: Ignorar patentes enmascaradas (conteniendo '*')
+    return "" if '*' in plate else plate
+
+
+def _vehicle_defaults(vehicle_data) -> dict:
+    return {
+        "brand": (vehicle_data.get("brand") or "").strip(),
+        "model": (vehicle_data.get("model") or "").strip(),
+        "year": vehicle_data.get("year"),
+    }
+
+
+def resolve_booking_vehicle(client, vehicle_data):
+    """Vehículo del cliente por patente (se crea o actualiza). None si no aplica."""
+    from apps.clients.models import Vehicle
+
+    plate = _vehicle_plate(vehicle_data)
+    if not plate or not client:
+        return None
+
+    vehicle_obj, _ = Vehicle.objects.update_or_create(
+        license_plate=plate,
+        owner=client,
+        defaults={"owner": client, **_vehicle_defaults(vehicle_data)},
+    )
+    return vehicle_obj
+
+
+def resolve_booking_vehicles(pairs) -> list:
+    """
+    resolve_booking_vehicle para muchas filas [(cliente, datos), ...] con
+    una lectura, un bulk_create y un bulk_update. La patente de otro dueño
+    debe descartarse antes (es única).
+    """
+    from apps.clients.models import Vehicle
+
+    wanted = {}
+    for client, vehicle_data in pairs:
+        plate = _vehicle_plate(vehicle_data)
+        if plate and client:
+            wanted[plate] = (client, _vehicle_defaults(vehicle_data))
+
+    vehicles = Vehicle.objects.in_bulk(list(wanted), field_name="license_plate")
+    to_create, to_update = [], []
+    for plate, (client, defaults) in wanted.items():
+        vehicle = vehicles.get(plate)
+        if vehicle is None:
+            vehicles[plate] = Vehicle(owner=client, license_plate=plate, **defaults)
+            to_create.append(vehicles[plate])
+        elif any(getattr(vehicle, field) != value for field, value in defaults.items()):
+            for field, value in defaults.items():
+                setattr(vehicle, field, value)
+            to_update.append(vehicle)
+    Vehicle.objects.bulk_create(to_create)
+    Vehicle.objects.bulk_update(to_update, ["brand", "model", "year"])
+
+    return [vehicles.get(_vehicle_plate(vehicle_data)) if client else None for client, vehicle_data in pairs]
+
+
+def _address_fields(address_data):
+    """(alias, street, number, complement, commune_id) o None si la dirección no aplica."""
+    if not address_data:
+        return None
+    street = (address_data.get("street") or "").strip()
+    # Salvaguarda: Ignorar calles enmascaradas (y entonces también el número)
+    if not street or '*' in street:
+        return None
+    return (
+        (address_data.get("alias") or "Principal").strip(),
+        street,
+        (address_data.get("number") or "").strip(),
+        (address_data.get("complement") or "").strip(),
+        address_data.get("commune_id"),
+    )
+
+
+def resolve_booking_address(client, address_data):
+    """Dirección del cliente por alias (se crea o actualiza). None si no aplica."""
+    from apps.clients.models import Address, Commune
+
+    fields = _address_fields(address_data)
+    if not fields or not client:
+        return None
+    alias, street, number, complement, commune_id = fields
+
+    commune_obj = None
+    if commune_id:
+        commune_obj = Commune.objects.filter(id=commune_id).first()
+
+    # Try to find existing address to update or create new
+    address_defaults = {
+        "street": street,
+        "number": number,
+        "complement": complement,
+        "commune": commune_obj
+    }
+    address_obj, _ = Address.objects.update_or_create(
+        owner=client,
+        alias=alias,
+        defaults=address_defaults
+    )
+    return address_obj
+
+
+def resolve_booking_addresses(pairs) -> list:
+    """
+    resolve_booking_address para muchas filas [(cliente, datos), ...] con
+    una lectura de comunas, una de direcciones, un bulk_create y un
+    bulk_update. Si varias filas traen el mismo cliente y alias queda la
+    última. Una dirección nueva sin comuna válida no se crea (None).
+    """
+    from apps.clients.models import Address, Commune
+
+    wanted = {}
+    for client, address_data in pairs:
+        fields = _address_fields(address_data)
+        if fields and client:
+            wanted[(client.id, fields[0])] = (client, fields[1:])
+
+    commune_ids = set()
+    for _, (_, _, _, commune_id) in wanted.values():
+        try:
+            commune_ids.add(int(commune_id))
+        except (TypeError, ValueError):
+            pass
+    communes = Commune.objects.in_bulk(list(commune_ids))
+
+    addresses = {}
+    for address in Address.objects.filter(
+        owner_id__in={owner_id for owner_id, _ in wanted},
+        alias__in={alias for _, alias in wanted},
+    ).order_by("id"):
+        addresses.setdefault((address.owner_id, address.alias), address)
+
+    to_create, to_update = [], []
+    for key, (client, (street, number, complement, commune_id)) in wanted.items():
+        try:
+            commune = communes.get(int(commune_id))
+        except (TypeError, ValueError):
+            commune = None
+        values = {"street": street, "number": number, "complement": complement}
+        if commune is not None:
+            values["commune"] = commune
+        address = addresses.get(key)
+        if address is None:
+            if commune is None:
+                continue
+            addresses[key] = Address(owner=client, alias=key[1], **values)
+            to_create.append(addresses[key])
+        elif any(getattr(address, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(address, field, value)
+            to_update.append(address)
+    Address.objects.bulk_create(to_create)
+    Address.objects.bulk_update(to_update, ["street", "number", "complement", "commune"])
+
+    result = []
+    for client, address_data in pairs:
+        fields = _address_fields(address_data)
+        result.append(addresses.get((client.id, fields[0])) if fields and client else None)
+    return result
+
+
 # ----------------------------------------------------------------------
 # 16) Crear Reserva (Transacción Completa)
 # ----------------------------------------------------------------------
-def create_reservation_transaction(validated_data):
+def create_reservation_transaction(validated_data, strategy: Optional[str] = None):
     """
     Maneja la lógica compleja de crear una reserva:
     - Creación/actualización de cliente
     - Creación de Vehículo/Dirección
-    - Validación y bloqueo de slots
+    - Validación y bloqueo de slots (ver claim_slot_chain; `strategy`
+      sobrescribe AGENDA_BOOKING_STRATEGY) o canje de un hold_token
+      (ver redeem_slot_hold)
     - Creación y vinculación de reserva
     """
     from django.db import transaction
-    from django.shortcuts import get_object_or_404
-    from django.contrib.auth import get_user_model
-    from apps.clients.models import Vehicle, Address, Commune
     from .models import (
         Slot, Reservation, ReservationSlot, ReservationService, 
         ProfessionalService, StatusHistory
     )
-    from rest_framework.exceptions import ValidationError
-
-    User = get_user_model()
 
     with transaction.atomic():
         # ----------------------------------------------------------
         # 1) CLIENTE
         # ----------------------------------------------------------
-        client_data = validated_data.get("client") or {}
-        client = None
-        email = (client_data.get("email") or "").strip().lower()
-
-        if email:
-            client, created = User.objects.get_or_create(
-                email=email,
-                defaults={
-                    "first_name": (client_data.get("first_name") or "").strip(),
-                    "last_name": (client_data.get("last_name") or "").strip(),
-                    "phone": (client_data.get("phone") or "").strip(),
-                },
-            )
-            # IMPORTANTE: NO actualizar datos de clientes existentes para prevenir 
-            # sobrescribir información en reservas anteriores. 
-            # Si un cliente necesita actualizar sus datos, debe hacerlo a través 
-            # de su perfil de usuario, no a través de nuevas reservas.
+        client = resolve_booking_client(validated_data.get("client") or {})
 
         # ----------------------------------------------------------
         # 2) VEHÍCULO (opcional)
         # ----------------------------------------------------------
-        vehicle_data = validated_data.get("vehicle")
-        vehicle_obj = None
-        if vehicle_data and client:
-            plate = (vehicle_data.get("license_plate") or vehicle_data.get("plate") or "").strip().upper()
-            # Salvaguarda: Ignorar patentes enmascaradas (conteniendo '*')
-            if plate and '*' not in plate:
-                vehicle_defaults = {
-                    "owner": client,
-                    "brand": (vehicle_data.get("brand") or "").strip(),
-                    "model": (vehicle_data.get("model") or "").strip(),
-                    "year": vehicle_data.get("year"),
-                }
-                vehicle_obj, _ = Vehicle.objects.update_or_create(
-                    license_plate=plate,
-                    owner=client,
-                    defaults=vehicle_defaults,
-                )
+        vehicle_obj = resolve_booking_vehicle(client, validated_data.get("vehicle"))
 
         # ----------------------------------------------------------
         # 3) DIRECCIÓN (opcional)
         # ----------------------------------------------------------
-        address_data = validated_data.get("address")
-        address_obj = None
-        if address_data and client:
-            alias = (address_data.get("alias") or "Principal").strip()
-            street = (address_data.get("street") or "").strip()
-            number = (address_data.get("number") or "").strip() # Inicializar número aquí
-            
-            # Salvaguarda: Ignorar calles enmascaradas
-            if street and '*' not in street:
-                # Si la calle no está enmascarada, entonces podemos usar el número
-                number = (address_data.get("number") or "").strip()
-            else:
-                # Si la calle está enmascarada o vacía, no deberíamos usar el número de la entrada
-                street = "" # Efectivamente ignorar la calle
-                number = "" # E ignorar el número
-            
-            commune = (address_data.get("commune") or "").strip()
-            region = (address_data.get("region") or "").strip()
-            complement = (address_data.get("complement") or "").strip()
-
-            if street: # This check now relies on the potentially cleared 'street' variable
-                commune_id = address_data.get("commune_id")
-                commune_obj = None
-                if commune_id:
-                        commune_obj = Commune.objects.filter(id=commune_id).first()
-                
-                # Try to find existing address to update or create new
-                address_defaults = {
-                    "street": street,
-                    "number": number,
-                    "complement": complement,
-                    "commune": commune_obj
-                }
-                
-                address_obj, _ = Address.objects.update_or_create(
-                    owner=client,
-                    alias=alias,
-                    defaults=address_defaults
-                )
-
-
-
-
+        address_obj = resolve_booking_address(client, validated_data.get("address"))
 
         # ----------------------------------------------------------
         # 4) VALIDACIÓN DE SLOTS Y SERVICIOS
         # ----------------------------------------------------------
         professional_id = validated_data["professional_id"]
-        
-        # Lock initial slot
-        try:
-            slot_initial = Slot.objects.select_for_update().get(pk=validated_data["slot_id"])
-        except Slot.DoesNotExist:
-             raise ValidationError({"slot_id": "Slot not found."})
-
-        if slot_initial.status != "AVAILABLE":
-            raise ValidationError({"slot_id": "Slot is not available."})
-
         services_in = validated_data.get("services", [])
 
-        # todos los servicios deben apuntar al mismo profesional
-        for s in services_in:
-            if s["professional_id"] != professional_id:
-                raise ValidationError(
-                    {"services": "All services must be assigned to the selected professional."}
-                )
-
-        try:
-            total_required_min = compute_total_duration(services_in)
-        except ProfessionalService.DoesNotExist:
-            raise ValidationError(
-                {"services": "One or more services are not assigned to the professional or are inactive."}
-            )
-
-        slot_duration_min = int(
-            (slot_initial.end - slot_initial.start).total_seconds() // 60
+        # todos los servicios deben apuntar al mismo profesional (ver required_minutes);
+        # duraciones desde la BD, también para ReservationService
+        booked_matrix = skills.load_matrix(
+            service_ids=[s["service_id"] for s in services_in],
+            professional_ids=[professional_id],
         )
-        if slot_duration_min <= 0:
-            raise ValidationError({"slot_id": "Slot base has zero duration."})
-
-        slots_needed = (total_required_min + slot_duration_min - 1) // slot_duration_min
-        if slots_needed <= 0:
-            slots_needed = 1
-
-        # Busca slots consecutivos
-        slots_to_reserve = [slot_initial]
-        current_slot = slot_initial
+        total_required_min = required_minutes(professional_id, services_in, booked_matrix)
 
-        for i in range(1, slots_needed):
-            next_start = current_slot.end
-            try:
-                next_slot = Slot.objects.select_for_update().get(
-                    professional_id=professional_id,
-                    start=next_start,
-                    status="AVAILABLE",
-                )
-            except Slot.DoesNotExist:
-                raise ValidationError(
-                    {
-                        "services": (
-                            f"Not enough consecutive slots. Required {slots_needed}, "
-                            f"found {i}. Total minutes required: {total_required_min}."
-                        )
-                    }
-                )
-            slots_to_reserve.append(next_slot)
-            current_slot = next_slot
+        if validated_data.get("hold_token"):
+            # Cadena ya retenida durante el checkout (ver hold_slot_chain)
+            slots_to_reserve = redeem_slot_hold(
+                validated_data["hold_token"], professional_id, total_required_min, strategy
+            )
+        else:
+            # Modo virtual: la reserva llega con "start" y los slots se crean solo para la cadena reservada
+            start = resolve_chain_start(
+                professional_id, total_required_min, validated_data.get("slot_id"), validated_data.get("start")
+            )
+            slots_to_reserve = claim_slot_chain(professional_id, start, total_required_min, strategy)
 
         # ----------------------------------------------------------
         # 5) CREAR RESERVA
@@ -876,33 +1805,25 @@ def create_reservation_transaction(validated_data):
         )
 
         # ----------------------------------------------------------
-        # 6) MARCAR SLOTS COMO RESERVED
+        # 6) VINCULAR SLOTS (ya RESERVED por claim_slot_chain)
         # ----------------------------------------------------------
-        for s in slots_to_reserve:
-            s.status = "RESERVED"
-            s.save(update_fields=["status"])
-            ReservationSlot.objects.create(
-                reservation=reservation,
-                slot=s,
-                professional_id=professional_id,
-            )
+        attach_slot_chain(reservation, professional_id, slots_to_reserve, strategy)
 
         # ----------------------------------------------------------
         # 7) CREAR ReservationService
         # ----------------------------------------------------------
-        for s in services_in:
-            ps = ProfessionalService.objects.select_related("service").get(
-                professional_id=s["professional_id"],
-                service_id=s["service_id"],
-                active=True,
-            )
-            duration = ps.duration_override_min or ps.service.duration_min
-            ReservationService.objects.create(
+        ReservationService.objects.bulk_create([
+            ReservationService(
                 reservation=reservation,
                 service_id=s["service_id"],
                 professional_id=s["professional_id"],
-                effective_duration_min=duration,
+                effective_duration_min=skills.effective_duration(
+                    s["professional_id"], s["service_id"], booked_matrix
+                ),
             )
+            for s in services_in
+        ])
+
 
         # ----------------------------------------------------------
         # 8) HISTORIAL DE ESTADO
@@ -923,6 +1844,385 @@ def create_reservation_transaction(validated_data):
         return reservation
 
 
+# ----------------------------------------------------------------------
+# 17) Importación masiva de reservas (flotas)
+# ----------------------------------------------------------------------
+BULK_IMPORT_NOTE = "Reserva creada por importación masiva (Pendiente de confirmación)"
+
+
+class ImportRowError(Exception):
+    """Fila de importación inválida o sin horario disponible."""
+
+
+def _parse_import_row(raw: dict, defaults: dict) -> dict:
+    """
+    Normaliza una fila:
+    {
+        "client": {...},              # opcional si viene en defaults
+        "vehicle": {...}, "address": {...}, "note": "...",
+        "services": [1, 2],           # o [{"service_id": 1}, ...]
+        "date": "YYYY-MM-DD",
+        "start": "HH:MM",             # opcional (ISO también); sin start, el primer hueco
+        "professional_id": 3          # opcional
+    }
+    """
+    from django.utils.dateparse import parse_datetime
+
+    client_data = raw.get("client") or defaults.get("client") or {}
+    if not (client_data.get("email") or "").strip():
+        raise ImportRowError("client.email is required.")
+
+    try:
+        service_ids = [
+            int(s["service_id"]) if isinstance(s, dict) else int(s)
+            for s in raw.get("services") or []
+        ]
+    except (KeyError, TypeError, ValueError):
+        raise ImportRowError("services must be a list of service ids.")
+    if not service_ids:
+        raise ImportRowError("services is required.")
+
+    try:
+        target_date = datetime.strptime(str(raw.get("date")), "%Y-%m-%d").date()
+    except ValueError:
+        raise ImportRowError("date must be YYYY-MM-DD.")
+    if target_date <= timezone.localdate():
+        raise ImportRowError("Las reservas deben hacerse con al menos 1 día de anticipación.")
+
+    start = None
+    if raw.get("start"):
+        value = str(raw["start"])
+        try:
+            start = parse_datetime(value) or datetime.combine(
+                target_date, datetime.strptime(value, "%H:%M").time()
+            )
+        except ValueError:
+            raise ImportRowError("start must be HH:MM or an ISO datetime.")
+        start = _make_aware(start)
+        if timezone.localtime(start).date() != target_date:
+            raise ImportRowError("start must fall on date.")
+
+    professional_id = raw.get("professional_id")
+    try:
+        professional_id = int(professional_id) if professional_id else None
+    except (TypeError, ValueError):
+        raise ImportRowError("professional_id must be an integer.")
+
+    return {
+        "client": client_data,
+        "vehicle": raw.get("vehicle") or defaults.get("vehicle"),
+        "address": raw.get("address") or defaults.get("address"),
+        "note": raw.get("note") or defaults.get("note") or "",
+        "service_ids": service_ids,
+        "date": target_date,
+        "start": start,
+        "professional_id": professional_id,
+    }
+
+
+def _find_free_chain(free, taken, required_min: int, start: Optional[datetime] = None):
+    """
+    Primera cadena contigua de `free` [(inicio, fin), ...] (ordenada) que
+    cubre `required_min` sin pasar por inicios de `taken`; con `start`,
+    solo la que empieza ahí. Devuelve [(inicio, fin), ...] o None.
+    """
+    for i, (first_start, _) in enumerate(free):
+        if start is not None and first_start != start:
+            continue
+        if first_start in taken:
+            continue
+        chain = []
+        end = first_start + timedelta(minutes=required_min)
+        cursor = first_start
+        for slot_start, slot_end in free[i:]:
+            if slot_start != cursor or slot_start in taken:
+                break
+            chain.append((slot_start, slot_end))
+            cursor = slot_end
+            if cursor >= end:
+                return chain
+        if start is not None:
+            return None
+    return None
+
+
+def plan_bulk_reservations(rows) -> list:
+    """
+    Asigna profesional y cadena a cada fila válida en una sola pasada:
+    una consulta (o un cálculo virtual) de huecos libres para todos los
+    profesionales y fechas del lote más una de cargas diarias. Cada fila
+    va al profesional calificado menos cargado ese día (contando lo ya
+    asignado en el lote) que tenga la cadena libre; las filas con hora o
+    profesional fijos se asignan antes que las flexibles.
+
+    `rows` son filas de _parse_import_row (o ImportRowError); a las
+    válidas se les agrega "professional_id", "required_min", "durations"
+    ({service_id: minutos} del profesional asignado) y "chain".
+    """
+    # Matriz desde la BD (no el índice en memoria): se va a reservar
+    matrix = skills.load_matrix(
+        service_ids={sid for row in rows if not isinstance(row, ImportRowError) for sid in row["service_ids"]}
+    )
+    for row in rows:
+        if isinstance(row, ImportRowError):
+            continue
+        row["candidates"] = {
+            prof_id: sum(durations[sid] for sid in row["service_ids"])
+            for prof_id, durations in matrix.items()
+            if set(row["service_ids"]) <= durations.keys()
+            and row["professional_id"] in (None, prof_id)
+        }
+
+    valid = [row for row in rows if not isinstance(row, ImportRowError) and row["candidates"]]
+    if not valid:
+        return rows
+
+    prof_ids = sorted({prof_id for row in valid for prof_id in row["candidates"]})
+    dates = sorted({row["date"] for row in valid})
+
+    free = defaultdict(list)  # (profesional, fecha) -> [(inicio, fin), ...]
+    if virtual_availability_enabled():
+        for target_date, day in compute_virtual_slots_for_dates(prof_ids, dates).items():
+            for prof_id, day_slots in day.items():
+                free[(prof_id, target_date)] = [(s.start, s.end) for s in day_slots]
+    else:
+        for prof_id, slot_date, start, end in Slot.objects.filter(
+            professional_id__in=prof_ids,
+            date__in=dates,
+            status="AVAILABLE",
+        ).order_by("start").values_list("professional_id", "date", "start", "end"):
+            free[(prof_id, slot_date)].append((start, end))
+
+    loads = get_day_loads(prof_ids, dates[0], dates[-1])
+    taken = defaultdict(set)
+
+    # Primero las filas con hora o profesional fijos; las flexibles llenan el resto
+    for row in sorted(valid, key=lambda r: (r["start"] is None, r["professional_id"] is None)):
+        target_date = row["date"]
+        day_loads = loads.setdefault(target_date, {})
+        for prof_id in sorted(row["candidates"], key=lambda p: (day_loads.get(p, 0), p)):
+            required_min = row["candidates"][prof_id]
+            chain = _find_free_chain(
+                free[(prof_id, target_date)], taken[(prof_id, target_date)], required_min, row["start"]
+            )
+            if chain:
+                taken[(prof_id, target_date)].update(start for start, _ in chain)
+                day_loads[prof_id] = day_loads.get(prof_id, 0) + 1
+                row.update(
+                    professional_id=prof_id,
+                    required_min=required_min,
+                    durations={sid: matrix[prof_id][sid] for sid in row["service_ids"]},
+                    chain=chain,
+                )
+                break
+    return rows
+
+
+def _check_vehicle_owners(rows):
+    """
+    Reemplaza por ImportRowError las filas cuya patente es de otro cliente:
+    el dueño guardado en la BD o, si la patente es nueva, el cliente de la
+    primera fila del lote que la trae.
+    """
+    from apps.clients.models import Vehicle
+
+    plates = {_vehicle_plate(row["vehicle"]) for row in rows if not isinstance(row, ImportRowError)} - {""}
+    owners = {
+        plate: email.lower()
+        for plate, email in Vehicle.objects.filter(license_plate__in=plates).values_list(
+            "license_plate", "owner__email"
+        )
+    }
+    for index, row in enumerate(rows):
+        if isinstance(row, ImportRowError):
+            continue
+        plate = _vehicle_plate(row["vehicle"])
+        if not plate:
+            continue
+        email = row["client"]["email"].strip().lower()
+        if owners.setdefault(plate, email) != email:
+            rows[index] = ImportRowError(f"Vehicle {plate} belongs to another client.")
+
+
+def _row_report(index: int, row, status_text: str, **extra) -> dict:
+    report = {"row": index, "status": status_text}
+    if isinstance(row, ImportRowError):
+        report["error"] = str(row)
+    elif row.get("chain"):
+        report.update(
+            professional_id=row["professional_id"],
+            start=row["chain"][0][0],
+            end=row["chain"][-1][1],
+        )
+    report.update(extra)
+    return report
+
+
+def import_reservations(raw_rows, defaults: Optional[dict] = None, dry_run: bool = False,
+                        notify: bool = True) -> list:
+    """
+    Crea en bloque las reservas de una planilla (ej. flota de vehículos).
+    Valida todas las filas, planifica con plan_bulk_reservations y escribe
+    slots, Reservation, ReservationSlot, ReservationService y StatusHistory
+    con bulk_create en una transacción. No aplica el límite de una reserva
+    PENDING por cliente (es una carga de administración).
+
+    Devuelve un reporte por fila: {"row", "status" (created | planned |
+    error), "reservation_id", "professional_id", "start", "end", "error"}.
+    Las notificaciones se envían al final en un solo despacho
+    (dispatch_reservation_notifications), no por fila.
+    """
+    defaults = defaults or {}
+    rows = []
+    for raw in raw_rows:
+        try:
+            rows.append(_parse_import_row(raw, defaults))
+        except ImportRowError as e:
+            rows.append(e)
+
+    _check_vehicle_owners(rows)
+    plan_bulk_reservations(rows)
+
+    reports = {}
+    for index, row in enumerate(rows):
+        if isinstance(row, ImportRowError):
+            reports[index] = _row_report(index, row, "error")
+        elif not row["candidates"]:
+            reports[index] = _row_report(
+                index, row, "error", error="No active professional offers all the requested services."
+            )
+        elif not row.get("chain"):
+            reports[index] = _row_report(index, row, "error", error="Selected time is not available.")
+        elif dry_run:
+            reports[index] = _row_report(index, row, "planned")
+
+    planned = [index for index, row in enumerate(rows) if index not in reports]
+    if planned:
+        created = _write_bulk_reservations([rows[index] for index in planned], notify)
+        for index, reservation_id in zip(planned, created):
+            if reservation_id is None:
+                reports[index] = _row_report(index, rows[index], "error", error="Slot is not available.")
+            else:
+                reports[index] = _row_report(index, rows[index], "created", reservation_id=reservation_id)
+
+    return [reports[index] for index in range(len(rows))]
+
+
+@transaction.atomic
+def _write_bulk_reservations(rows, notify: bool) -> list:
+    """
+    Escribe las filas planificadas. Los slots se bloquean y se pasan a
+    RESERVED con una consulta cada uno; una fila cuya cadena tomó otra
+    reserva mientras tanto queda sin crear (None en el resultado).
+    """
+    from django.db.models import Q
+    from .models import ReservationService, StatusHistory
+
+    if virtual_availability_enabled():
+        Slot.objects.bulk_create(
+            [
+                Slot(professional_id=row["professional_id"], date=row["date"], start=start, end=end,
+                     status="AVAILABLE")
+                for row in rows
+                for start, end in row["chain"]
+            ],
+            ignore_conflicts=True,
+        )
+
+    starts_by_prof = defaultdict(list)
+    for row in rows:
+        starts_by_prof[row["professional_id"]].extend(start for start, _ in row["chain"])
+    slot_filter = Q()
+    for prof_id, starts in starts_by_prof.items():
+        slot_filter |= Q(professional_id=prof_id, start__in=starts)
+    locked = {
+        (slot.professional_id, slot.start): slot
+        for slot in Slot.objects.select_for_update().filter(slot_filter)
+    }
+
+    chains = []
+    for row in rows:
+        chain = [locked.get((row["professional_id"], start)) for start, _ in row["chain"]]
+        chains.append(chain if all(s is not None and s.status == "AVAILABLE" for s in chain) else None)
+
+    booked = [(row, chain) for row, chain in zip(rows, chains) if chain]
+    Slot.objects.filter(id__in=[s.id for _, chain in booked for s in chain]).update(status="RESERVED")
+
+    clients = {}
+    for row, _ in booked:
+        email = row["client"]["email"].strip().lower()
+        if email not in clients:
+            clients[email] = resolve_booking_client(row["client"])
+        row["client_obj"] = clients[email]
+    vehicles = resolve_booking_vehicles([(row["client_obj"], row["vehicle"]) for row, _ in booked])
+    addresses = resolve_booking_addresses([(row["client_obj"], row["address"]) for row, _ in booked])
+
+    reservations = []
+    for (row, _), vehicle, address in zip(booked, vehicles, addresses):
+        reservations.append(Reservation(
+            client=row["client_obj"],
+            vehicle=vehicle,
+            address=address,
+            note=row["note"],
+            status="PENDING",
+            total_min=row["required_min"],
+        ))
+    Reservation.objects.bulk_create(reservations)
+
+    ReservationSlot.objects.bulk_create([
+        ReservationSlot(reservation=reservation, slot=s, professional_id=row["professional_id"])
+        for reservation, (row, chain) in zip(reservations, booked)
+        for s in chain
+    ])
+    ReservationService.objects.bulk_create([
+        ReservationService(
+            reservation=reservation,
+            service_id=service_id,
+            professional_id=row["professional_id"],
+            effective_duration_min=row["durations"][service_id],
+        )
+        for reservation, (row, _) in zip(reservations, booked)
+        for service_id in row["service_ids"]
+    ])
+    StatusHistory.objects.bulk_create([
+        StatusHistory(reservation=reservation, status="PENDING", note=BULK_IMPORT_NOTE)
+        for reservation in reservations
+    ])
+
+    pairs = {(row["professional_id"], row["date"]) for row, _ in booked}
+    notify_slots_changed(pairs)
+    refresh_day_loads(pairs)
+
+    if notify and reservations:
+        reservation_ids = [reservation.id for reservation in reservations]
+        transaction.on_commit(lambda: dispatch_reservation_notifications(reservation_ids))
+
+    created = iter(reservations)
+    return [next(created).id if chain else None for chain in chains]
+
+
+def dispatch_reservation_notifications(reservation_ids):
+    """
+    Despacho único (un hilo) de las notificaciones de reservas nuevas
+    creadas con bulk_create, que no disparan post_save: email de
+    confirmación al cliente y plantilla de WhatsApp.
+    """
+    import threading
+    from apps.whatsapp.signals import send_confirmation_template
+    from .signals import send_client_confirmation
+
+    def run():
+        reservations = Reservation.objects.filter(id__in=reservation_ids).select_related("client")
+        for reservation in reservations:
+            send_client_confirmation(reservation)
+            try:
+                send_confirmation_template(reservation)
+            except Exception as e:
+                logger.error("Error enviando WhatsApp de la reserva %s: %s", reservation.id, e)
+
+    threading.Thread(target=run).start()
+
+
 # ----------------------------------------------------------------------
 # 13) Crear horario por defecto para profesional
 # ----------------------------------------------------------------------
@@ -956,9 +2256,11 @@ def create_default_schedule(professional):
     )
     WorkSchedule.objects.bulk_create(default_schedules)
 
-    # Generate slots for the next 30 days
-    today = datetime.now().date()
-    generate_slots_range(professional.id, today, days=30)
+    if virtual_availability_enabled():
+        return
+
+    # Generate slots up to the rolling horizon
+    extend_slot_horizon(professional.id)
 
 
 # ----------------------------------------------------------------------
@@ -971,18 +2273,33 @@ def validate_booking_rules(data):
     """
     # 1. Validate "next day" restriction
     slot_id = data.get("slot_id")
+    slot_date = None
     if slot_id:
         try:
             slot = Slot.objects.get(pk=slot_id)
-            current_date = timezone.now().date()
             slot_date = slot.start.date()
-            
-            # Cannot book for today or past
-            if slot_date <= current_date:
-                return False, "Las reservas deben hacerse con al menos 1 día de anticipación."
-
         except Slot.DoesNotExist:
             pass # Serializer will handle missing/invalid slot
+    elif data.get("start"):
+        # Modo virtual: se reserva por hora de inicio
+        from django.utils.dateparse import parse_datetime
+        try:
+            start = parse_datetime(str(data["start"]))
+        except ValueError:
+            start = None
+        if start:
+            slot_date = timezone.localtime(start).date() if timezone.is_aware(start) else start.date()
+    elif data.get("hold_token"):
+        # Reserva de una cadena retenida: la fecha es la del hold
+        from django.core.exceptions import ValidationError
+        try:
+            slot_date = SlotHold.objects.filter(token=data["hold_token"]).values_list("date", flat=True).first()
+        except ValidationError:
+            pass  # El serializer reporta el token inválido
+
+    # Cannot book for today or past
+    if slot_date and slot_date <= timezone.now().date():
+        return False, "Las reservas deben hacerse con al menos 1 día de anticipación."
 
     # 2. Limit PENDING reservations per client (anti-abuse)
     client_data = data.get('client', {})
@@ -990,19 +2307,13 @@ def validate_booking_rules(data):
     phone = client_data.get('phone', '').strip()
     
     if email or phone:
-        from django.db.models import Q
-        
+        from django.contrib.auth import get_user_model
+
         # Check for existing PENDING reservations with same email OR phone
-        pending_filters = Q(status='PENDING')
-        email_phone_filters = Q()
-        
-        if email:
-            email_phone_filters |= Q(client__email__iexact=email)
-        if phone:
-            email_phone_filters |= Q(client__phone=phone)
-        
+        # (una sola consulta sobre los índices lower(email) / phone_key)
         existing_pending = Reservation.objects.filter(
-            pending_filters & email_phone_filters
+            status='PENDING',
+            client__in=get_user_model().objects.matching_identity(email=email, phone=phone),
         ).exists()
         
         if existing_pending:
@@ -1,6 +1,19 @@
-from django.db.models.signals import pre_save, post_save
+from datetime import timedelta
+
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from .models import Reservation
+from django.utils import timezone
+from apps.catalog.models import Service, ServiceTimeRule
+from .availability_cache import bump_day_versions, bump_global_version, bump_professional_versions
+from .models import (
+    Professional,
+    ProfessionalService,
+    Reservation,
+    WorkSchedule,
+    Break,
+    ScheduleException,
+    SlotBlock,
+)
 import threading
 import logging
 
@@ -20,6 +33,44 @@ def track_status_change(sender, instance, **kwargs):
     else:
         instance._old_status = None
 
+# Plazo del cliente para confirmar una reserva nueva
+CONFIRMATION_TOKEN_TTL = timedelta(hours=48)
+
+
+def send_client_confirmation(instance):
+    """
+    Deja la reserva en WAITING_CLIENT con un token de confirmación nuevo y
+    envía al cliente el email con el link.
+    """
+    import uuid
+
+    try:
+        from apps.email_service.services import send_confirmacion_cliente
+        
+        # 1. Generar token único
+        token = uuid.uuid4()
+        expiration = timezone.now() + CONFIRMATION_TOKEN_TTL  # 48 horas para confirmar
+        
+        logger.info(f"🔑 Token generado: {token}")
+        
+        # 2. Guardar token en reserva y cambiar estado a WAITING_CLIENT
+        instance.confirmation_token = token
+        instance.token_expires_at = expiration
+        instance.status = 'WAITING_CLIENT'
+        instance.save(update_fields=['confirmation_token', 'token_expires_at', 'status'])
+        
+        logger.info(f"💾 Token guardado - estado: {instance.status}")
+        
+        # 3. Enviar email al cliente con link de confirmación
+        result_cliente = send_confirmacion_cliente(instance, token)
+        logger.info(f"📧 Email al cliente enviado: {result_cliente}")
+        
+    except Exception as e:
+        logger.error(f"❌ Error sending client email: {e}")
+        import traceback
+        traceback.print_exc()
+
+
 @receiver(post_save, sender=Reservation)
 def trigger_email_notifications(sender, instance, created, **kwargs):
     """
@@ -31,10 +82,6 @@ def trigger_email_notifications(sender, instance, created, **kwargs):
     2. CLIENTE CONFIRMA (WAITING_CLIENT -> CONFIRMED):
        - Enviar email al profesional notificando la reserva confirmada
     """
-    import uuid
-    from datetime import timedelta
-    from django.utils import timezone
-    
     old_status = getattr(instance, '_old_status', None)
     
     print(f"\n{'='*60}")
@@ -52,35 +99,8 @@ def trigger_email_notifications(sender, instance, created, **kwargs):
         print("📧 ✅ CONDICIÓN CUMPLIDA: Nueva reserva creada - enviando email al cliente...")
         logger.info(f"📧 Nueva reserva creada - enviando email de confirmación al cliente...")
         
-        def send_client_email():
-            try:
-                from apps.email_service.services import send_confirmacion_cliente
-                
-                # 1. Generar token único
-                token = uuid.uuid4()
-                expiration = timezone.now() + timedelta(hours=48)  # 48 horas para confirmar
-                
-                logger.info(f"🔑 Token generado: {token}")
-                
-                # 2. Guardar token en reserva y cambiar estado a WAITING_CLIENT
-                instance.confirmation_token = token
-                instance.token_expires_at = expiration
-                instance.status = 'WAITING_CLIENT'
-                instance.save(update_fields=['confirmation_token', 'token_expires_at', 'status'])
-                
-                logger.info(f"💾 Token guardado - estado: {instance.status}")
-                
-                # 3. Enviar email al cliente con link de confirmación
-                result_cliente = send_confirmacion_cliente(instance, token)
-                logger.info(f"📧 Email al cliente enviado: {result_cliente}")
-                
-            except Exception as e:
-                logger.error(f"❌ Error sending client email: {e}")
-                import traceback
-                traceback.print_exc()
-        
         # Ejecutar en thread separado para no bloquear la respuesta HTTP
-        threading.Thread(target=send_client_email).start()
+        threading.Thread(target=send_client_confirmation, args=(instance,)).start()
     
     # CASO 2: Cliente confirmó - Enviar email al profesional
     # Esto incluye confirmaciones vía link (confirmed_via_link=True)
@@ -113,3 +133,180 @@ def trigger_email_notifications(sender, instance, created, **kwargs):
         logger.info(f"⏭️  No se envían emails (condición no cumplida - Created: {created}, Old: {old_status}, New: {instance.status})")
 
 
+# ----------------------------------------------------------------------
+# Regeneración incremental de slots
+# ----------------------------------------------------------------------
+def _weekday_dates(professional_id, weekdays):
+    """
+    Fechas desde hoy hasta el horizonte del profesional que caen en `weekdays`.
+    """
+    from .services import get_regeneration_horizon
+
+    today = timezone.localdate()
+    horizon = get_regeneration_horizon(professional_id)
+    return [
+        (professional_id, today + timedelta(days=i))
+        for i in range((horizon - today).days + 1)
+        if (today + timedelta(days=i)).weekday() in weekdays
+    ]
+
+
+def _skip_slot_regeneration(raw, origin):
+    """
+    No encolar al cargar fixtures ni cuando se borra el profesional completo
+    (sus días en cola se eliminan en la misma cascada).
+    """
+    if raw:
+        return True
+    origin_model = getattr(origin, "model", type(origin))
+    return origin_model is Professional
+
+
+@receiver(pre_save, sender=WorkSchedule)
+@receiver(pre_save, sender=ScheduleException)
+@receiver(pre_save, sender=SlotBlock)
+def track_slot_source_change(sender, instance, raw=False, **kwargs):
+    """
+    Guardar profesional y día/fecha anteriores para regenerar también
+    los días que el cambio deja libres.
+    """
+    instance._old_slot_key = None
+    if raw or not instance.pk:
+        return
+
+    if sender is WorkSchedule:
+        old = sender.objects.filter(pk=instance.pk).values_list("professional_id", "weekday").first()
+    else:
+        old = sender.objects.filter(pk=instance.pk).values_list("professional_id", "date").first()
+    instance._old_slot_key = old
+
+
+@receiver(post_save, sender=WorkSchedule)
+@receiver(post_delete, sender=WorkSchedule)
+def enqueue_work_schedule_dates(sender, instance, raw=False, origin=None, **kwargs):
+    from .services import enqueue_slot_regeneration
+
+    if _skip_slot_regeneration(raw, origin):
+        return
+
+    targets = set(_weekday_dates(instance.professional_id, {instance.weekday}))
+    professionals = {instance.professional_id}
+    old = getattr(instance, "_old_slot_key", None)
+    if old and old != (instance.professional_id, instance.weekday):
+        targets.update(_weekday_dates(old[0], {old[1]}))
+        professionals.add(old[0])
+    enqueue_slot_regeneration(targets)
+    bump_professional_versions(professionals)
+
+
+@receiver(post_save, sender=Break)
+@receiver(post_delete, sender=Break)
+def enqueue_break_dates(sender, instance, raw=False, origin=None, **kwargs):
+    from .services import enqueue_slot_regeneration
+
+    if _skip_slot_regeneration(raw, origin):
+        return
+
+    # Si el horario se está eliminando en cascada, su propia señal encola los días
+    ws = WorkSchedule.objects.filter(pk=instance.work_schedule_id).values_list("professional_id", "weekday").first()
+    if ws:
+        enqueue_slot_regeneration(_weekday_dates(ws[0], {ws[1]}))
+        bump_professional_versions({ws[0]})
+
+
+@receiver(post_save, sender=ScheduleException)
+@receiver(post_delete, sender=ScheduleException)
+@receiver(post_save, sender=SlotBlock)
+@receiver(post_delete, sender=SlotBlock)
+def enqueue_dated_block_dates(sender, instance, raw=False, origin=None, **kwargs):
+    from .services import enqueue_slot_regeneration
+
+    if _skip_slot_regeneration(raw, origin):
+        return
+
+    targets = {(instance.professional_id, instance.date)}
+    old = getattr(instance, "_old_slot_key", None)
+    if old:
+        targets.add(old)
+    enqueue_slot_regeneration(targets)
+
+
+# ----------------------------------------------------------------------
+# Invalidación de la caché de disponibilidad
+# ----------------------------------------------------------------------
+@receiver(post_save, sender=ServiceTimeRule)
+@receiver(post_delete, sender=ServiceTimeRule)
+def invalidate_time_rule_index(sender, raw=False, **kwargs):
+    """
+    Reconstruir el índice compilado de reglas horarias (en este y en los
+    demás procesos) cuando la regla quede guardada.
+    """
+    from django.db import transaction
+    from . import time_rules
+
+    transaction.on_commit(time_rules.invalidate)
+
+
+@receiver(post_save, sender=ProfessionalService)
+@receiver(post_delete, sender=ProfessionalService)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Professional)
+@receiver(post_delete, sender=Professional)
+def invalidate_skill_matrix(sender, **kwargs):
+    """
+    Reconstruir la matriz de habilidades (en este y en los demás procesos)
+    cuando cambie quién hace qué servicio, su duración o si está activo.
+    """
+    from django.db import transaction
+    from . import skills
+
+    transaction.on_commit(skills.invalidate)
+
+
+@receiver(post_save, sender=ProfessionalService)
+@receiver(post_delete, sender=ProfessionalService)
+@receiver(post_save, sender=Professional)
+@receiver(post_delete, sender=Professional)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=ServiceTimeRule)
+@receiver(post_delete, sender=ServiceTimeRule)
+def bump_catalog_availability(sender, raw=False, **kwargs):
+    """
+    Cambió quién hace qué servicio (o si está activo), cuánto dura o a qué horas se permite:
+    afecta cualquier resultado cacheado.
+    """
+    if not raw:
+        bump_global_version()
+
+
+@receiver(post_save, sender=Reservation)
+def bump_reservation_availability(sender, instance, created, raw=False, **kwargs):
+    """
+    Un cambio de estado de la reserva (cancelada, completada, expirada...)
+    cambia las cargas diarias con las que se ordenan los profesionales en
+    la disponibilidad: se recalculan en la misma transacción.
+    """
+    if raw or created or getattr(instance, "_old_status", None) == instance.status:
+        return
+    from .services import refresh_day_loads
+
+    pairs = set(instance.reservation_slots.values_list("professional_id", "slot__date"))
+    refresh_day_loads(pairs)
+    bump_day_versions(pairs)
+
+
+@receiver(pre_delete, sender=Reservation)
+def remember_reservation_days(sender, instance, **kwargs):
+    """Guardar los días de la reserva antes de que el CASCADE borre sus slots."""
+    instance._load_pairs = set(instance.reservation_slots.values_list("professional_id", "slot__date"))
+
+
+@receiver(post_delete, sender=Reservation)
+def release_reservation_load(sender, instance, **kwargs):
+    from .services import refresh_day_loads
+
+    pairs = getattr(instance, "_load_pairs", set())
+    refresh_day_loads(pairs)
+    bump_day_versions(pairs)
@@ -0,0 +1,72 @@
+"""
+Single-flight: cálculos idénticos y simultáneos se hacen una sola vez.
+
+El primer pedido de una clave (líder) ejecuta la función; los que llegan
+mientras tanto con la misma clave esperan ese resultado en vez de repetir
+el cálculo. Opcionalmente (ver availability_cache) un candado en la caché
+extiende la idea entre workers.
+
+Los contadores son por proceso y los suma quien usa el SingleFlight:
+hits (servido desde caché), waits (esperó el cálculo de otro), leaders
+(calculó) y stale (servido vencido mientras se revalida). do() solo suma
+waits.
+"""
+import threading
+from collections import Counter
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = Counter()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: self._stats[name] for name in ("hits", "waits", "leaders", "stale")}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    def do(self, key, fn, wait_timeout=None):
+        """
+        Ejecuta fn() una vez por clave en vuelo y comparte su resultado (o
+        su excepción). Si el líder tarda más de `wait_timeout` segundos, el
+        que espera calcula por su cuenta.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(wait_timeout):
+                self.count("waits")
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            return fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
@@ -0,0 +1,79 @@
+"""
+Matriz de habilidades: qué profesional activo hace qué servicio y con qué
+duración efectiva (duration_override_min o la duración del servicio).
+
+Se arma con una sola consulta. Para mostrar disponibilidad se lee del
+índice en memoria del proceso (ver indexes.ProcessIndex); las señales de
+ProfessionalService, Service y Professional lo invalidan. Las rutas que
+reservan (validación de duración, ReservationService, importación, bot)
+leen la BD con load_matrix(): un índice desactualizado en algún worker
+nunca permite reservar un servicio desactivado ni con otra duración.
+"""
+from collections import defaultdict
+
+from .indexes import ProcessIndex
+
+
+def load_matrix(service_ids=None, professional_ids=None) -> dict:
+    """
+    Matriz leída de la BD (una consulta), opcionalmente limitada a ciertos
+    servicios y profesionales: {professional_id: {service_id: minutos}}.
+    """
+    from .models import ProfessionalService
+
+    links = ProfessionalService.objects.filter(active=True, professional__active=True)
+    if service_ids is not None:
+        links = links.filter(service_id__in={int(s) for s in service_ids})
+    if professional_ids is not None:
+        links = links.filter(professional_id__in={int(p) for p in professional_ids})
+
+    matrix = defaultdict(dict)
+    for prof_id, service_id, override, service_duration in links.values_list(
+        "professional_id", "service_id", "duration_override_min", "service__duration_min"
+    ):
+        matrix[prof_id][service_id] = override or service_duration
+    return dict(matrix)
+
+
+_index = ProcessIndex("agenda:skills:version", load_matrix)
+
+
+def get_matrix(service_ids=None, professional_ids=None) -> dict:
+    """
+    {professional_id: {service_id: minutos efectivos}} (índice en memoria).
+    Con el índice apagado lee de la BD solo los servicios y profesionales
+    pedidos (None = todos), no la tabla entera.
+    """
+    return _index.get(service_ids=service_ids, professional_ids=professional_ids)
+
+
+def invalidate():
+    _index.invalidate()
+
+
+def qualified_durations(service_ids, matrix=None) -> dict:
+    """
+    Profesionales activos que hacen TODOS los servicios pedidos, con la
+    duración efectiva de cada uno: {professional_id: {service_id: minutos}}.
+    Sin `matrix` usa el índice en memoria.
+    """
+    requested = {int(s) for s in service_ids}
+    if not requested:
+        return {}
+    if matrix is None:
+        matrix = get_matrix(requested)
+    return {
+        prof_id: {s: durations[s] for s in requested}
+        for prof_id, durations in matrix.items()
+        if requested <= durations.keys()
+    }
+
+
+def effective_duration(professional_id: int, service_id: int, matrix=None):
+    """
+    Minutos efectivos del servicio para el profesional, o None si no lo hace.
+    Sin `matrix` usa el índice en memoria.
+    """
+    if matrix is None:
+        matrix = get_matrix([service_id], [professional_id])
+    return matrix.get(professional_id, {}).get(service_id)
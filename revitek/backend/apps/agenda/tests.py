@@ -1,3 +1,894 @@
-from django.test import TestCase
+import random
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Crea tus pruebas aquí.
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.catalog.models import Category, Service
+from apps.agenda import checks, skills, time_rules
+from apps.agenda.intervals import free_grid_slots, merge_intervals, run_ends, subtract_intervals
+from apps.agenda.management.commands.benchmark_continuity import (
+    _check_continuity_naive,
+    _check_continuity_run_table,
+    _random_day,
+)
+from apps.agenda.management.commands.benchmark_slot_filter import _filter_slots_naive, _random_busy
+from apps.agenda.models import (
+    Break,
+    Professional,
+    ProfessionalService,
+    ScheduleException,
+    Slot,
+    SlotBlock,
+    WorkSchedule,
+)
+from apps.agenda.services import AvailabilityCalculator, materialize_slots_range
+
+
+def next_monday(weeks_ahead=1):
+    today = date.today()
+    return today + timedelta(days=7 * weeks_ahead - today.weekday())
+
+
+def local_dt(day, hour, minute=0):
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+class AgendaDataMixin:
+    """
+    Tres profesionales (lun-sáb 9:00-18:00, colación 13:00-14:00 de lun a vie),
+    un servicio de 60 min que hacen todos y uno de 120 min que no hace el primero.
+    """
+
+    @classmethod
+    def create_agenda(cls, slot_days=0):
+        category = Category.objects.create(name="Lavado")
+        cls.s60 = Service.objects.create(name="Lavado simple", category=category, duration_min=60)
+        cls.s120 = Service.objects.create(name="Lavado full", category=category, duration_min=120)
+        cls.pros = []
+        for i in range(3):
+            prof = Professional.objects.create(first_name=f"Profesional {i}")
+            for weekday in range(6):
+                schedule = WorkSchedule.objects.create(
+                    professional=prof, weekday=weekday, start_time=time(9), end_time=time(18)
+                )
+                if weekday < 5:
+                    Break.objects.create(work_schedule=schedule, start_time=time(13), end_time=time(14))
+            ProfessionalService.objects.create(professional=prof, service=cls.s60)
+            if i > 0:
+                ProfessionalService.objects.create(professional=prof, service=cls.s120)
+            cls.pros.append(prof)
+
+        cls.monday = next_monday()
+        if slot_days:
+            for prof in cls.pros:
+                materialize_slots_range(prof.id, cls.monday, slot_days)
+
+    def setUp(self):
+        # Los índices en memoria sobreviven al rollback entre tests
+        skills.invalidate()
+        time_rules.invalidate()
+
+
+class IntervalsTests(SimpleTestCase):
+    """Filtro por barrido (intervals) contra el filtro original slot × ocupado."""
+
+    def setUp(self):
+        self.start = timezone.make_aware(datetime(2025, 1, 6, 8, 0))
+        self.end = self.start + timedelta(hours=12)
+
+    def at(self, minutes):
+        return self.start + timedelta(minutes=minutes)
+
+    def test_merge_intervals_joins_overlapping_and_touching(self):
+        merged = merge_intervals([(5, 7), (1, 3), (3, 4), (6, 9), (12, 11)])
+        self.assertEqual(merged, [(1, 4), (5, 9)])
+
+    def test_subtract_intervals(self):
+        free = subtract_intervals(0, 100, [(-10, 5), (20, 30), (25, 40), (95, 120)])
+        self.assertEqual(free, [(5, 20), (40, 95)])
+
+    def test_touching_busy_interval_does_not_block(self):
+        busy = [(self.at(60), self.at(120))]
+        slots = free_grid_slots(self.start, self.at(180), busy, 60)
+        self.assertEqual(slots, [(self.start, self.at(60)), (self.at(120), self.at(180))])
+
+    def test_matches_naive_filter_on_random_days(self):
+        rng = random.Random(0)
+        for granularity in (5, 15, 60):
+            for day in range(200):
+                busy = _random_busy(rng, self.start, 12 * 60, rng.randrange(0, 41), granularity)
+                slot_min = granularity * rng.choice([1, 1, 2, 3, 12])
+                with self.subTest(granularity=granularity, day=day, slot_min=slot_min):
+                    self.assertEqual(
+                        free_grid_slots(self.start, self.end, busy, slot_min),
+                        _filter_slots_naive(self.start, self.end, busy, slot_min),
+                    )
+
+
+class ContinuityTests(SimpleTestCase):
+    """Tabla de rachas del calculador contra el recorrido original."""
+
+    durations = [30, 60, 90, 120, 180, 240]
+
+    def test_matches_naive_walk_on_random_days(self):
+        rng = random.Random(0)
+        for granularity in (5, 15, 60):
+            for day in range(100):
+                # Jornadas que empiezan fuera de cualquier grilla (ej. 09:07)
+                day_start = timezone.make_aware(datetime(2025, 1, 6, 9, rng.randrange(60)))
+                slots = _random_day(rng, day_start, granularity, rng.randrange(0, 16))
+                expected = [
+                    (slot.start, required)
+                    for required in self.durations
+                    for i, slot in enumerate(slots)
+                    if _check_continuity_naive(slots, i, required)
+                ]
+                with self.subTest(granularity=granularity, day=day):
+                    self.assertEqual(_check_continuity_run_table(slots, self.durations), expected)
+
+    def test_run_ends_follow_interval_edges(self):
+        self.assertEqual(run_ends([(7, 67), (67, 127), (130, 190)]), [127, 127, 190])
+        self.assertEqual(run_ends([(0, 60), (30, 50), (50, 100)]), [100, 100, 100])
+        self.assertEqual(run_ends([]), [])
+
+
+def _comparable(result):
+    """Lo que debe coincidir entre modos: las horas y quién las atiende (no los slot_ids)."""
+    return {item["inicio"]: sorted(item["professionals"]) for item in result}
+
+
+class VirtualAvailabilityParityTests(AgendaDataMixin, TestCase):
+    """El modo virtual (desde horarios) responde lo mismo que los slots materializados."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda()
+        first, second, third = cls.pros
+        tuesday = cls.monday + timedelta(days=1)
+        ScheduleException.objects.create(
+            professional=second, date=cls.monday, start=local_dt(cls.monday, 10), end=local_dt(cls.monday, 12)
+        )
+        SlotBlock.objects.create(
+            professional=third, date=tuesday, start=local_dt(tuesday, 15), end=local_dt(tuesday, 16)
+        )
+        for prof in cls.pros:
+            materialize_slots_range(prof.id, cls.monday, 7)
+
+        # Tiempo tomado: reservado, bloqueado a mano y retenido
+        Slot.objects.filter(professional=first, date=cls.monday, start=local_dt(cls.monday, 9)).update(status="RESERVED")
+        Slot.objects.filter(professional=third, date=cls.monday, start=local_dt(cls.monday, 11)).update(status="BLOCKED")
+        Slot.objects.filter(professional=second, date=tuesday, start=local_dt(tuesday, 16)).update(status="HELD")
+
+    def test_modes_match_for_every_day_and_service_combination(self):
+        combos = [[self.s60.id], [self.s120.id], [self.s60.id, self.s120.id]]
+        for offset in range(7):
+            date_str = (self.monday + timedelta(days=offset)).isoformat()
+            for service_ids in combos:
+                with self.subTest(date=date_str, services=service_ids):
+                    materialized = AvailabilityCalculator(service_ids, date_str, mode="materialized").compute()
+                    virtual = AvailabilityCalculator(service_ids, date_str, mode="virtual").compute()
+                    self.assertEqual(_comparable(virtual), _comparable(materialized))
+
+    def test_taken_time_is_not_offered(self):
+        result = _comparable(AvailabilityCalculator([self.s60.id], self.monday.isoformat(), mode="virtual").compute())
+        first, second, third = (prof.id for prof in self.pros)
+        self.assertEqual(result[local_dt(self.monday, 9)], [second, third])
+        self.assertEqual(result[local_dt(self.monday, 10)], [first, third])
+        self.assertEqual(result[local_dt(self.monday, 11)], [first])
+        self.assertNotIn(local_dt(self.monday, 13), result)
+
+
+class OffGridScheduleTests(AgendaDataMixin, TestCase):
+    """Un horario que no empieza en la hora en punto (09:07) se sigue ofreciendo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda()
+        cls.prof = Professional.objects.create(first_name="Desfasado")
+        schedule = WorkSchedule.objects.create(
+            professional=cls.prof, weekday=cls.monday.weekday(), start_time=time(9, 7), end_time=time(12, 7)
+        )
+        ProfessionalService.objects.create(professional=cls.prof, service=cls.s60)
+        ProfessionalService.objects.create(professional=cls.prof, service=cls.s120)
+        materialize_slots_range(cls.prof.id, cls.monday, 1)
+
+    def starts(self, service, mode):
+        result = AvailabilityCalculator([service.id], self.monday.isoformat(), mode=mode).compute()
+        return [item["inicio"] for item in result if self.prof.id in item["professionals"]]
+
+    def test_off_grid_starts_are_offered(self):
+        for mode in ("materialized", "virtual"):
+            with self.subTest(mode=mode):
+                self.assertEqual(
+                    self.starts(self.s60, mode),
+                    [local_dt(self.monday, 9, 7), local_dt(self.monday, 10, 7), local_dt(self.monday, 11, 7)],
+                )
+                self.assertEqual(
+                    self.starts(self.s120, mode),
+                    [local_dt(self.monday, 9, 7), local_dt(self.monday, 10, 7)],
+                )
+
+
+@override_settings(AGENDA_PROCESS_INDEX_TTL_SECONDS=60)
+class AvailabilityQueryBudgetTests(AgendaDataMixin, TestCase):
+    """
+    AvailabilityCalculator usa un número fijo de consultas, sin importar
+    cuántos servicios o profesionales participen:
+    - materializado: slots, cargas
+    - virtual: contexto de horarios (4), slots tomados, cargas
+    Con los índices en memoria activos, reglas horarias y matriz de
+    habilidades no consultan la BD; apagados suman una consulta cada uno.
+    """
+    QUERY_BUDGET = {"materialized": 2, "virtual": 6}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda(slot_days=7)
+
+    def setUp(self):
+        super().setUp()
+        # Los índices se arman una vez por proceso, fuera del presupuesto
+        time_rules.get_index()
+        skills.get_matrix()
+
+    def test_calculator_query_budget(self):
+        combos = [[self.s60.id], [self.s120.id], [self.s60.id, self.s120.id]]
+        for mode, budget in self.QUERY_BUDGET.items():
+            for service_ids in combos:
+                with self.subTest(mode=mode, services=service_ids):
+                    calculator = AvailabilityCalculator(service_ids, self.monday.isoformat(), mode=mode)
+                    with self.assertNumQueries(budget):
+                        self.assertTrue(calculator.compute())
+
+    def test_query_budget_does_not_grow_with_professionals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3, 8):
+                prof = Professional.objects.create(first_name=f"Profesional {i}")
+                WorkSchedule.objects.create(professional=prof, weekday=0, start_time=time(9), end_time=time(18))
+                ProfessionalService.objects.create(professional=prof, service=self.s60)
+                materialize_slots_range(prof.id, self.monday, 1)
+        skills.get_matrix()
+
+        for mode, budget in self.QUERY_BUDGET.items():
+            with self.subTest(mode=mode):
+                calculator = AvailabilityCalculator([self.s60.id], self.monday.isoformat(), mode=mode)
+                with self.assertNumQueries(budget):
+                    result = calculator.compute()
+                self.assertEqual(len(result[0]["professionals"]), 8)
+
+    @override_settings(AGENDA_PROCESS_INDEX_TTL_SECONDS=0)
+    def test_query_budget_without_process_indexes(self):
+        for mode, budget in self.QUERY_BUDGET.items():
+            with self.subTest(mode=mode):
+                calculator = AvailabilityCalculator([self.s60.id, self.s120.id], self.monday.isoformat(), mode=mode)
+                with self.assertNumQueries(budget + 2):
+                    self.assertTrue(calculator.compute())
+
+
+class AvailabilityRangeViewTests(AgendaDataMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda(slot_days=7)
+
+    def post(self, **data):
+        return self.client.post(reverse("availability-range"), data, format="json")
+
+    def test_returns_days_in_range(self):
+        response = self.post(
+            services=[self.s60.id],
+            start_date=self.monday.isoformat(),
+            end_date=(self.monday + timedelta(days=2)).isoformat(),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["days"]), 3)
+        self.assertTrue(response.data["complete"])
+
+    def test_rejects_invalid_services(self):
+        for services in ("abc", ["x"], {"id": 1}, [None]):
+            with self.subTest(services=services):
+                response = self.post(services=services, end_date=self.monday.isoformat())
+                self.assertEqual(response.status_code, 400)
+
+    def test_rejects_invalid_dates_and_limit(self):
+        cases = [
+            {"start_date": "2026-13-01", "end_date": self.monday.isoformat()},
+            {"end_date": ["2026-01-01"]},
+            {"start_date": 20260101, "limit": 5},
+            {"limit": "many"},
+            {"start_date": self.monday.isoformat(), "end_date": (self.monday - timedelta(days=1)).isoformat()},
+        ]
+        for extra in cases:
+            with self.subTest(**extra):
+                response = self.post(services=[self.s60.id], **extra)
+                self.assertEqual(response.status_code, 400)
+
+
+class AvailabilityBatchViewTests(AgendaDataMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda(slot_days=1)
+
+    def post(self, *queries):
+        return self.client.post(reverse("availability-batch"), {"queries": list(queries)}, format="json")
+
+    def test_returns_one_result_per_query(self):
+        date_str = self.monday.isoformat()
+        response = self.post(
+            {"services": [self.s60.id], "date": date_str},
+            {"services": [self.s60.id, self.s120.id], "date": date_str},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["services"] for r in response.data["results"]], [[self.s60.id], [self.s60.id, self.s120.id]])
+
+    def test_rejects_invalid_services(self):
+        # Un string no es una lista: "12" no debe leerse como [1, 2]
+        for services in ("12", ["x"], {"id": 1}, [None], []):
+            with self.subTest(services=services):
+                response = self.post({"services": services, "date": self.monday.isoformat()})
+                self.assertEqual(response.status_code, 400)
+
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+SHARED_CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://cache:6379"}}
+
+
+class SharedCacheChecksTests(SimpleTestCase):
+    """Las cachés de la agenda no se pueden activar sobre una caché local al proceso."""
+
+    @override_settings(CACHES=LOCMEM_CACHES, AGENDA_AVAILABILITY_CACHE_TIMEOUT=300)
+    def test_availability_cache_requires_shared_backend(self):
+        errors = checks.check_availability_cache(None)
+        self.assertEqual([error.id for error in errors], ["agenda.E001"])
+
+    @override_settings(CACHES=SHARED_CACHES, AGENDA_AVAILABILITY_CACHE_TIMEOUT=300)
+    def test_availability_cache_on_shared_backend(self):
+        self.assertEqual(checks.check_availability_cache(None), [])
+
+    @override_settings(CACHES=LOCMEM_CACHES, AGENDA_AVAILABILITY_CACHE_TIMEOUT=0)
+    def test_availability_cache_disabled(self):
+        self.assertEqual(checks.check_availability_cache(None), [])
+
+    @override_settings(CACHES=LOCMEM_CACHES, AGENDA_PROCESS_INDEX_TTL_SECONDS=60)
+    def test_process_indexes_require_shared_backend(self):
+        errors = checks.check_process_indexes(None)
+        self.assertEqual([error.id for error in errors], ["agenda.E002"])
+
+    @override_settings(CACHES=SHARED_CACHES, AGENDA_PROCESS_INDEX_TTL_SECONDS=60)
+    def test_process_indexes_on_shared_backend(self):
+        self.assertEqual(checks.check_process_indexes(None), [])
+
+
+class SingleFlightTests(APITestCase):
+    """Un líder calcula, los demás pedidos de la misma clave esperan su resultado."""
+
+    WAITERS = 3
+
+    def setUp(self):
+        from apps.agenda.singleflight import SingleFlight
+
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    def slow(self, value):
+        def fn():
+            self.calls.append(value)
+            self.release.wait(5)
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return fn
+
+    def run_flight(self, leader_fn, waiter_fn, wait_timeout=None):
+        """Lanza un líder y WAITERS seguidores con la misma clave; devuelve lo que obtuvo cada uno."""
+        outcomes = {}
+
+        def call(name, fn):
+            try:
+                outcomes[name] = self.flight.do("k", fn, wait_timeout=wait_timeout)
+            except Exception as e:
+                outcomes[name] = e
+
+        threads = [threading.Thread(target=call, args=("leader", leader_fn))]
+        threads[0].start()
+        while not self.calls:
+            time_module.sleep(0.001)
+        for i in range(self.WAITERS):
+            threads.append(threading.Thread(target=call, args=(f"waiter{i}", waiter_fn)))
+            threads[-1].start()
+        # Los seguidores quedan esperando al líder
+        time_module.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_waiters_share_the_leader_result(self):
+        outcomes = self.run_flight(self.slow("leader"), self.slow("waiter"))
+
+        self.assertEqual(self.calls, ["leader"])
+        self.assertEqual(set(outcomes.values()), {"leader"})
+        self.assertEqual(len(outcomes), self.WAITERS + 1)
+        self.assertEqual(self.flight.stats()["waits"], self.WAITERS)
+
+    def test_leader_exception_reaches_the_waiters(self):
+        error = ValueError("falló")
+        outcomes = self.run_flight(self.slow(error), self.slow("waiter"))
+
+        self.assertEqual(self.calls, [error])
+        self.assertTrue(all(outcome is error for outcome in outcomes.values()))
+        # La clave se libera: el próximo pedido vuelve a calcular
+        self.assertEqual(self.flight.do("k", lambda: "again"), "again")
+
+    def test_waiter_computes_alone_after_timeout(self):
+        outcomes = self.run_flight(self.slow("leader"), lambda: "own", wait_timeout=0.01)
+
+        self.assertEqual(outcomes.pop("leader"), "leader")
+        self.assertEqual(set(outcomes.values()), {"own"})
+        self.assertEqual(self.flight.stats()["waits"], 0)
+
+    def test_stats_endpoint_serves_the_counters(self):
+        from apps.agenda import availability_cache
+        from apps.clients.models import User
+
+        with mock.patch.object(availability_cache, "_flights", self.flight):
+            self.run_flight(self.slow("leader"), self.slow("waiter"))
+            self.flight.count("hits", 2)
+            self.flight.count("leaders")
+
+            self.client.force_authenticate(User(email="user@x.cl"))
+            self.assertEqual(self.client.get(reverse("availability-stats")).status_code, 403)
+
+            self.client.force_authenticate(User(email="admin@x.cl", is_staff=True))
+            response = self.client.get(reverse("availability-stats"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"hits": 2, "waits": self.WAITERS, "leaders": 1, "stale": 0})
+
+
+class TimeRuleTests(AgendaDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from apps.catalog.models import ServiceTimeRule
+
+        cls.create_agenda(slot_days=1)
+        # Sin pasar por validate_time_list (ej. carga directa o fixture)
+        ServiceTimeRule.objects.create(
+            service=cls.s60, weekday=0, allowed_times=["09:00", "11:00:00", "9h", "25:00", None, 10]
+        )
+        ServiceTimeRule.objects.create(service=cls.s120, weekday=0, allowed_times=["10:00"])
+
+    def test_malformed_times_are_skipped(self):
+        with self.assertLogs("apps.agenda.time_rules", "WARNING") as logs:
+            mask = time_rules.allowed_start_mask([self.s60.id], 0)
+        self.assertEqual(len(logs.output), 4)
+        self.assertTrue(time_rules.is_allowed(mask, local_dt(self.monday, 9)))
+        self.assertTrue(time_rules.is_allowed(mask, local_dt(self.monday, 11)))
+        self.assertFalse(time_rules.is_allowed(mask, local_dt(self.monday, 10)))
+
+        with self.assertLogs("apps.agenda.time_rules", "WARNING"):
+            result = AvailabilityCalculator([self.s60.id], self.monday.isoformat()).compute()
+        self.assertEqual([item["inicio"] for item in result], [local_dt(self.monday, 9), local_dt(self.monday, 11)])
+
+    @override_settings(AGENDA_PROCESS_INDEX_TTL_SECONDS=0)
+    def test_disabled_index_reads_only_the_requested_services(self):
+        self.assertEqual(set(time_rules.get_index([self.s120.id])), {(self.s120.id, 0)})
+
+
+@override_settings(AGENDA_PROCESS_INDEX_TTL_SECONDS=60)
+class SkillMatrixTests(AgendaDataMixin, TestCase):
+    """
+    Un worker cuyo índice no vio el cambio (la invalidación quedó en otro
+    proceso) puede mostrar datos viejos, pero nunca reservar con ellos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda(slot_days=1)
+
+    def setUp(self):
+        super().setUp()
+        self.prof = self.pros[1]
+        skills.get_matrix()
+        # Cambios sin on_commit: el índice de este proceso queda desactualizado
+        ProfessionalService.objects.filter(professional=self.prof, service=self.s60).update(
+            duration_override_min=90
+        )
+        ProfessionalService.objects.filter(professional=self.prof, service=self.s120).update(active=False)
+
+    def test_booking_validation_reads_the_database(self):
+        from rest_framework.exceptions import ValidationError
+        from apps.agenda.services import required_minutes
+
+        self.assertEqual(skills.effective_duration(self.prof.id, self.s120.id), 120)
+        self.assertEqual(
+            required_minutes(self.prof.id, [{"service_id": self.s60.id, "professional_id": self.prof.id}]),
+            90,
+        )
+        with self.assertRaises(ValidationError):
+            required_minutes(self.prof.id, [{"service_id": self.s120.id, "professional_id": self.prof.id}])
+
+    def test_index_expires_after_ttl(self):
+        self.assertIn(self.s120.id, skills.get_matrix()[self.prof.id])
+        with mock.patch("apps.agenda.indexes.time.monotonic", return_value=time_module.monotonic() + 61):
+            self.assertNotIn(self.s120.id, skills.get_matrix()[self.prof.id])
+
+    @override_settings(AGENDA_PROCESS_INDEX_TTL_SECONDS=0)
+    def test_disabled_index_reads_the_database(self):
+        self.assertEqual(skills.effective_duration(self.prof.id, self.s60.id), 90)
+
+    @override_settings(AGENDA_PROCESS_INDEX_TTL_SECONDS=0)
+    def test_disabled_index_reads_only_the_requested_services(self):
+        other = self.pros[2]
+        self.assertEqual(skills.get_matrix([self.s120.id]), {other.id: {self.s120.id: 120}})
+        self.assertEqual(set(skills.qualified_durations([self.s60.id])), {p.id for p in self.pros})
+
+
+class ConditionalReadTests(AgendaDataMixin, APITestCase):
+    """
+    GET con ETag: 200, luego 304 con If-None-Match, y 200 con un ETag nuevo
+    después de una escritura. Las versiones están en la BD: el 304 no depende
+    de la caché del proceso que atendió la escritura.
+    """
+    # Consultas para responder 304: solo la de versiones
+    NOT_MODIFIED_QUERY_BUDGET = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda(slot_days=1)
+
+    def reserve_first_slot(self):
+        from apps.agenda.services import notify_slots_changed
+
+        prof = self.pros[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            Slot.objects.filter(professional=prof, date=self.monday, start=local_dt(self.monday, 9)).update(
+                status="RESERVED"
+            )
+            notify_slots_changed({(prof.id, self.monday)})
+
+    def rename_service(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.s60.name = "Lavado simple (nuevo)"
+            self.s60.save()
+
+    def assert_conditional_read(self, url, write):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers["ETag"]
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), self.NOT_MODIFIED_QUERY_BUDGET)
+        self.assertEqual(second.headers["ETag"], etag)
+
+        write()
+        # Como en otro worker: nada en la caché local sabe de la escritura
+        cache.clear()
+
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third.headers["ETag"], etag)
+        return first, third
+
+    def test_slot_list(self):
+        day = self.monday.isoformat()
+        for url in (f"/agenda/slots/?date={day}", f"/agenda/slots/?date={day}&professional_id={self.pros[1].id}"):
+            with self.subTest(url=url):
+                first, third = self.assert_conditional_read(url, self.reserve_first_slot)
+                self.assertEqual(len(third.data), len(first.data) - 1)
+                Slot.objects.filter(date=self.monday).update(status="AVAILABLE")
+
+    def test_availability(self):
+        url = f"/agenda/availability/?services={self.s60.id}&date={self.monday.isoformat()}"
+        first, third = self.assert_conditional_read(url, self.reserve_first_slot)
+        self.assertEqual(len(first.data[0]["professionals"]), 3)
+        self.assertEqual(len(third.data[0]["professionals"]), 2)
+
+    def test_availability_month(self):
+        url = f"/agenda/availability/month/?services={self.s60.id}&month={self.monday:%Y-%m}"
+        self.assert_conditional_read(url, self.reserve_first_slot)
+
+    def test_catalog_services(self):
+        first, third = self.assert_conditional_read("/catalog/services/", self.rename_service)
+        self.assertIn("Lavado simple (nuevo)", {service["name"] for service in third.data})
+
+    def test_regions_and_communes(self):
+        from apps.clients.models import Commune, Region
+
+        region = Region.objects.create(name="Valparaíso", roman_number="V", number=5)
+        Commune.objects.create(name="Viña del Mar", region=region)
+
+        def rename_region():
+            with self.captureOnCommitCallbacks(execute=True):
+                region.name = "Región de Valparaíso"
+                region.save()
+
+        for url in ("/clients/regions/", "/clients/communes/"):
+            with self.subTest(url=url):
+                self.assert_conditional_read(url, rename_region)
+
+
+class DayLoadStrategyTests(AgendaDataMixin, TestCase):
+    """
+    La estrategia optimista no toca ProfessionalDayLoad dentro de la
+    transacción de la reserva: la recuenta al confirmar.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda(slot_days=1)
+
+    def setUp(self):
+        super().setUp()
+        for target in ("apps.agenda.signals.send_client_confirmation",
+                       "apps.whatsapp.signals.send_confirmation_template"):
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reserve(self, strategy, hour):
+        from apps.agenda.services import create_reservation_transaction
+
+        prof = self.pros[1]
+        slot = Slot.objects.get(professional=prof, start=local_dt(self.monday, hour))
+        return create_reservation_transaction(
+            {
+                "client": {"email": f"{strategy}@x.cl"},
+                "professional_id": prof.id,
+                "services": [{"service_id": self.s60.id, "professional_id": prof.id}],
+                "slot_id": slot.id,
+            },
+            strategy=strategy,
+        )
+
+    def load(self):
+        from apps.agenda.models import ProfessionalDayLoad
+
+        row = ProfessionalDayLoad.objects.filter(professional=self.pros[1], date=self.monday).first()
+        return row.reservations if row else 0
+
+    def test_pessimistic_updates_the_load_in_the_transaction(self):
+        with self.captureOnCommitCallbacks():
+            self.reserve("pessimistic", 9)
+            self.assertEqual(self.load(), 1)
+
+    def test_optimistic_recounts_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connection) as ctx:
+                self.reserve("optimistic", 9)
+            self.assertEqual(self.load(), 0)
+        self.assertFalse(any("professionaldayload" in q["sql"].lower() for q in ctx.captured_queries))
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.load(), 1)
+
+
+
+class SlotBlockViewTests(AgendaDataMixin, APITestCase):
+    """Un bloqueo afecta a todo slot que se superpone con él, no solo a los que contiene."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from apps.clients.models import User
+
+        cls.create_agenda(slot_days=1)
+        cls.admin = User.objects.create_user(email="admin@x.cl", password="x", is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def statuses(self):
+        slots = Slot.objects.filter(professional=self.pros[0], date=self.monday).order_by("start")
+        return {timezone.localtime(slot.start).hour: slot.status for slot in slots}
+
+    def create_block(self, start, end):
+        response = self.client.post(
+            reverse("slot-block-list"),
+            {
+                "professional": self.pros[0].id,
+                "date": self.monday.isoformat(),
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data["id"]
+
+    def test_blocks_and_releases_partially_covered_slots(self):
+        block_id = self.create_block(local_dt(self.monday, 9, 30), local_dt(self.monday, 10, 15))
+        statuses = self.statuses()
+        self.assertEqual((statuses[9], statuses[10], statuses[11]), ("BLOCKED", "BLOCKED", "AVAILABLE"))
+
+        response = self.client.delete(reverse("slot-block-detail", args=[block_id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual({self.statuses()[9], self.statuses()[10]}, {"AVAILABLE"})
+
+    def test_release_keeps_slots_still_touched_by_another_block(self):
+        first = self.create_block(local_dt(self.monday, 9, 30), local_dt(self.monday, 10, 15))
+        self.create_block(local_dt(self.monday, 10, 45), local_dt(self.monday, 11, 15))
+
+        response = self.client.patch(
+            reverse("slot-block-detail", args=[first]),
+            {"start": local_dt(self.monday, 15).isoformat(), "end": local_dt(self.monday, 15, 30).isoformat()},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        statuses = self.statuses()
+        self.assertEqual(
+            (statuses[9], statuses[10], statuses[11], statuses[15]),
+            ("AVAILABLE", "BLOCKED", "BLOCKED", "BLOCKED"),
+        )
+
+
+class SlotHoldViewTests(AgendaDataMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda(slot_days=1)
+
+    def hold(self, email, hour, **extra):
+        slot = Slot.objects.get(professional=self.pros[1], start=local_dt(self.monday, hour))
+        return self.client.post(
+            reverse("slot-hold-create"),
+            {
+                "client": {"email": email},
+                "professional_id": self.pros[1].id,
+                "services": [{"service_id": self.s60.id, "professional_id": self.pros[1].id}],
+                "slot_id": slot.id,
+                **extra,
+            },
+            format="json",
+        )
+
+    def test_requires_recaptcha(self):
+        with mock.patch("apps.agenda.views.verify_recaptcha", return_value=False):
+            response = self.hold("a@x.cl", 9)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Slot.objects.filter(status="HELD").exists())
+
+    def test_requires_client_email(self):
+        self.assertEqual(self.hold("", 9).status_code, 400)
+
+    def test_new_hold_releases_the_previous_one_of_the_client(self):
+        from apps.agenda.models import SlotHold
+
+        self.assertEqual(self.hold("a@x.cl", 9).status_code, 201)
+        self.assertEqual(self.hold("A@x.cl", 10).status_code, 201)
+        self.assertEqual(self.hold("b@x.cl", 11).status_code, 201)
+
+        self.assertEqual(SlotHold.objects.filter(holder="a@x.cl").get().start, local_dt(self.monday, 10))
+        held = Slot.objects.filter(status="HELD").order_by("start").values_list("start", flat=True)
+        self.assertEqual(list(held), [local_dt(self.monday, 10), local_dt(self.monday, 11)])
+
+
+class IdempotentCreateTests(AgendaDataMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda(slot_days=1)
+
+    def setUp(self):
+        super().setUp()
+        # Sin notificaciones: el email corre en otro hilo
+        for target in ("apps.agenda.signals.send_client_confirmation",
+                       "apps.whatsapp.signals.send_confirmation_template"):
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, email="a@x.cl", key="k1", hour=9):
+        prof = self.pros[1]
+        slot = Slot.objects.get(professional=prof, start=local_dt(self.monday, hour))
+        return self.client.post(
+            reverse("reservation-list"),
+            {
+                "client": {"email": email},
+                "professional_id": prof.id,
+                "services": [{"service_id": self.s60.id, "professional_id": prof.id}],
+                "slot_id": slot.id,
+                "recaptcha_token": "token",
+            },
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_recaptcha_runs_outside_the_booking_transaction(self):
+        depth = len(connection.atomic_blocks)
+        seen = []
+
+        def verify(token):
+            seen.append(len(connection.atomic_blocks))
+            return True
+
+        with mock.patch("apps.agenda.views.verify_recaptcha", side_effect=verify):
+            first = self.post()
+            replay = self.post()
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(seen, [depth])
+
+    def test_failed_recaptcha_releases_the_key(self):
+        from apps.agenda.models import IdempotencyKey
+
+        with mock.patch("apps.agenda.views.verify_recaptcha", return_value=False):
+            self.assertEqual(self.post().status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post().status_code, 201)
+
+    def test_key_is_scoped_to_the_client(self):
+        with mock.patch("apps.agenda.views.verify_recaptcha", return_value=True):
+            first = self.post("a@x.cl")
+            other = self.post("b@x.cl", hour=10)
+            replay = self.post("a@x.cl")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(other.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", other)
+        self.assertNotEqual(other.data["id"], first.data["id"])
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+
+
+class BulkImportTests(AgendaDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from apps.clients.models import Commune, Region
+
+        cls.create_agenda(slot_days=1)
+        region = Region.objects.create(name="Metropolitana", roman_number="XIII", number=13)
+        cls.commune = Commune.objects.create(name="Providencia", region=region)
+
+    def row(self, email, plate, **extra):
+        return {
+            "client": {"email": email},
+            "vehicle": {"license_plate": plate, "brand": "Kia", "model": "Rio"},
+            "services": [self.s60.id],
+            "date": self.monday.isoformat(),
+            **extra,
+        }
+
+    def test_new_plate_keeps_the_first_client_of_the_batch(self):
+        from apps.agenda.services import import_reservations
+        from apps.clients.models import Vehicle
+
+        with self.captureOnCommitCallbacks():
+            reports = import_reservations(
+                [self.row("fleet@x.cl", "AB0001"), self.row("other@x.cl", "ab0001")], notify=False
+            )
+
+        self.assertEqual([r["status"] for r in reports], ["created", "error"])
+        self.assertEqual(reports[1]["error"], "Vehicle AB0001 belongs to another client.")
+        self.assertEqual(Vehicle.objects.get(license_plate="AB0001").owner.email, "fleet@x.cl")
+
+    def test_addresses_are_resolved_per_client_and_alias(self):
+        from apps.agenda.models import Reservation
+        from apps.agenda.services import import_reservations
+
+        address = {"street": "Av. Providencia", "number": "100", "commune_id": self.commune.id}
+        rows = [
+            self.row("fleet@x.cl", "AB0001", address=address),
+            self.row("fleet@x.cl", "AB0002", address={**address, "number": "200"}),
+            self.row("fleet@x.cl", "AB0003", address={**address, "alias": "Bodega"}),
+            self.row("fleet@x.cl", "AB0004", address={"alias": "Taller", "street": "Sin comuna"}),
+        ]
+        with self.captureOnCommitCallbacks():
+            reports = import_reservations(rows, notify=False)
+
+        reservations = [Reservation.objects.get(id=r["reservation_id"]) for r in reports]
+        self.assertEqual(reservations[0].address_id, reservations[1].address_id)
+        self.assertEqual(reservations[0].address.number, "200")
+        self.assertEqual(reservations[2].address.alias, "Bodega")
+        self.assertIsNone(reservations[3].address)
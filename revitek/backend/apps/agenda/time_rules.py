@@ -0,0 +1,99 @@
+"""
+Índice compilado de ServiceTimeRule en memoria del proceso.
+
+Cada regla (service_id, weekday) se compila a una máscara de 1440 bits:
+el bit m encendido significa que se permite iniciar a los m minutos del día.
+Intersectar reglas de varios servicios es un AND y validar un inicio es
+probar un bit, sin consultas ni strftime por slot.
+
+El índice vive en memoria del proceso (ver indexes.ProcessIndex, apagado
+por defecto). Las señales de ServiceTimeRule lo invalidan localmente y
+suben una versión compartida en la caché, para que los demás procesos lo
+reconstruyan en su próxima lectura.
+
+Una hora mal escrita en una regla (ej. "9h" o "25:00", cargada sin pasar
+por validate_time_list) se descarta con un warning: no puede tumbar la
+disponibilidad de todos los servicios.
+"""
+import logging
+
+from .indexes import ProcessIndex
+
+logger = logging.getLogger(__name__)
+
+
+def minute_of_day(value: str) -> int:
+    """ "HH:MM" (o "HH:MM:00") -> minutos desde medianoche. ValueError si no es una hora válida."""
+    if not isinstance(value, str):
+        raise ValueError(f"hora inválida: {value!r}")
+    parts = value.split(":")
+    if len(parts) == 3 and parts[2] == "00":
+        parts = parts[:2]
+    hours, minutes = parts
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"hora inválida: {value!r}")
+    return hours * 60 + minutes
+
+
+def compile_allowed_times(allowed_times) -> int:
+    mask = 0
+    for value in allowed_times or ():
+        try:
+            mask |= 1 << minute_of_day(value)
+        except ValueError:
+            logger.warning("Hora inválida en ServiceTimeRule descartada: %r", value)
+    return mask
+
+
+def _build(service_ids=None):
+    from apps.catalog.models import ServiceTimeRule
+
+    rules = ServiceTimeRule.objects.all()
+    if service_ids is not None:
+        rules = rules.filter(service_id__in={int(s) for s in service_ids})
+    return {
+        (service_id, weekday): compile_allowed_times(allowed_times)
+        for service_id, weekday, allowed_times in rules.values_list(
+            "service_id", "weekday", "allowed_times"
+        )
+    }
+
+
+_index = ProcessIndex("agenda:time_rules:version", _build)
+
+
+def get_index(service_ids=None) -> dict:
+    """
+    {(service_id, weekday): máscara}. Con el índice apagado lee de la BD solo
+    las reglas de `service_ids` (None = todas).
+    """
+    return _index.get(service_ids=service_ids)
+
+
+def invalidate():
+    """Descarta el índice local y avisa a los demás procesos."""
+    _index.invalidate()
+
+
+def allowed_start_mask(service_ids, weekday: int, index=None):
+    """
+    Máscara de minutos de inicio permitidos para TODOS los servicios en el
+    día de la semana. None = cualquier hora (ningún servicio tiene regla);
+    0 = sin horas comunes. `index` evita releerlo al calcular varios días.
+    """
+    if index is None:
+        index = get_index(service_ids)
+    mask = None
+    for service_id in set(service_ids):
+        rule = index.get((int(service_id), weekday))
+        if rule is not None:
+            mask = rule if mask is None else mask & rule
+    return mask
+
+
+def is_allowed(mask, local_dt) -> bool:
+    """True si `local_dt` (hora local) es un inicio permitido por la máscara."""
+    if mask is None:
+        return True
+    return bool((mask >> (local_dt.hour * 60 + local_dt.minute)) & 1)
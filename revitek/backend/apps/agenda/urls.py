@@ -6,6 +6,8 @@ from .views import (
     list_slots,
     generate_slots,
     cancel_reservation_view,
+    create_slot_hold,
+    release_slot_hold_view,
     confirm_reservation_via_link,
     SlotBlockViewSet,
     ProfessionalViewSet,
@@ -14,6 +16,10 @@ from .views import (
     BreakViewSet,
     ScheduleExceptionViewSet,
     aggregated_availability,
+    availability_range,
+    availability_month,
+    availability_stats,
+    availability_batch,
     dashboard_stats
 )
 
@@ -40,6 +46,10 @@ urlpatterns = [
     # Cancelar reserva
     path("reservations/<int:pk>/cancel/", cancel_reservation_view, name="cancel-reservation"),
 
+    # Retención de slots durante el checkout
+    path("holds/", create_slot_hold, name="slot-hold-create"),
+    path("holds/<uuid:token>/", release_slot_hold_view, name="slot-hold-release"),
+
     # Slot blocks (admin)
     # Bloqueos de slots (admin) - Ahora vía ViewSet en /api/agenda/blocks/
     # path("blocks/", list_blocks, name="list-blocks"),
@@ -47,6 +57,10 @@ urlpatterns = [
     # path("blocks/<int:pk>/update/", update_block, name="update-block"),
     # path("blocks/<int:pk>/delete/", delete_block, name="delete-block"),
     path("availability/", aggregated_availability, name="aggregated-availability"),
+    path("availability/range/", availability_range, name="availability-range"),
+    path("availability/month/", availability_month, name="availability-month"),
+    path("availability/stats/", availability_stats, name="availability-stats"),
+    path("availability/batch/", availability_batch, name="availability-batch"),
     path("dashboard/", dashboard_stats, name="dashboard-stats"),
     
     # Público: confirmación por WhatsApp
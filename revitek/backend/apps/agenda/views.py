@@ -34,7 +34,9 @@ from .serializers import (
     ProfessionalServiceSerializer,
     WorkScheduleSerializer,
     BreakSerializer,
-    ScheduleExceptionSerializer
+    ScheduleExceptionSerializer,
+    SlotHoldCreateSerializer,
+    SlotHoldSerializer,
 )
 from .services import (
     generate_daily_slots,
@@ -46,8 +48,16 @@ from .services import (
     create_default_schedule,
     validate_booking_rules,
     confirm_reservation_by_token,
+    virtual_availability_enabled,
+    compute_virtual_slots,
+    apply_slot_blocks,
+    release_slot_hold,
+    import_reservations,
 )
+from .availability_cache import etag_stamp
+from .idempotency import idempotent_response
 from .utils import verify_recaptcha
+from core.conditional import etag_matches, make_etag, not_modified, with_etag
 from rest_framework.exceptions import PermissionDenied
 
 
@@ -263,18 +273,70 @@ def list_slots(request):
     professional_id = request.query_params.get("professional_id")
     date_str = request.query_params.get("date")
 
+    # Con fecha, el listado se versiona por (profesional, día): If-None-Match
+    # se responde con 304 sin cargar ni serializar slots
+    etag = _slots_etag(professional_id, date_str)
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+
+    if virtual_availability_enabled():
+        # Sin slots AVAILABLE en BD: se calculan para el día pedido
+        try:
+            target_date = datetime.strptime(date_str or "", "%Y-%m-%d").date()
+        except ValueError:
+            return Response({"detail": "date (YYYY-MM-DD) is required"}, status=400)
+
+        professionals = Professional.objects.filter(active=True)
+        if professional_id:
+            professionals = professionals.filter(pk=professional_id)
+        professionals = {p.id: p for p in professionals}
+
+        slots = []
+        for prof_id, prof_slots in compute_virtual_slots(professionals.keys(), target_date).items():
+            for slot in prof_slots:
+                slot.professional = professionals[prof_id]
+                slots.append(slot)
+        slots.sort(key=lambda slot: slot.start)
+        return with_etag(Response(SlotSerializer(slots, many=True).data), etag)
+
     qs = get_available_slots(
         professional_id=professional_id,
         date_filter=date_str,
     )
 
     serializer = SlotSerializer(qs, many=True)
-    return Response(serializer.data)
+    return with_etag(Response(serializer.data), etag)
+
+
+def _slots_etag(professional_id, date_str):
+    """ETag del listado de slots de un día, o None si no se puede versionar."""
+    try:
+        target_date = datetime.strptime(date_str or "", "%Y-%m-%d").date()
+        prof_id = int(professional_id) if professional_id else None
+    except ValueError:
+        return None
+    return make_etag(
+        "slots",
+        virtual_availability_enabled(),
+        professional_id,
+        target_date,
+        etag_stamp([target_date], prof_id),
+    )
+
+
+def _query_services(request):
+    """?services=1,2 o ?services=1&services=2 -> [1, 2] (ValueError si no son enteros)."""
+    raw = ",".join(request.query_params.getlist("services"))
+    return [int(s) for s in raw.split(",") if s.strip()]
 
 
 # =====================================================================
 # 2) Reservation ViewSet
 # =====================================================================
+# Máximo de filas por importación masiva
+BULK_IMPORT_MAX_ROWS = 500
+
+
 class ReservationViewSet(viewsets.ViewSet):
     """
     Público: crear reserva
@@ -284,6 +346,8 @@ class ReservationViewSet(viewsets.ViewSet):
     def get_permissions(self):
         if self.action == "create":
             self.permission_classes = [AllowAny]
+        elif self.action == "bulk_import":
+            self.permission_classes = [IsAdminUser]
         else:
             self.permission_classes = [IsAuthenticated] # Changed from IsAdminUser
         return super().get_permissions()
@@ -354,7 +418,17 @@ class ReservationViewSet(viewsets.ViewSet):
         - address
         - services
         - slot chain
+        Con cabecera Idempotency-Key los reintentos reciben la misma respuesta.
         """
+        serializer = ReservationCreateSerializer(data=request.data)
+        return idempotent_response(
+            request,
+            lambda: self._save_reservation(serializer),
+            prepare=lambda: self._validate_create(request, serializer),
+        )
+
+    def _validate_create(self, request, serializer):
+        """Validaciones previas a la transacción: Response de error o None."""
         # 1. Verificar token de reCAPTCHA
         recaptcha_token = request.data.get('recaptcha_token')
         if not verify_recaptcha(recaptcha_token):
@@ -368,16 +442,16 @@ class ReservationViewSet(viewsets.ViewSet):
         if not is_valid:
             return Response({"detail": error_msg}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = ReservationCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return None
 
-        if serializer.is_valid():
-            reservation = serializer.save()
-            return Response(
-                ReservationDetailSerializer(reservation).data,
-                status=status.HTTP_201_CREATED,
-            )
-
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    def _save_reservation(self, serializer):
+        reservation = serializer.save()
+        return Response(
+            ReservationDetailSerializer(reservation).data,
+            status=status.HTTP_201_CREATED,
+        )
 
     # --------- Retrieve (Admin/Professional) ---------
     def retrieve(self, request, pk=None):
@@ -428,6 +502,43 @@ class ReservationViewSet(viewsets.ViewSet):
         serializer = ReservationDetailSerializer(reservation)
         return Response(serializer.data)
 
+    # --------- Bulk Import (Admin) ---------
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_import(self, request):
+        """
+        Importa en bloque las reservas de una flota (ver services.import_reservations).
+        Body:
+        {
+            "client": {...},          # por defecto para filas sin client
+            "rows": [{"services": [1], "date": "YYYY-MM-DD", "start": "09:00", "vehicle": {...}}, ...],
+            "dry_run": false,         # solo planificar
+            "notify": true            # emails/WhatsApp en un despacho al final
+        }
+        Devuelve el resultado de cada fila, en el mismo orden.
+        """
+        rows = request.data.get("rows")
+        if not isinstance(rows, list) or not rows:
+            return Response({"detail": "rows[] is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > BULK_IMPORT_MAX_ROWS:
+            return Response(
+                {"detail": f"Batch cannot exceed {BULK_IMPORT_MAX_ROWS} rows"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not all(isinstance(row, dict) for row in rows):
+            return Response({"detail": "Each row must be an object"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = import_reservations(
+            rows,
+            defaults={"client": request.data.get("client") or {}},
+            dry_run=bool(request.data.get("dry_run")),
+            notify=request.data.get("notify", True) is not False,
+        )
+        created = sum(1 for result in results if result["status"] == "created")
+        return Response(
+            {"created": created, "results": results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
     # --------- Complete (Admin/Professional) ---------
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
@@ -513,10 +624,12 @@ def generate_slots(request):
     except Exception:
         return Response({"detail": "Invalid date format"}, status=400)
 
-    from .services import generate_slots_range
-    
-    # Generar para 30 días comenzando desde la fecha dada
-    slots = generate_slots_range(professional_id, target_date, days=30)
+    from .services import generate_slots_range, get_regeneration_horizon
+
+    # Regenerar desde la fecha dada hasta el horizonte materializado
+    horizon = get_regeneration_horizon(professional_id)
+    days = max(1, (horizon - target_date).days + 1)
+    slots = generate_slots_range(professional_id, target_date, days=days)
     return Response(SlotSerializer(slots, many=True).data)
 
 
@@ -530,7 +643,12 @@ def cancel_reservation_view(request, pk=None):
     Path param or body:
     - /api/agenda/reservations/{id}/cancel/
     - { "reservation_id": X, "by": "client" | "admin", "token": "..." }
+    Con cabecera Idempotency-Key los reintentos reciben la misma respuesta.
     """
+    return idempotent_response(request, lambda: _cancel_reservation(request, pk))
+
+
+def _cancel_reservation(request, pk=None):
     reservation_id = pk or request.data.get("reservation_id")
     cancelled_by = request.data.get("by", "admin")
     token = request.data.get("token")
@@ -574,6 +692,52 @@ def cancel_reservation_view(request, pk=None):
     )
 
 
+# =====================================================================
+# 4b) Slot Holds (checkout)
+# =====================================================================
+@api_view(["POST"])
+@permission_classes([AllowAny])
+def create_slot_hold(request):
+    """
+    Retiene la cadena de slots mientras el cliente completa el checkout.
+    Body: { "client": {"email": ..., "phone": ...}, "professional_id": X,
+            "services": [...], "slot_id": Y | "start": "...", "recaptcha_token": "..." }
+    Devuelve el token a enviar como hold_token al crear la reserva y su
+    vencimiento (AGENDA_SLOT_HOLD_TTL_SECONDS). Un hold nuevo del mismo
+    cliente libera el anterior.
+    """
+    # Misma verificación de seguridad que la reserva
+    if not verify_recaptcha(request.data.get("recaptcha_token")):
+        return Response(
+            {"detail": "Verificación de seguridad fallida. Por favor intenta nuevamente."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Mismas reglas que la reserva (anticipación, una reserva pendiente por cliente)
+    client_data = request.data.get("client")
+    is_valid, error_msg = validate_booking_rules({
+        "slot_id": request.data.get("slot_id"),
+        "start": request.data.get("start"),
+        "client": client_data if isinstance(client_data, dict) else {},
+    })
+    if not is_valid:
+        return Response({"detail": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = SlotHoldCreateSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    hold = serializer.save()
+    return Response(SlotHoldSerializer(hold).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(["DELETE"])
+@permission_classes([AllowAny])
+def release_slot_hold_view(request, token):
+    """Libera un hold antes de que venza (el cliente cambió de horario)."""
+    if not release_slot_hold(token):
+        return Response({"detail": "Hold not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # =====================================================================
 # 5) Slot Blocks (Admin/Professional) - ViewSet
 # =====================================================================
@@ -628,12 +792,7 @@ class SlotBlockViewSet(viewsets.ModelViewSet):
         block = serializer.save(created_by=user)
         
         # Marcar slots superpuestos como BLOQUEADOS
-        Slot.objects.filter(
-            professional_id=block.professional_id,
-            start__gte=block.start,
-            end__lte=block.end,
-            status="AVAILABLE",
-        ).update(status="BLOCKED")
+        apply_slot_blocks(block.professional_id, block.date)
 
     def perform_update(self, serializer):
         # La verificación RBAC es manejada implícitamente por get_queryset (el usuario solo ve sus propios bloqueos),
@@ -646,54 +805,226 @@ class SlotBlockViewSet(viewsets.ModelViewSet):
         old_prof = instance.professional_id
         old_start = instance.start
         old_end = instance.end
+        old_date = instance.date
         
         updated = serializer.save()
         
-        # Liberar slots anteriores
-        Slot.objects.filter(
-            professional_id=old_prof,
-            start__gte=old_start,
-            end__lte=old_end,
-            status="BLOCKED",
-        ).update(status="AVAILABLE")
-
-        # Bloquear nuevos slots
-        Slot.objects.filter(
-            professional_id=updated.professional_id,
-            start__gte=updated.start,
-            end__lte=updated.end,
-            status="AVAILABLE",
-        ).update(status="BLOCKED")
+        # Liberar slots anteriores y bloquear los nuevos
+        apply_slot_blocks(old_prof, old_date, released=[(old_start, old_end)])
+        if (updated.professional_id, updated.date) != (old_prof, old_date):
+            apply_slot_blocks(updated.professional_id, updated.date)
 
     def perform_destroy(self, instance):
-        # Restaurar slots
-        Slot.objects.filter(
-            professional_id=instance.professional_id,
-            start__gte=instance.start,
-            end__lte=instance.end,
-            status="BLOCKED",
-        ).update(status="AVAILABLE")
-        
         instance.delete()
 
+        # Restaurar slots que ya no toca ningún otro bloqueo
+        apply_slot_blocks(instance.professional_id, instance.date, released=[(instance.start, instance.end)])
 
-@api_view(["POST"])
+
+@api_view(["GET", "POST"])
 def aggregated_availability(request):
     """
     Calcula la disponibilidad agregada para múltiples servicios en una fecha específica.
     Devuelve slots consolidados donde TODOS los servicios solicitados pueden realizarse.
+    POST {"services": [...], "date": "YYYY-MM-DD"} o GET ?services=1,2&date=YYYY-MM-DD;
+    el GET lleva ETag y responde 304 a If-None-Match si nada cambió.
     """
-    services = request.data.get("services", [])
-    date = request.data.get("date")
+    if request.method == "GET":
+        try:
+            services = _query_services(request)
+        except ValueError:
+            return Response({"error": "Invalid services"}, status=400)
+        date = request.query_params.get("date")
+    else:
+        services = request.data.get("services", [])
+        date = request.data.get("date")
 
     if not services or not date:
         return Response({"error": "services[] and date are required"}, status=400)
 
+    etag = None
+    if request.method == "GET":
+        try:
+            target_date = datetime.strptime(date, "%Y-%m-%d").date()
+        except ValueError:
+            return Response({"error": "Invalid date (expected YYYY-MM-DD)"}, status=400)
+        etag = make_etag(
+            "availability",
+            virtual_availability_enabled(),
+            sorted(set(services)),
+            date,
+            etag_stamp([target_date]),
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
     from .services import compute_aggregated_availability
 
     data = compute_aggregated_availability(services, date)
 
-    return Response(data)
+    return with_etag(Response(data), etag)
+
+
+# Máximo de consultas por lote
+AVAILABILITY_BATCH_MAX_QUERIES = 20
+
+
+@api_view(["POST"])
+def availability_batch(request):
+    """
+    Varias consultas de disponibilidad agregada en una sola petición.
+    Body:
+    {
+        "queries": [
+            {"services": [1], "date": "YYYY-MM-DD"},
+            {"services": [1, 2], "date": "YYYY-MM-DD"}
+        ]
+    }
+    Devuelve un resultado por consulta, en el mismo orden.
+    """
+    queries = request.data.get("queries")
+
+    if not isinstance(queries, list) or not queries:
+        return Response({"error": "queries[] is required"}, status=400)
+    if len(queries) > AVAILABILITY_BATCH_MAX_QUERIES:
+        return Response({"error": f"Batch cannot exceed {AVAILABILITY_BATCH_MAX_QUERIES} queries"}, status=400)
+
+    parsed = []
+    for index, query in enumerate(queries):
+        try:
+            services = query["services"]
+            if not isinstance(services, list):
+                raise TypeError
+            services = [int(s) for s in services]
+            date_str = datetime.strptime(query["date"], "%Y-%m-%d").date().isoformat()
+        except (KeyError, TypeError, ValueError):
+            return Response({"error": f"queries[{index}] needs services[] and date (YYYY-MM-DD)"}, status=400)
+        if not services:
+            return Response({"error": f"queries[{index}] needs services[] and date (YYYY-MM-DD)"}, status=400)
+        parsed.append((services, date_str))
+
+    from .services import compute_aggregated_availability_batch
+
+    results = compute_aggregated_availability_batch(parsed)
+
+    return Response({
+        "results": [
+            {"services": services, "date": date_str, "slots": slots}
+            for (services, date_str), slots in zip(parsed, results)
+        ]
+    })
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def availability_stats(request):
+    """
+    Contadores del single-flight de disponibilidad de este proceso (worker):
+    hits de caché, esperas a un cálculo en vuelo, cálculos (leaders) y
+    resultados vencidos servidos mientras se revalidan.
+    """
+    from .availability_cache import flight_stats
+
+    return Response(flight_stats())
+
+
+# Máximo de días por consulta de rango (un calendario mensual cabe holgado)
+AVAILABILITY_RANGE_MAX_DAYS = 93
+
+
+@api_view(["POST"])
+def availability_range(request):
+    """
+    Disponibilidad agregada para un rango de días en una sola consulta.
+    Body:
+    {
+        "services": [1, 2],
+        "start_date": "YYYY-MM-DD",   (opcional, default hoy)
+        "end_date": "YYYY-MM-DD",     (opcional si viene limit)
+        "limit": 5                    (opcional: primeros N horarios)
+    }
+    Sin end_date, busca hasta el horizonte de slots.
+    """
+    services = request.data.get("services", [])
+    end_str = request.data.get("end_date")
+    limit = request.data.get("limit")
+
+    if not services or (not end_str and not limit):
+        return Response({"error": "services[] and end_date or limit are required"}, status=400)
+    try:
+        if not isinstance(services, list):
+            raise TypeError
+        services = [int(s) for s in services]
+    except (TypeError, ValueError):
+        return Response({"error": "services must be a list of service ids"}, status=400)
+
+    from .services import compute_availability_range, get_horizon_target
+
+    try:
+        start_str = request.data.get("start_date")
+        start = datetime.strptime(start_str, "%Y-%m-%d").date() if start_str else timezone.localdate()
+        end = datetime.strptime(end_str, "%Y-%m-%d").date() if end_str else max(start, get_horizon_target())
+        limit = int(limit) if limit else None
+    except (TypeError, ValueError):
+        return Response({"error": "Invalid date or limit"}, status=400)
+
+    if end < start:
+        return Response({"error": "end_date must be on or after start_date"}, status=400)
+    if (end - start).days + 1 > AVAILABILITY_RANGE_MAX_DAYS:
+        return Response({"error": f"Range cannot exceed {AVAILABILITY_RANGE_MAX_DAYS} days"}, status=400)
+    if limit is not None and limit <= 0:
+        return Response({"error": "limit must be positive"}, status=400)
+
+    days, complete = compute_availability_range(services, start, end, limit=limit)
+
+    return Response({
+        "days": [{"date": day["date"].isoformat(), "slots": day["slots"]} for day in days],
+        "openings": sum(len(day["slots"]) for day in days),
+        "complete": complete,
+    })
+
+
+@api_view(["GET"])
+def availability_month(request):
+    """
+    Cantidad de horarios disponibles por día de un mes (para marcar días
+    llenos en el calendario sin pedir la disponibilidad día por día).
+    Query: ?services=1,2&month=YYYY-MM
+    """
+    month_str = request.query_params.get("month")
+
+    try:
+        services = _query_services(request)
+        month_start = datetime.strptime(month_str, "%Y-%m").date() if month_str else None
+    except ValueError:
+        return Response({"error": "Invalid services or month (expected YYYY-MM)"}, status=400)
+
+    if not services or not month_start:
+        return Response({"error": "services and month are required"}, status=400)
+
+    import calendar
+    from .services import compute_month_heatmap
+
+    month_days = [
+        month_start + timedelta(days=i)
+        for i in range(calendar.monthrange(month_start.year, month_start.month)[1])
+    ]
+    etag = make_etag(
+        "availability-month",
+        virtual_availability_enabled(),
+        sorted(set(services)),
+        month_start.strftime("%Y-%m"),
+        etag_stamp(month_days),
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    days = compute_month_heatmap(services, month_start)
+
+    return with_etag(Response({
+        "month": month_start.strftime("%Y-%m"),
+        "days": [{"date": day["date"].isoformat(), "openings": day["openings"]} for day in days],
+    }), etag)
 
 
 
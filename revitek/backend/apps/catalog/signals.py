@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.conditional import bump_data_version
+from .models import Category, Service
+
+# Versión de datos de las lecturas del catálogo (ETag de ServiceViewSet)
+CATALOG_VERSION = "catalog"
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalog_version(sender, **kwargs):
+    """El listado de servicios incluye el nombre de la categoría."""
+    bump_data_version(CATALOG_VERSION)
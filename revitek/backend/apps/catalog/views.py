@@ -1,13 +1,16 @@
 from rest_framework import viewsets
 from rest_framework.permissions import AllowAny, IsAdminUser
+from core.conditional import ConditionalReadMixin
 from .models import Service, Category, ServiceTimeRule
 from .serializers import ServiceSerializer, CategorySerializer, ServiceTimeRuleSerializer
 from .permissions import IsAdminOrReadOnly
+from .signals import CATALOG_VERSION
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(ConditionalReadMixin, viewsets.ModelViewSet):
     serializer_class = ServiceSerializer
     permission_classes = [IsAdminOrReadOnly]
+    etag_versions = (CATALOG_VERSION,)
 
     def get_queryset(self):
         queryset = Service.objects.select_related('category')
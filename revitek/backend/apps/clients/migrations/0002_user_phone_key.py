@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2025-12-05 19:40
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+# Copia congelada de apps.clients.utils.phone_key: la migración no debe
+# cambiar si la función cambia después.
+PHONE_KEY_DIGITS = 8
+
+
+def phone_key(phone):
+    clean_phone = ''.join(filter(str.isdigit, str(phone or "")))
+    if len(clean_phone) < PHONE_KEY_DIGITS:
+        return ""
+    return clean_phone[-PHONE_KEY_DIGITS:]
+
+
+def fill_phone_key(apps, schema_editor):
+    """Calcula phone_key (últimos 8 dígitos del teléfono) para los usuarios existentes."""
+    User = apps.get_model('clients', 'User')
+    batch = []
+    for user in User.objects.only('id', 'phone').iterator(chunk_size=1000):
+        user.phone_key = phone_key(user.phone)
+        if user.phone_key:
+            batch.append(user)
+        if len(batch) >= 1000:
+            User.objects.bulk_update(batch, ['phone_key'])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ['phone_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('clients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=8),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='clients_user_email_lower_idx'),
+        ),
+        migrations.RunPython(fill_phone_key, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,13 @@
 from django.db import models
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser, BaseUserManager, Group, Permission
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 import datetime
 
-from .utils import normalize_phone
+from .utils import normalize_phone, phone_key
 
 
 # --- User Manager personalizado (login con email) ---
@@ -31,34 +33,35 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
-    def find_by_phone(self, phone):
+    def matching_identity(self, email=None, phone=None):
+        """
+        Usuarios con ese email (sin distinguir mayúsculas) o ese teléfono
+        (misma phone_key). Usa los índices de lower(email) y phone_key.
         """
-        Intenta encontrar un usuario por teléfono usando lógica difusa.
+        email = (email or "").strip().lower()
+        key = phone_key(phone)
+        condition = Q(pk__in=[])
+        if email:
+            condition |= Q(email_lower=email)
+        if key:
+            condition |= Q(phone_key=key)
+        return self.alias(email_lower=Lower("email")).filter(condition)
+
+    def find_by_identity(self, email=None, phone=None):
         """
-        if not phone:
-            return None
-            
-        # 1. Limpiar input
-        clean_phone = ''.join(filter(str.isdigit, phone))
-        
-        # 2. Intento exacto
-        user = self.filter(phone=clean_phone).first()
-        if user:
-            return user
-            
-        # 3. Si tiene 9 dígitos, probar agregando 56
-        if len(clean_phone) == 9:
-            user = self.filter(phone='56' + clean_phone).first()
-            if user:
-                return user
-                
-        # 4. Si tiene prefijo 56, probar quitándolo (caso raro pero posible)
-        if clean_phone.startswith('56') and len(clean_phone) > 9:
-             user = self.filter(phone=clean_phone[2:]).first()
-             if user:
-                 return user
-                 
-        return None
+        Resuelve un cliente por email y/o teléfono en una sola consulta
+        indexada; si ambos coinciden con usuarios distintos gana el email.
+        """
+        email = (email or "").strip().lower()
+        return (
+            self.matching_identity(email, phone)
+            .order_by(Case(When(email_lower=email, then=Value(0)), default=Value(1)), "id")
+            .first()
+        )
+
+    def find_by_phone(self, phone):
+        """Usuario por teléfono, en cualquier formato (ver phone_key)."""
+        return self.find_by_identity(phone=phone)
 
 
 # --- User principal del sistema ---
@@ -71,6 +74,8 @@ class User(AbstractUser):
     first_name = models.CharField(max_length=150)
     last_name = models.CharField(max_length=150, blank=True)
     phone = models.CharField(max_length=20)
+    # Últimos 8 dígitos del teléfono, para búsquedas indexadas (ver utils.phone_key)
+    phone_key = models.CharField(max_length=8, blank=True, default="", db_index=True, editable=False)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["first_name", "phone"]
@@ -92,10 +97,19 @@ class User(AbstractUser):
 
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(Lower("email"), name="clients_user_email_lower_idx"),
+        ]
+
     def save(self, *args, **kwargs):
         # Normalizar teléfono
         if self.phone:
             self.phone = normalize_phone(self.phone)
+        self.phone_key = phone_key(self.phone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_key"}
         super().save(*args, **kwargs)
 
     def __str__(self):
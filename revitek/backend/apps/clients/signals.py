@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.conditional import bump_data_version
+from .models import Commune, Region
+
+# Versión de datos de las lecturas de comunas (ETag de CommuneViewSet)
+COMMUNES_VERSION = "communes"
+
+
+@receiver(post_save, sender=Commune)
+@receiver(post_delete, sender=Commune)
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+def bump_communes_version(sender, **kwargs):
+    """Cada comuna se serializa con su región anidada."""
+    bump_data_version(COMMUNES_VERSION)
@@ -17,3 +17,19 @@ def normalize_phone(phone):
         clean_phone = '56' + clean_phone
         
     return clean_phone
+
+
+# Dígitos que identifican un teléfono (número nacional sin prefijo: 9 8614 2813 -> 86142813)
+PHONE_KEY_DIGITS = 8
+
+
+def phone_key(phone):
+    """
+    Clave canónica para buscar por teléfono: los últimos 8 dígitos.
+    "+56 9 8614 2813", "986142813" y "86142813" -> "86142813".
+    Vacía si el número tiene menos dígitos.
+    """
+    clean_phone = ''.join(filter(str.isdigit, str(phone or "")))
+    if len(clean_phone) < PHONE_KEY_DIGITS:
+        return ""
+    return clean_phone[-PHONE_KEY_DIGITS:]
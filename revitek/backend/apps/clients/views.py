@@ -4,7 +4,9 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView
 
+from core.conditional import ConditionalReadMixin
 from .models import User, Region, Commune, Vehicle, Address
+from .signals import COMMUNES_VERSION
 from .serializers import (
     UserSerializer,
     RegionSerializer,
@@ -14,16 +16,18 @@ from .serializers import (
 )
 
 
-class RegionViewSet(viewsets.ReadOnlyModelViewSet):
+class RegionViewSet(ConditionalReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Region.objects.all().order_by("number")
     serializer_class = RegionSerializer
     permission_classes = [AllowAny]
+    etag_versions = (COMMUNES_VERSION,)
 
 
-class CommuneViewSet(viewsets.ReadOnlyModelViewSet):
+class CommuneViewSet(ConditionalReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Commune.objects.all().order_by("name")
     serializer_class = CommuneSerializer
     permission_classes = [AllowAny]
+    etag_versions = (COMMUNES_VERSION,)
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -53,10 +57,10 @@ class UserViewSet(viewsets.ModelViewSet):
         if not email and not phone:
             return Response({"error": "Email or phone required"}, status=400)
 
-        user = None
+        # El email manda; el teléfono solo se usa si no viene email
         if email:
-            user = User.objects.filter(email__iexact=email).first()
-        elif phone:
+            user = User.objects.find_by_identity(email=email)
+        else:
             user = User.objects.find_by_phone(phone)
 
         if not user:
@@ -91,6 +91,13 @@ class BotMessages:
         "Por favor, intenta con otra fecha escribiendo 'Menu' y seleccionando nuevamente."
     )
 
+    DATE_NO_SLOTS_NEXT = (
+        "😔 *Lo sentimos*\n\n"
+        "No hay horarios disponibles para el {date}.\n\n"
+        "📅 El próximo día con horarios es el *{next_date}* (desde las {next_time}).\n\n"
+        "Escribe 'Menu' para elegir esa u otra fecha."
+    )
+
     # Time Selection
     TIME_SLOTS_HEADER = (
         "🕒 *Horarios Disponibles*\n"
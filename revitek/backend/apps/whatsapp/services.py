@@ -551,11 +551,31 @@ class ChatBot:
         available_slots = compute_aggregated_availability([service_id], date_str)
         
         if not available_slots:
-            self.client.send_text(phone, BotMessages.DATE_NO_SLOTS.format(date=date_obj.strftime('%d/%m/%Y')))
+            # Buscar en una sola consulta el próximo día con horarios
+            from datetime import timedelta
+            from apps.agenda.services import compute_availability_range, get_horizon_target
+            next_days, _ = compute_availability_range(
+                [service_id],
+                date_obj + timedelta(days=1),
+                max(date_obj + timedelta(days=1), get_horizon_target()),
+                limit=1,
+            )
+            next_open = next((day for day in next_days if day["slots"]), None)
+            if next_open:
+                self.client.send_text(phone, BotMessages.DATE_NO_SLOTS_NEXT.format(
+                    date=date_obj.strftime('%d/%m/%Y'),
+                    next_date=next_open["date"].strftime('%d/%m/%Y'),
+                    next_time=next_open["slots"][0]["inicio"].strftime("%H:%M"),
+                ))
+            else:
+                self.client.send_text(phone, BotMessages.DATE_NO_SLOTS.format(date=date_obj.strftime('%d/%m/%Y')))
             return
 
-        # Almacenar slots disponibles en sesión para validación en el siguiente paso
-        # Almacenamos una lista simplificada: [{'start': '09:00', 'end': '10:00', 'label': '09:00 AM'}]
+        # Almacenar slots disponibles en sesión para validación en el siguiente paso.
+        # Cada opción guarda la cadena ya encontrada: inicio exacto y, ordenados por
+        # carga, los profesionales con su slot inicial (None en modo virtual), para
+        # que finalize_booking la reclame sin volver a buscarla.
+        # [{'start': '09:00', 'label': '09:00 AM', 'start_at': ISO, 'professionals': [..], 'slot_ids': [..]}]
         slots_data = []
         msg = BotMessages.TIME_SLOTS_HEADER.format(date=date_obj.strftime('%d/%m/%Y'))
 
@@ -568,7 +588,10 @@ class ChatBot:
             
             slots_data.append({
                 'start': start_str,
-                'label': label
+                'label': label,
+                'start_at': start_dt.isoformat(),
+                'professionals': slot['professionals'],
+                'slot_ids': slot['slot_ids'],
             })
             
             msg += f"{i}️⃣  {label}\n"
@@ -601,8 +624,9 @@ class ChatBot:
                 # Enviar confirmación de que estamos procesando
                 self.client.send_text(session.phone_number, BotMessages.TIME_SELECTED.format(time_label=selected_label))
                 
-                # Guardar hora
+                # Guardar hora y la cadena elegida (profesionales y slots)
                 session.data['time'] = selected_time
+                session.data['selected_slot'] = selected_slot
                 session.save()
 
                 # Verificar si el usuario existe para decidir el siguiente paso
@@ -625,29 +649,10 @@ class ChatBot:
 
     def find_user_by_phone(self, phone_number):
         from apps.clients.models import User
-        
-        # Normalizar teléfono entrante: eliminar no dígitos
-        raw_phone = ''.join(filter(str.isdigit, phone_number))
-        
-        # Heurística: Coincidir últimos 8 dígitos (estándar chileno sin prefijo +569 son 8 dígitos)
-        # Esto maneja:
-        # +56 9 8614 2813 -> 86142813
-        # 9 8614 2813 -> 86142813
-        # 8614 2813 -> 86142813
-        
-        if len(raw_phone) < 8:
-            return None
-            
-        search_suffix = raw_phone[-8:]
-        
-        if len(raw_phone) < 8:
-            return None
-            
-        search_suffix = raw_phone[-8:]
-        
-        # Búsqueda optimizada: Consulta directa a BD usando endswith
-        # Dado que normalizamos teléfonos al guardar, esto es confiable
-        return User.objects.filter(phone__endswith=search_suffix).first()
+
+        # Coincide por los últimos 8 dígitos (phone_key, indexada):
+        # +56 9 8614 2813 / 9 8614 2813 / 8614 2813 -> 86142813
+        return User.objects.find_by_phone(phone_number)
 
     def handle_email_input(self, session, text):
         from apps.clients.models import User
@@ -749,8 +754,20 @@ class ChatBot:
             'commune': selected_commune
         }
 
+    def _ranked_candidates(self, selected_slot, time_str, durations):
+        """
+        [(professional_id, slot_id inicial o None), ...] en el orden de carga
+        que dio la disponibilidad, solo con quienes aún hacen el servicio.
+        Sesiones antiguas (sin la cadena guardada) prueban a todos por hora.
+        """
+        if selected_slot and selected_slot.get('start') == time_str and 'professionals' in selected_slot:
+            pairs = zip(selected_slot['professionals'], selected_slot['slot_ids'])
+        else:
+            pairs = ((prof_id, None) for prof_id in sorted(durations))
+        return [(prof_id, slot_id) for prof_id, slot_id in pairs if prof_id in durations]
+
     def finalize_booking(self, session, time_str):
-        from apps.agenda.models import Reservation, Slot, ReservationService, Professional
+        from apps.agenda.models import Reservation, ReservationService, Professional
         from apps.clients.models import User, Address
         from apps.catalog.models import Service
         from datetime import datetime, time
@@ -795,87 +812,24 @@ class ChatBot:
             self.client.send_text(session.phone_number, "⚠️ Error en el formato de fecha/hora.")
             return
 
-        # Buscar slots DISPONIBLES para este servicio a esta hora
-        # Necesitamos un profesional que realice este servicio
-        # Y tenga suficientes slots consecutivos para cubrir la duración
-        
-        # Find professionals for this service
-        professionals = Professional.objects.filter(services__service=service, active=True)
-        
-        target_slots = []
-        selected_pro = None
-        
-        # Calculate how many 60-min slots we need (assuming slots are 60 min for now)
-        # Ideally we should check slot duration dynamically, but for MVP we assume 1 hour blocks.
-        # If service is 120 min, we need 2 slots.
-        # We need to find slots covering start_time to end_time
-        
-        from datetime import timedelta
-        duration_min = service.duration_min
-        end_time = start_time + timedelta(minutes=duration_min)
-        
-        for pro in professionals:
-            # Find all available slots for this pro on this day
-            # We need slots that start >= start_time and end <= end_time
-            # and form a continuous block
-            
-            # Simple approach: Check if we can find a slot for each hour segment
-            # This assumes slots are perfectly aligned with hours (e.g. 15:00-16:00, 16:00-17:00)
-            
-            required_slots = []
-            current_check_time = start_time
-            is_pro_available = True
-            
-            while current_check_time < end_time:
-                # Look for a slot starting at current_check_time
-                slot = Slot.objects.filter(
-                    professional=pro,
-                    start=current_check_time,
-                    status='AVAILABLE'
-                ).first()
-                
-                if not slot:
-                    is_pro_available = False
-                    break
-                
-                required_slots.append(slot)
-                current_check_time = slot.end # Move to end of this slot
-            
-            if is_pro_available and required_slots:
-                # Double check total duration covered
-                total_covered = sum([(s.end - s.start).total_seconds() / 60 for s in required_slots])
-                if total_covered >= duration_min:
-                    target_slots = required_slots
-                    selected_pro = pro
-                    break
-        
-        if not target_slots:
-            self.client.send_text(session.phone_number, (
-                "😔 *Lo sentimos mucho*\n\n"
-                "No tenemos disponibilidad suficiente para el servicio que seleccionaste en ese horario específico.\n\n"
-                "*¿Qué puedes hacer?*\n"
-                "• Escribe 'Menu' para elegir otra fecha u horario\n"
-                "• Contacta a un ejecutivo (opción 3 del menú principal)\n\n"
-                "_Disculpa las molestias. Estamos trabajando para ampliar nuestra disponibilidad._ 🙏"
-            ))
-            return
+        # Reclamar la cadena guardada en la sesión (send_time_slots) con el mismo
+        # núcleo de reserva que create_reservation_transaction; si otro la tomó,
+        # probar con el siguiente profesional del ranking.
+        from django.db import transaction
+        from rest_framework.exceptions import ValidationError
+        from apps.agenda import skills
+        from apps.agenda.services import attach_slot_chain, claim_slot_chain, resolve_chain_start
+
+        # Duraciones desde la BD (no el índice en memoria): se va a reservar
+        durations = {
+            prof_id: by_service[service.id]
+            for prof_id, by_service in skills.load_matrix(service_ids=[service.id]).items()
+        }
+        candidates = self._ranked_candidates(session.data.get('selected_slot'), time_str, durations)
 
-        # 4. Create Reservation
+        # Parse Address (se crea junto con la reserva)
         raw_address = session.data.get('address', 'Dirección no especificada')
-        
-        # Parse and Create Address
         parsed_addr = self._parse_address(raw_address)
-        
-        address_obj, _ = Address.objects.update_or_create(
-            owner=user,
-            defaults={
-                'street': parsed_addr['street'],
-                'number': parsed_addr['number'],
-                'complement': parsed_addr['complement'],
-                'commune': parsed_addr['commune'],
-                'alias': "Casa (WhatsApp)" # Default alias
-            }
-        )
 
         # Format address for note and message
         formatted_address = f"{parsed_addr['street']} #{parsed_addr['number']}"
@@ -885,34 +839,61 @@ class ChatBot:
 
         note = f"Reserva creada vía WhatsApp Bot. Dirección: {formatted_address}"
 
-        reservation = Reservation.objects.create(
-            client=user,
-            status='CONFIRMED', # Auto-confirm for WhatsApp
-            total_min=service.duration_min,
-            note=note,
-            address=address_obj
-        )
-        
-        # Link Service
-        ReservationService.objects.create(
-            reservation=reservation,
-            service=service,
-            professional=selected_pro,
-            effective_duration_min=service.duration_min
-        )
-        
-        # Update Slots and Link
-        from apps.agenda.models import ReservationSlot
-        
-        for slot in target_slots:
-            slot.status = 'RESERVED'
-            slot.save()
-            
-            ReservationSlot.objects.create(
-                reservation=reservation,
-                slot=slot,
-                professional=selected_pro
-            )
+        reservation = None
+        for prof_id, slot_id in candidates:
+            duration_min = durations[prof_id]
+            try:
+                with transaction.atomic():
+                    chain_start = resolve_chain_start(prof_id, duration_min, slot_id=slot_id, start=start_time)
+                    if chain_start != start_time:
+                        continue
+                    target_slots = claim_slot_chain(prof_id, chain_start, duration_min)
+
+                    # 4. Create Reservation
+                    address_obj, _ = Address.objects.update_or_create(
+                        owner=user,
+                        defaults={
+                            'street': parsed_addr['street'],
+                            'number': parsed_addr['number'],
+                            'complement': parsed_addr['complement'],
+                            'commune': parsed_addr['commune'],
+                            'alias': "Casa (WhatsApp)" # Default alias
+                        }
+                    )
+                    reservation = Reservation.objects.create(
+                        client=user,
+                        status='CONFIRMED', # Auto-confirm for WhatsApp
+                        total_min=duration_min,
+                        note=note,
+                        address=address_obj
+                    )
+
+                    # Link Service
+                    ReservationService.objects.create(
+                        reservation=reservation,
+                        service=service,
+                        professional_id=prof_id,
+                        effective_duration_min=duration_min
+                    )
+
+                    # Link Slots (ya RESERVED) y actualizar mapas de bits, caché y cargas
+                    attach_slot_chain(reservation, prof_id, target_slots)
+                break
+            except ValidationError:
+                logger.info("WhatsApp: cadena de %s a las %s ya no está libre, probando el siguiente", prof_id, start_time)
+
+        if reservation is None:
+            self.client.send_text(session.phone_number, (
+                "😔 *Lo sentimos mucho*\n\n"
+                "No tenemos disponibilidad suficiente para el servicio que seleccionaste en ese horario específico.\n\n"
+                "*¿Qué puedes hacer?*\n"
+                "• Escribe 'Menu' para elegir otra fecha u horario\n"
+                "• Contacta a un ejecutivo (opción 3 del menú principal)\n\n"
+                "_Disculpa las molestias. Estamos trabajando para ampliar nuestra disponibilidad._ 🙏"
+            ))
+            return
+
+        selected_pro = Professional.objects.get(pk=prof_id)
 
         # Format professional confirmation message
         price_fmt = "{:,.0f}".format(service.price).replace(',', '.')
@@ -921,7 +902,7 @@ class ChatBot:
             client_name=user.first_name or user.email.split('@')[0],
             service_name=service.name,
             price=price_fmt,
-            duration=service.duration_min,
+            duration=duration_min,
             date=date_str,
             time=time_str,
             pro_name=selected_pro.first_name,
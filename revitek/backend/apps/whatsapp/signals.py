@@ -9,7 +9,13 @@ def send_confirmation_whatsapp(sender, instance, created, **kwargs):
     Disparado cuando se crea una nueva Reserva.
     Envía una plantilla de WhatsApp con botones de Confirmar/Cancelar.
     """
-    if created and instance.client and instance.client.phone:
+    if created:
+        send_confirmation_template(instance)
+
+
+def send_confirmation_template(instance):
+    """Plantilla "reservation_confirmation" al teléfono del cliente de la reserva."""
+    if instance.client and instance.client.phone:
         client = MetaClient()
         
         # Nombre de Plantilla: "reservation_confirmation" (Debe ser creada en Meta Dashboard)
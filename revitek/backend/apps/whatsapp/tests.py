@@ -0,0 +1,68 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from apps.agenda.models import Reservation, Slot
+from apps.agenda.tests import AgendaDataMixin, local_dt
+from apps.clients.models import Commune, Region, User
+from apps.whatsapp.models import WhatsAppSession
+from apps.whatsapp.services import ChatBot
+
+
+@override_settings(AGENDA_AVAILABILITY_MODE="materialized")
+class LegacySessionBookingTests(AgendaDataMixin, TestCase):
+    """
+    Sesiones guardadas antes de que el bot recordara la cadena elegida
+    (sin selected_slot): se reserva por hora, probando a cada profesional.
+    """
+
+    PHONE = "+56986142813"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_agenda(slot_days=1)
+        region = Region.objects.create(name="Metropolitana", roman_number="XIII", number=13)
+        Commune.objects.create(name="Providencia", region=region)
+        User.objects.create(email="bot@x.cl", phone=cls.PHONE)
+
+    def setUp(self):
+        super().setUp()
+        # Sin llamadas a Meta ni notificaciones de la reserva creada
+        for target in ("apps.whatsapp.services.MetaClient",
+                       "apps.whatsapp.signals.send_confirmation_template",
+                       "apps.agenda.signals.send_client_confirmation"):
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def book(self, day, time_str):
+        session = WhatsAppSession.objects.create(
+            phone_number=self.PHONE,
+            state="WAITING_FOR_TIME",
+            data={
+                "service_id": self.s60.id,
+                "date": day.strftime("%d/%m/%Y"),
+                "address": "Av. Providencia 100, Providencia",
+            },
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            ChatBot().finalize_booking(session, time_str)
+        return Reservation.objects.filter(client__email="bot@x.cl").first()
+
+    def test_books_an_existing_slot(self):
+        reservation = self.book(self.monday, "10:00")
+        self.assertIsNotNone(reservation)
+        slot = reservation.reservation_slots.get().slot
+        self.assertEqual(slot.start, local_dt(self.monday, 10))
+        self.assertEqual(slot.status, "RESERVED")
+
+    def test_does_not_create_slots_the_materializer_never_produced(self):
+        # Martes: fuera del horizonte materializado (slot_days=1)
+        tuesday = self.monday + timedelta(days=1)
+        self.assertIsNone(self.book(tuesday, "10:00"))
+        self.assertFalse(Slot.objects.filter(date=tuesday).exists())
+
+    def test_does_not_book_inside_a_break(self):
+        self.assertIsNone(self.book(self.monday, "13:00"))
+        self.assertFalse(Slot.objects.filter(start=local_dt(self.monday, 13)).exists())
@@ -0,0 +1,113 @@
+"""
+GET condicionales con ETag fuerte derivado de versiones de datos.
+
+Cada lectura arma su ETag a partir de versiones guardadas en la BD
+(apps.agenda.models.DataVersion, una consulta por lectura, sin tocar las
+tablas que sirve). Están en la BD y no en la caché para que todos los
+workers vean el mismo valor: con una caché local al proceso un worker
+respondería 304 después de que otro cambiara los datos. Si el cliente manda
+If-None-Match con ese ETag, se responde 304 antes de cargar o serializar
+nada.
+
+Las versiones se suben con bump_data_version() desde las señales de los
+modelos que alimentan cada respuesta.
+"""
+import hashlib
+import uuid
+
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def data_versions(names) -> dict:
+    """{name: versión} en una consulta; las que nunca cambiaron valen ""."""
+    from apps.agenda.models import DataVersion
+
+    names = list(names)
+    found = dict(DataVersion.objects.filter(name__in=names).values_list("name", "version"))
+    return {name: found.get(name, "") for name in names}
+
+
+def data_version(name):
+    """Versión actual de `name`."""
+    return data_versions([name])[name]
+
+
+def _bump(names):
+    from apps.agenda.models import DataVersion
+
+    # Un valor nuevo por cambio (no un contador): el upsert no necesita leer la fila
+    DataVersion.objects.bulk_create(
+        [DataVersion(name=name, version=uuid.uuid4().hex) for name in sorted(set(names))],
+        update_conflicts=True,
+        unique_fields=["name"],
+        update_fields=["version", "updated_at"],
+    )
+
+
+def bump_data_version(*names):
+    """Sube las versiones al confirmar la transacción en curso."""
+    if names:
+        transaction.on_commit(lambda: _bump(names))
+
+
+def make_etag(*parts) -> str:
+    """ETag fuerte a partir de cualquier combinación de valores (dicts se ordenan)."""
+    normalized = [sorted(part.items()) if isinstance(part, dict) else part for part in parts]
+    return quote_etag(hashlib.sha1(repr(normalized).encode()).hexdigest())
+
+
+def etag_matches(request, etag) -> bool:
+    """True si el If-None-Match del request incluye `etag` (o es '*')."""
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header or request.method not in ("GET", "HEAD"):
+        return False
+    # If-None-Match usa comparación débil (RFC 9110 13.1.2)
+    candidates = {value.removeprefix("W/") for value in parse_etags(header)}
+    return "*" in candidates or etag in candidates
+
+
+def not_modified(etag) -> Response:
+    return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+
+def with_etag(response, etag):
+    """Agrega ETag y obliga al cliente a revalidar en cada lectura (etag None: sin cambios)."""
+    if etag is None:
+        return response
+    if response.status_code == status.HTTP_200_OK:
+        response["ETag"] = etag
+        response["Cache-Control"] = "no-cache"
+    elif response.status_code == status.HTTP_304_NOT_MODIFIED:
+        response["ETag"] = etag
+    return response
+
+
+class ConditionalReadMixin:
+    """
+    Para ViewSets: list/retrieve responden 304 si el ETag coincide.
+    El ETag combina las versiones de `etag_versions`, la URL completa y si
+    el usuario es staff (puede ver datos distintos).
+    """
+    etag_versions = ()
+
+    def get_etag(self, request):
+        return make_etag(
+            data_versions(self.etag_versions),
+            request.get_full_path(),
+            bool(request.user and request.user.is_staff),
+        )
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        return with_etag(handler(request, *args, **kwargs), etag)
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
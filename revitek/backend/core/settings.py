@@ -85,6 +85,7 @@ CORS_ALLOWED_ORIGINS = os.environ.get('CORS_ALLOWED_ORIGINS', 'http://localhost:
 
 CORS_ALLOW_HEADERS = list(default_headers) + [
     "authorization",
+    "idempotency-key",
 ]
 
 CORS_ALLOW_METHODS = list(default_methods)
@@ -193,6 +194,47 @@ WHATSAPP_ACCESS_TOKEN = os.environ.get("WHATSAPP_ACCESS_TOKEN", "")
 WHATSAPP_PHONE_NUMBER_ID = os.environ.get("WHATSAPP_PHONE_NUMBER_ID", "")
 WHATSAPP_VERIFY_TOKEN = os.environ.get("WHATSAPP_VERIFY_TOKEN", "revitek_secret_token")
 
+# -------------------------------------------------------------------
+# AGENDA
+# -------------------------------------------------------------------
+# "materialized": disponibilidad desde slots AVAILABLE generados en BD.
+# "virtual": disponibilidad calculada desde horarios y reservas; solo se
+# crean filas Slot para el tiempo reservado.
+AGENDA_AVAILABILITY_MODE = os.environ.get("AGENDA_AVAILABILITY_MODE", "materialized")
+
+# Días hacia adelante que se mantienen materializados
+SLOT_HORIZON_DAYS = int(os.environ.get("SLOT_HORIZON_DAYS", 30))
+
+# Índices en memoria del proceso (matriz de habilidades, reglas horarias):
+# segundos que vive cada copia (0 = apagados, cada consulta lee de la BD solo
+# los servicios que pide). Se invalidan con versiones en la caché
+# INDEX_CACHE_ALIAS, que debe ser compartida entre workers (check agenda.E002). Las reservas siempre validan contra la BD.
+AGENDA_PROCESS_INDEX_TTL_SECONDS = int(os.environ.get("AGENDA_PROCESS_INDEX_TTL_SECONDS", 0))
+AGENDA_PROCESS_INDEX_CACHE_ALIAS = os.environ.get("AGENDA_PROCESS_INDEX_CACHE_ALIAS", "default")
+
+# Caché de disponibilidad agregada (alias de CACHES, segundos; 0 = desactivada).
+# Solo con un backend compartido entre workers (Redis, Memcached): con
+# LocMemCache el check agenda.E001 impide activarla.
+# Con STALE_SECONDS > 0 se sirve un resultado invalidado mientras se recalcula.
+AGENDA_AVAILABILITY_CACHE_ALIAS = os.environ.get("AGENDA_AVAILABILITY_CACHE_ALIAS", "default")
+AGENDA_AVAILABILITY_CACHE_TIMEOUT = int(os.environ.get("AGENDA_AVAILABILITY_CACHE_TIMEOUT", 0))
+AGENDA_AVAILABILITY_STALE_SECONDS = int(os.environ.get("AGENDA_AVAILABILITY_STALE_SECONDS", 0))
+# Cálculos idénticos simultáneos esperan a uno solo (single-flight); con
+# CACHE_LOCK también entre workers. WAIT_SECONDS: máximo a esperar al líder.
+AGENDA_SINGLEFLIGHT_CACHE_LOCK = os.environ.get("AGENDA_SINGLEFLIGHT_CACHE_LOCK", "False") == "True"
+AGENDA_SINGLEFLIGHT_WAIT_SECONDS = float(os.environ.get("AGENDA_SINGLEFLIGHT_WAIT_SECONDS", 10))
+# Reserva de slots: "pessimistic" (SELECT ... FOR UPDATE) u "optimistic"
+# (UPDATE condicionado, reintenta ante conflicto hasta OPTIMISTIC_RETRIES veces)
+AGENDA_BOOKING_STRATEGY = os.environ.get("AGENDA_BOOKING_STRATEGY", "pessimistic")
+AGENDA_BOOKING_OPTIMISTIC_RETRIES = int(os.environ.get("AGENDA_BOOKING_OPTIMISTIC_RETRIES", 3))
+# Retención de slots durante el checkout (POST /agenda/holds/): segundos
+# antes de que `release_expired_holds` los devuelva a AVAILABLE
+AGENDA_SLOT_HOLD_TTL_SECONDS = int(os.environ.get("AGENDA_SLOT_HOLD_TTL_SECONDS", 300))
+# Idempotency-Key en POST de reservas/cancelaciones: horas que se guarda la
+# respuesta y segundos que un duplicado espera al primer pedido en curso
+AGENDA_IDEMPOTENCY_TTL_HOURS = int(os.environ.get("AGENDA_IDEMPOTENCY_TTL_HOURS", 24))
+AGENDA_IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("AGENDA_IDEMPOTENCY_WAIT_SECONDS", 10))
+
 # reCAPTCHA Configuration
 RECAPTCHA_SECRET_KEY = os.environ.get('RECAPTCHA_SECRET_KEY', '')
 